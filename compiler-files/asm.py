@@ -0,0 +1,91 @@
+import re
+
+# Structured assembly: a routine is a list of Instruction and Label objects
+# instead of text, so later stages can match on mnemonics and operands without
+# re-parsing lines. str() gives back the Intel syntax line.
+
+REGISTERS = frozenset(('eax', 'ebx', 'ecx', 'edx', 'esi', 'edi', 'ebp', 'esp'))
+IMMEDIATE = re.compile(r'-?\d+')
+
+
+class Instruction:
+    __slots__ = ('mnemonic', 'operands')
+
+    def __init__(self, mnemonic, operands=()):
+        self.mnemonic = mnemonic
+        self.operands = list(operands)
+
+    def __eq__(self, other):
+        return isinstance(other, Instruction) and self.mnemonic == other.mnemonic and self.operands == other.operands
+
+    def __hash__(self):
+        return hash((self.mnemonic, tuple(self.operands)))
+
+    def __str__(self):
+        if not self.operands:
+            return self.mnemonic
+        return f"{self.mnemonic} {', '.join(self.operands)}"
+
+    def __repr__(self):
+        return f"Instruction({self.mnemonic!r}, {self.operands!r})"
+
+
+class Label:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, Label) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __str__(self):
+        return f"{self.name}:"
+
+    def __repr__(self):
+        return f"Label({self.name!r})"
+
+
+def parse_line(line):
+    if line.endswith(':'):
+        return Label(line[:-1])
+    mnemonic, _, rest = line.partition(' ')
+    return Instruction(mnemonic, rest.split(', ') if rest else [])
+
+
+def parse_lines(lines):
+    return [parse_line(line) for line in lines]
+
+
+def quoted_ascii(text):
+    # A GNU as string operand for the UTF-8 bytes of text
+    escaped = []
+    for byte in text.encode('utf-8'):
+        if byte in (ord('"'), ord('\\')) or not 32 <= byte < 127:
+            escaped.append(f"\\{byte:03o}")
+        else:
+            escaped.append(chr(byte))
+    return f'"{"".join(escaped)}"'
+
+
+def is_register(operand):
+    return operand in REGISTERS
+
+
+def is_memory(operand):
+    return '[' in operand
+
+
+def is_immediate(operand):
+    return IMMEDIATE.fullmatch(operand) is not None
+
+
+def is_jump(item):
+    return isinstance(item, Instruction) and item.mnemonic.startswith('j')
+
+
+def is_conditional_jump(item):
+    return is_jump(item) and item.mnemonic != 'jmp'
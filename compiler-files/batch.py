@@ -0,0 +1,121 @@
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import CompilationCache
+from driver import compile_source
+from emitter import AssemblyWriter
+from lexer import LineIndex, map_source
+from passes import default_pass_manager
+from peephole import PeepholeOptimizer
+
+# File suffixes picked up when a directory is given on the command line
+SOURCE_SUFFIXES = ('.py', '.txt')
+
+
+class FileResult:
+    # What a worker sends back for one file. Only plain data crosses the
+    # process boundary; tokens and AST stay in the worker.
+    def __init__(self, path, lines, success, errors, assembly, failure=None, cached=False):
+        self.path = path
+        self.lines = lines
+        self.success = success
+        self.errors = errors  # Syntax error messages
+        self.assembly = assembly
+        self.failure = failure  # Set when the compiler itself raised on this file
+        self.cached = cached
+
+
+def collect_sources(patterns):
+    # Expand files, directories and glob patterns, keeping argument order and
+    # dropping duplicates. Directory and glob matches are sorted so the same
+    # arguments always give the same file order.
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = []
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                matches.extend(os.path.join(root, name) for name in files if name.endswith(SOURCE_SUFFIXES))
+            matches.sort()
+        elif glob.has_magic(pattern):
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        else:
+            matches = [pattern]
+        for path in matches:
+            key = os.path.normpath(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths
+
+
+def compile_file(path, engine='regex', cache_dir=None, pipeline=None, peephole_disabled=()):
+    try:
+        code = map_source(path)
+    except OSError as error:
+        return FileResult(path, 0, False, [], [], failure=f"cannot read: {error.strerror}")
+    lines = LineIndex(code).line_count()
+    try:
+        cache = CompilationCache(cache_dir) if cache_dir else None
+        # Workers rebuild the pass pipeline and peephole rules from their names
+        passes = default_pass_manager(pipeline=pipeline)
+        peephole = PeepholeOptimizer(peephole_disabled)
+        result = compile_source(code, engine, cache=cache, passes=passes, peephole=peephole)
+    except Exception as error:
+        # One bad file must not take the whole batch down
+        return FileResult(path, lines, False, [], [], failure=f"{type(error).__name__}: {error}")
+    errors = [str(error) for error in result.errors]
+    return FileResult(path, lines, result.success, errors, result.assembly, cached=result.cached)
+
+
+def compile_task(task):
+    return compile_file(*task)
+
+
+def compile_batch(paths, jobs=None, engine='regex', cache_dir=None, pipeline=None, peephole_disabled=()):
+    # Yields a FileResult per path, in the order of paths
+    tasks = [(path, engine, cache_dir, pipeline, peephole_disabled) for path in paths]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) < 2:
+        for task in tasks:
+            yield compile_task(task)
+        return
+    # Small chunks keep the workers balanced when file sizes vary
+    chunksize = max(1, len(tasks) // (jobs * 8))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(compile_task, tasks, chunksize=chunksize)
+
+
+def run_batch(patterns, jobs=None, engine='regex', cache_dir=None, out=None, err=None, pipeline=None,
+              peephole_disabled=()):
+    # Compile every source and print its assembly and diagnostics in input
+    # order. Returns the number of files that failed.
+    out = out or sys.stdout
+    err = err or sys.stderr
+    paths = collect_sources(patterns)
+    start = time.perf_counter()
+    failed = 0
+    lines = 0
+    writer = AssemblyWriter(out)
+    for result in compile_batch(paths, jobs, engine, cache_dir, pipeline, peephole_disabled):
+        lines += result.lines
+        if result.failure is not None:
+            failed += 1
+            print(f"{result.path}: error: {result.failure}", file=err)
+        elif not result.success:
+            failed += 1
+            for message in result.errors:
+                print(f"{result.path}: {message}", file=err)
+        else:
+            writer.write_lines([f"; {result.path}"])
+            writer.write_function(result.assembly)
+    writer.flush()
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    print(f"{len(paths)} files ({failed} failed), {lines} lines in {elapsed:.3f}s: "
+          f"{len(paths) / elapsed:,.1f} files/sec, {lines / elapsed:,.0f} lines/sec", file=err)
+    return failed
@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from lexer import LexicalAnalyzer, ENGINES, source_buffer
+from syntax import Parser, walk
+from generator import CodeGenerator
+from asm import Instruction
+from ir import Lowering
+from workloads import SHAPES, generate_program
+from interpreter import TreeInterpreter
+from vm import VirtualMachine, load_program
+from closures import compile_closures
+
+def bench_lexer(code, engine, repeat):
+    analyzer = LexicalAnalyzer(engine)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = 0
+        for _token in analyzer.scan(source_buffer(code)):
+            count += 1
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count, best
+
+def run_tree(program, stream):
+    TreeInterpreter(stream).run(program)
+
+def run_vm(program, stream):
+    VirtualMachine(stream).run(program)
+
+def run_closures(program, stream):
+    program(stream)
+
+# Ways to run a parsed program, timed by --execute: (name, what it does to the
+# AST first, how it runs the result)
+EXECUTION_ENGINES = (
+    ('tree', lambda ast: ast, run_tree),
+    ('vm', load_program, run_vm),
+    ('closure', compile_closures, run_closures),
+)
+
+def bench_execution(ast, prepare, run, repeat):
+    # Best times to prepare the program and to run it, output discarded
+    best_prepare = best_run = None
+    with open(os.devnull, 'w') as stream:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            program = prepare(ast)
+            middle = time.perf_counter()
+            run(program, stream)
+            end = time.perf_counter()
+            if best_run is None or end - middle < best_run:
+                best_prepare, best_run = middle - start, end - middle
+    return best_prepare, best_run
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def peak_memory(function):
+    # Most memory the function had allocated at once, in bytes. Measured in a
+    # run of its own, since tracing allocations slows everything down.
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def count_ir_instructions(ast):
+    # Code generation's work, counted in the IR it starts from, since the
+    # passes fold most of a straight-line program with known values away and
+    # leave few instructions to emit
+    module = Lowering().lower_program(ast)
+    return sum(len(block.instructions) + 1 for function in module.all_functions() for block in function.blocks)
+
+def bench_phases(code, repeat):
+    # Throughput and peak memory of lexing, parsing and code generation, each
+    # timed on the output of the phase before it
+    tokens = LexicalAnalyzer().tokenize_stream(code)
+    ast, success = Parser(tokens).parse()
+    if not success:
+        raise ValueError("the generated program does not parse")
+
+    def lex():
+        return LexicalAnalyzer().tokenize_stream(code)
+
+    def parse():
+        return Parser(tokens).parse()
+
+    def generate():
+        generator = CodeGenerator()
+        generator.generate_assembly(ast)
+        return generator.assembly_code
+
+    phases = (('lex', lex, 'tokens', len(tokens)),
+              ('parse', parse, 'nodes', sum(1 for _node in walk(ast))),
+              ('codegen', generate, 'IR instrs', count_ir_instructions(ast)))
+    results = {}
+    for phase, function, unit, items in phases:
+        seconds = best_time(function, repeat)
+        results[phase] = {'unit': unit, 'items': items, 'seconds': seconds,
+                          'per_second': items / seconds, 'peak_bytes': peak_memory(function)}
+    assembly = generate()
+    results['codegen']['assembly_lines'] = len(assembly)
+    results['codegen']['instructions'] = sum(1 for item in assembly if isinstance(item, Instruction))
+    return results
+
+def run_suite(shapes, size, seed, repeat):
+    report = {'size': size, 'seed': seed, 'repeat': repeat, 'python': platform.python_version(), 'workloads': {}}
+    for shape in shapes:
+        code = generate_program(shape, size, seed)
+        results = bench_phases(code, repeat)
+        report['workloads'][shape] = {'chars': len(code), 'phases': results}
+        for phase, result in results.items():
+            print(f"{shape:>11} {phase:<8} {result['items']:>9} {result['unit']:<12} {result['seconds']:8.4f}s "
+                  f"{result['per_second']:>14,.0f}/s  peak {result['peak_bytes'] / 1048576:8.2f} MiB")
+    return report
+
+def compare_reports(baseline, report, threshold):
+    # Lines describing every phase whose throughput dropped or whose peak
+    # memory grew by more than threshold, a fraction
+    regressions = []
+    for shape, workload in report['workloads'].items():
+        old_workload = baseline['workloads'].get(shape)
+        if old_workload is None:
+            continue
+        for phase, result in workload['phases'].items():
+            old = old_workload['phases'].get(phase)
+            if old is None:
+                continue
+            speed = result['per_second'] / old['per_second']
+            memory = result['peak_bytes'] / old['peak_bytes'] if old['peak_bytes'] else 1.0
+            flagged = speed < 1 - threshold or memory > 1 + threshold
+            line = f"{shape:>11} {phase:<8} speed {speed - 1:+7.1%}  peak memory {memory - 1:+7.1%}"
+            print(line + ("  REGRESSION" if flagged else ""))
+            if flagged:
+                regressions.append(line)
+    return regressions
+
+def suite_main(args, parser):
+    shapes = [shape for shape in args.shapes.split(',') if shape] if args.shapes else list(SHAPES)
+    for shape in shapes:
+        if shape not in SHAPES:
+            parser.error(f"unknown shape {shape!r} (expected one of {', '.join(SHAPES)})")
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if (baseline['size'], baseline['seed']) != (args.size, args.seed):
+            parser.error(f"{args.compare} was measured with --size {baseline['size']} --seed {baseline['seed']}")
+
+    report = run_suite(shapes, args.size, args.seed, args.repeat)
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(report, file, indent=2)
+    if baseline is not None:
+        print(f"Compared with {args.compare}:")
+        regressions = compare_reports(baseline, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure lexer throughput for each scanner engine, execution speed for each execution engine, or the compiler's phases on generated programs")
+    parser.add_argument('file', nargs='?', default='test.py', help="source file to lex or run")
+    parser.add_argument('--copies', type=int, help="concatenate the file this many times (default: 1000, or 1 with --execute)")
+    parser.add_argument('--execute', action='store_true',
+                        help="run the program on the tree-walking interpreter, the bytecode VM and the closure compiler instead of lexing it")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per engine or phase; the best run is reported")
+    parser.add_argument('--suite', action='store_true',
+                        help="time lexing, parsing and code generation on generated programs instead of using a file")
+    parser.add_argument('--shapes', help=f"comma-separated program shapes for --suite ({', '.join(SHAPES)}; default: all)")
+    parser.add_argument('--size', type=int, default=500, help="statements per generated program (default: 500)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the program generator (default: 0)")
+    parser.add_argument('--save', metavar='FILE', help="write the --suite results to FILE as JSON")
+    parser.add_argument('--compare', metavar='FILE',
+                        help="compare the --suite results with a baseline saved by --save and exit with status 1 on a regression")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="slowdown or memory growth that counts as a regression, as a fraction (default: 0.10)")
+    args = parser.parse_args()
+
+    if args.suite:
+        suite_main(args, parser)
+        return
+
+    with open(args.file, 'r') as file:
+        code = file.read()
+    if not code.endswith('\n'):
+        code += '\n'
+    copies = args.copies if args.copies is not None else (1 if args.execute else 1000)
+    code = code * copies
+
+    if args.execute:
+        ast, success = Parser(LexicalAnalyzer().tokenize_stream(code)).parse()
+        if not success:
+            parser.error(f"{args.file} does not parse")
+        baseline = None
+        for name, prepare, run in EXECUTION_ENGINES:
+            prepared, elapsed = bench_execution(ast, prepare, run, args.repeat)
+            baseline = baseline or elapsed
+            print(f"{name:>7}: run {elapsed:.4f}s ({baseline / elapsed:.2f}x), compile {prepared:.4f}s")
+        return
+
+    print(f"{len(code)} chars")
+    for engine in ENGINES:
+        count, elapsed = bench_lexer(code, engine, args.repeat)
+        print(f"{engine:>6}: {count} tokens in {elapsed:.4f}s, {len(code) / elapsed:,.0f} chars/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+from array import array
+
+from syntax import *
+from ir import AUGMENTED_OPERATORS, string_value
+from resolver import AssignedNames
+
+# Compact bytecode for running programs in process on the VM in vm.py.
+#
+# Every instruction is two ints in an array('i'): an opcode and one operand,
+# which is 0 when the opcode takes none. Jump operands are absolute offsets
+# into the same array. Each routine has its own constant pool and numbered
+# slots. A function's slots are its parameters followed by its other locals;
+# the top-level code's slots are the globals, which functions read with
+# LOAD_GLOBAL. A function never writes a global, since any name it assigns is
+# one of its locals.
+#
+# Values are Python ints, floats, strings, booleans and lists, and operators
+# behave as in Python, so a program prints what exec would print.
+
+OPCODE_NAMES = (
+    'LOAD_LOCAL', 'LOAD_CONST', 'STORE_LOCAL', 'LOAD_GLOBAL',
+    'ADD', 'SUB', 'MUL', 'DIV', 'MOD', 'POW', 'NEG',
+    'LT', 'GT', 'LE', 'GE', 'EQ', 'NE',
+    'JUMP', 'JUMP_IF_FALSE', 'JUMP_IF_TRUE', 'FOR_ITER', 'GET_ITER', 'RANGE',
+    'CALL', 'RETURN', 'PRINT', 'BUILD_LIST',
+)
+
+(LOAD_LOCAL, LOAD_CONST, STORE_LOCAL, LOAD_GLOBAL,
+ ADD, SUB, MUL, DIV, MOD, POW, NEG,
+ LT, GT, LE, GE, EQ, NE,
+ JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, FOR_ITER, GET_ITER, RANGE,
+ CALL, RETURN, PRINT, BUILD_LIST) = range(len(OPCODE_NAMES))
+
+BINARY_OPCODES = {
+    '+': ADD, '-': SUB, '*': MUL, '/': DIV, '%': MOD, '**': POW,
+    '<': LT, '>': GT, '<=': LE, '>=': GE, '==': EQ, '!=': NE,
+}
+# Opcodes whose operand is a jump target
+JUMP_OPCODES = frozenset((JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, FOR_ITER))
+
+
+class CodeObject:
+    def __init__(self, name, parameters=()):
+        self.name = name
+        self.parameters = list(parameters)
+        self.code = array('i')
+        self.constants = []
+        self.constant_index = {}
+        self.slots = {name: index for index, name in enumerate(self.parameters)}
+        self.quickened = None  # What the VM runs, made from code on first use
+
+    def slot(self, name):
+        index = self.slots.get(name)
+        if index is None:
+            index = self.slots[name] = len(self.slots)
+        return index
+
+    def constant(self, value):
+        # True, 1 and 1.0 compare equal but print differently, so the type is
+        # part of the key
+        key = (type(value), value)
+        index = self.constant_index.get(key)
+        if index is None:
+            index = self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def disassemble(self):
+        names = {index: name for name, index in self.slots.items()}
+        lines = [f"{self.name or '<toplevel>'}:"]
+        for offset in range(0, len(self.code), 2):
+            opcode, operand = self.code[offset], self.code[offset + 1]
+            text = f"{offset:6} {OPCODE_NAMES[opcode]:<14}"
+            if opcode == LOAD_CONST:
+                text += f"{operand} ({self.constants[operand]!r})"
+            elif opcode in (LOAD_LOCAL, STORE_LOCAL):
+                text += f"{operand} ({names[operand]})"
+            elif opcode in JUMP_OPCODES or opcode in (LOAD_GLOBAL, CALL, PRINT, BUILD_LIST, RANGE):
+                text += str(operand)
+            lines.append(text.rstrip())
+        return lines
+
+
+class Program:
+    def __init__(self, main, functions):
+        self.main = main  # Top-level code; its slots are the globals
+        self.functions = functions  # CALL operand -> CodeObject
+
+    def disassemble(self):
+        lines = []
+        for function in self.functions + [self.main]:
+            lines.extend(function.disassemble())
+        return lines
+
+
+class BytecodeCompiler(NodeVisitor):
+    def __init__(self):
+        self.routine = None
+        self.globals = None
+        self.local_names = ()
+        self.function_index = {}  # Function name -> CALL operand
+        self.parameter_counts = {}
+        self.functions = []
+
+    def compile_program(self, node):
+        # A later definition of the same name replaces an earlier one, as in
+        # Python when both run before the call
+        self.globals = CodeObject(None)
+        self.function_index = {}
+        self.parameter_counts = {}
+        for function in node.functions:
+            self.function_index.setdefault(function.name, len(self.function_index))
+            self.parameter_counts[function.name] = len(function.parameters)
+        self.functions = [None] * len(self.function_index)
+        for function in node.functions:
+            self.functions[self.function_index[function.name]] = self.compile_function(function)
+
+        self.routine = self.globals
+        self.local_names = ()
+        self.compile_block(node.statements)
+        self.emit(LOAD_CONST, self.routine.constant(None))
+        self.emit(RETURN)
+        return Program(self.globals, self.functions)
+
+    def compile_function(self, function):
+        assigned = AssignedNames()
+        for statement in function.body:
+            if statement is not None:
+                assigned.visit(statement)
+        self.routine = CodeObject(function.name, function.parameters)
+        self.local_names = set(assigned.names) | set(function.parameters)
+        for name in assigned.names:
+            self.routine.slot(name)
+        self.compile_block(function.body)
+        self.emit(LOAD_CONST, self.routine.constant(None))
+        self.emit(RETURN)
+        return self.routine
+
+    def emit(self, opcode, operand=0):
+        self.routine.code.append(opcode)
+        self.routine.code.append(operand)
+        return len(self.routine.code) - 1  # Where the operand goes, for patching jumps
+
+    def here(self):
+        return len(self.routine.code)
+
+    def patch(self, position, target=None):
+        self.routine.code[position] = self.here() if target is None else target
+
+    def compile_block(self, statements):
+        for statement in statements:
+            if statement is not None:
+                self.visit(statement)
+
+    def load(self, name):
+        if name in self.local_names or self.routine is self.globals:
+            self.emit(LOAD_LOCAL, self.routine.slot(name))
+        else:
+            self.emit(LOAD_GLOBAL, self.globals.slot(name))
+
+    def store(self, name):
+        self.emit(STORE_LOCAL, self.routine.slot(name))
+
+    def generic_visit(self, node):
+        raise ValueError(f"Line {node.line}: {type(node).__name__} is not supported by the bytecode compiler")
+
+    def visit_AssignmentNode(self, node):
+        self.visit(node.expression)
+        self.store(node.identifier.name)
+
+    def visit_AugmentedAssignmentNode(self, node):
+        self.load(node.identifier.name)
+        self.visit(node.expression)
+        self.emit(BINARY_OPCODES[AUGMENTED_OPERATORS[node.operator]])
+        self.store(node.identifier.name)
+
+    def visit_PrintNode(self, node):
+        for parameter in node.parameters:
+            self.visit(parameter)
+        self.emit(PRINT, len(node.parameters))
+
+    def visit_ReturnNode(self, node):
+        if node.value is None:
+            self.emit(LOAD_CONST, self.routine.constant(None))
+        else:
+            self.visit(node.value)
+        self.emit(RETURN)
+
+    def visit_IfNode(self, node):
+        end_jumps = []
+        self.visit(node.condition)
+        next_test = self.emit(JUMP_IF_FALSE)
+        self.compile_block(node.block)
+        if node.elif_condition is not None:
+            end_jumps.append(self.emit(JUMP))
+            self.patch(next_test)
+            self.visit(node.elif_condition)
+            next_test = self.emit(JUMP_IF_FALSE)
+            self.compile_block(node.elif_block)
+        if node.else_block:
+            end_jumps.append(self.emit(JUMP))
+            self.patch(next_test)
+            self.compile_block(node.else_block)
+        else:
+            self.patch(next_test)
+        for position in end_jumps:
+            self.patch(position)
+
+    def visit_WhileNode(self, node):
+        # The test sits after the body, so each iteration takes one jump
+        to_test = self.emit(JUMP)
+        body = self.here()
+        self.compile_block(node.block)
+        self.patch(to_test)
+        self.visit(node.condition)
+        self.emit(JUMP_IF_TRUE, body)
+
+    def visit_ForNode(self, node):
+        self.visit(node.collection)
+        self.emit(GET_ITER)
+        top = self.here()
+        exit_jump = self.emit(FOR_ITER)
+        self.store(node.variable.name)
+        self.compile_block(node.block)
+        self.emit(JUMP, top)
+        self.patch(exit_jump)
+
+    def visit_RangeNode(self, node):
+        arguments = [argument for argument in (node.start, node.stop, node.step) if argument is not None]
+        for argument in arguments:
+            self.visit(argument)
+        self.emit(RANGE, len(arguments))
+
+    def visit_NumberNode(self, node):
+        self.emit(LOAD_CONST, self.routine.constant(int(node.value)))
+
+    def visit_FloatNode(self, node):
+        self.emit(LOAD_CONST, self.routine.constant(float(node.value)))
+
+    def visit_StringNode(self, node):
+        self.emit(LOAD_CONST, self.routine.constant(string_value(node.value)))
+
+    def visit_BooleanNode(self, node):
+        self.emit(LOAD_CONST, self.routine.constant(node.value))
+
+    def visit_IdentifierNode(self, node):
+        self.load(node.name)
+
+    def visit_ListNode(self, node):
+        for element in node.elements:
+            self.visit(element)
+        self.emit(BUILD_LIST, len(node.elements))
+
+    def visit_UnaryOpNode(self, node):
+        self.visit(node.operand)
+        if node.operator == '-':
+            self.emit(NEG)
+
+    def visit_BinaryOpNode(self, node):
+        # Iterative down the left operands, like Lowering.visit_BinaryOpNode
+        chain = []
+        while isinstance(node, BinaryOpNode):
+            chain.append(node)
+            node = node.left
+        self.visit(node)
+        for operation in reversed(chain):
+            self.visit(operation.right)
+            self.emit(BINARY_OPCODES[operation.operator])
+
+    def visit_FunctionCallNode(self, node):
+        index = self.function_index.get(node.function_name)
+        if index is None:
+            raise ValueError(f"Line {node.line}: call to undefined function {node.function_name!r}")
+        expected = self.parameter_counts[node.function_name]
+        if len(node.arguments) != expected:
+            raise ValueError(f"Line {node.line}: {node.function_name}() takes {expected} arguments but {len(node.arguments)} were given")
+        for argument in node.arguments:
+            self.visit(argument)
+        self.emit(CALL, index)
+
+
+def compile_program(ast):
+    return BytecodeCompiler().compile_program(ast)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Content-addressed cache for compiled sources. An entry is keyed by a hash of
+# the source, the compiler's own code and the options it ran with, and holds a
+# pickled compile result (token stream, AST, errors and assembly). Entries are
+# written to a temporary file and renamed into place, so concurrent builds never
+# see a partial entry. A hit refreshes the entry's mtime; when the directory
+# grows past max_bytes the least recently used entries are removed.
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+ENTRY_SUFFIX = '.entry'
+
+_fingerprint = None
+
+
+def compiler_modules(directory):
+    # Every module of the package. Hashing them all means a new module, or one
+    # that starts to affect the output, can never be left out of the key.
+    return sorted(name for name in os.listdir(directory) if name.endswith('.py'))
+
+
+def compiler_fingerprint():
+    # Hash of the compiler sources, so editing the compiler invalidates old entries
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in compiler_modules(directory):
+            digest.update(name.encode('utf-8') + b'\0')
+            with open(os.path.join(directory, name), 'rb') as file:
+                digest.update(file.read())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+class CompilationCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, code, options=()):
+        digest = hashlib.sha256()
+        digest.update(compiler_fingerprint().encode('ascii'))
+        digest.update(repr(tuple(options)).encode('utf-8'))
+        digest.update(code.encode('utf-8') if isinstance(code, str) else code)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                entry = pickle.load(file)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Written by an incompatible compiler; drop it and recompile
+            self.discard(path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # Evicted by another build after we read it
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        try:
+            data = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            return False  # AST too deep to pickle; it is simply not cached
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            self.discard(temp_path)
+            raise
+        self.evict()
+        return True
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if not item.name.endswith(ENTRY_SUFFIX):
+                    continue
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, item.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.discard(path)
+            total -= size
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.name.endswith(ENTRY_SUFFIX):
+                    self.discard(item.path)
@@ -0,0 +1,318 @@
+from syntax import *
+from ir import AUGMENTED_OPERATORS
+from resolver import AssignedNames
+from bytecode import string_value
+from interpreter import BINARY_OPERATIONS
+
+# Closure compilation: every AST node is turned once into a Python closure, and
+# running the program is calling them. Names are resolved to slot indexes in a
+# frame list ahead of time, and operands that are locals or constants are
+# bound into the closure of their operator, so running does no dispatch on node
+# types and no name lookups.
+#
+# Expression closures take the frame and return a value. Statement closures
+# take the frame and return None, except that statements containing a return
+# hand back a (value,) tuple once it has run; only the blocks that contain a
+# return pay for checking. Values and operators follow Python, like the VM.
+# The program is compiled once and can be run any number of times, each time
+# printing to the stream passed in. Source-level calls are Python calls,
+# several frames deep each, so deep recursion reaches Python's recursion limit
+# sooner than under exec.
+
+
+def contains_return(statements):
+    pending = list(statements)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, ReturnNode):
+            return True
+        if isinstance(node, IfNode):
+            pending.extend(node.block)
+            pending.extend(node.elif_block or ())
+            pending.extend(node.else_block or ())
+        elif isinstance(node, (WhileNode, ForNode)):
+            pending.extend(node.block)
+    return False
+
+
+class ClosureCompiler(NodeVisitor):
+    def __init__(self):
+        self.output = [None]  # Where print writes for the run in progress; None means sys.stdout
+        self.slots = None  # Name -> slot in the frame of the routine being compiled
+        self.global_slots = {}
+        self.in_function = False
+        self.globals = []  # The top-level frame, shared with every function
+        self.bodies = {}  # Function name -> [closure running its body, FunctionDefNode]
+
+    def compile_program(self, node):
+        self.global_slots = {}
+        self.bodies = {function.name: [None, function] for function in node.functions}
+        for function in node.functions:
+            self.bodies[function.name][0] = self.compile_function(function)
+        self.in_function = False
+        self.slots = self.global_slots
+        main = self.block(node.statements)
+        globals_ = self.globals
+        size = len(self.global_slots)
+
+        output = self.output
+
+        def run(stream=None):
+            output[0] = stream
+            globals_[:] = [None] * size
+            main(globals_)
+        return run
+
+    def compile_function(self, function):
+        assigned = AssignedNames()
+        for statement in function.body:
+            if statement is not None:
+                assigned.visit(statement)
+        self.in_function = True
+        self.slots = {name: index for index, name in enumerate(function.parameters)}
+        for name in assigned.names:
+            self.slots.setdefault(name, len(self.slots))
+        body = self.block(function.body)
+        padding = [None] * (len(self.slots) - len(function.parameters))
+
+        def run(arguments):
+            arguments.extend(padding)
+            result = body(arguments)
+            return None if result is None else result[0]
+        return run
+
+    def slot(self, name):
+        index = self.slots.get(name)
+        if index is None:
+            index = self.slots[name] = len(self.slots)
+        return index
+
+    def is_local(self, name):
+        return not self.in_function or name in self.slots
+
+    def block(self, statements):
+        # One closure running a list of statements
+        closures = [self.visit(statement) for statement in statements if statement is not None]
+        if contains_return(statements):
+            def run_returning(frame):
+                for closure in closures:
+                    result = closure(frame)
+                    if result is not None:
+                        return result
+            return run_returning
+        if len(closures) == 1:
+            return closures[0]
+
+        def run(frame):
+            for closure in closures:
+                closure(frame)
+        return run
+
+    def generic_visit(self, node):
+        raise ValueError(f"Line {node.line}: {type(node).__name__} is not supported by the closure compiler")
+
+    # Statements
+
+    def visit_AssignmentNode(self, node):
+        target = self.slot(node.identifier.name)
+        expression = node.expression
+        if isinstance(expression, BinaryOpNode):
+            # Fuse the common x = y op constant and x = y op z
+            left, right = expression.left, expression.right
+            function = BINARY_OPERATIONS[expression.operator]
+            if isinstance(left, IdentifierNode) and self.is_local(left.name):
+                source = self.slot(left.name)
+                if isinstance(right, NumberNode):
+                    value = int(right.value)
+
+                    def assign_local_constant(frame):
+                        frame[target] = function(frame[source], value)
+                    return assign_local_constant
+                if isinstance(right, IdentifierNode) and self.is_local(right.name):
+                    other = self.slot(right.name)
+
+                    def assign_locals(frame):
+                        frame[target] = function(frame[source], frame[other])
+                    return assign_locals
+        value = self.visit(expression)
+
+        def assign(frame):
+            frame[target] = value(frame)
+        return assign
+
+    def visit_AugmentedAssignmentNode(self, node):
+        target = self.slot(node.identifier.name)
+        function = BINARY_OPERATIONS[AUGMENTED_OPERATORS[node.operator]]
+        if isinstance(node.expression, NumberNode):
+            constant = int(node.expression.value)
+
+            def update_constant(frame):
+                frame[target] = function(frame[target], constant)
+            return update_constant
+        value = self.visit(node.expression)
+
+        def update(frame):
+            frame[target] = function(frame[target], value(frame))
+        return update
+
+    def visit_PrintNode(self, node):
+        values = [self.visit(parameter) for parameter in node.parameters]
+        output = self.output
+        if len(values) == 1:
+            value = values[0]
+
+            def print_one(frame):
+                print(value(frame), file=output[0])
+            return print_one
+
+        def print_values(frame):
+            print(*[value(frame) for value in values], file=output[0])
+        return print_values
+
+    def visit_ReturnNode(self, node):
+        if node.value is None:
+            return lambda frame: (None,)
+        value = self.visit(node.value)
+        return lambda frame: (value(frame),)
+
+    def visit_IfNode(self, node):
+        branches = [(self.visit(node.condition), self.block(node.block))]
+        if node.elif_condition is not None:
+            branches.append((self.visit(node.elif_condition), self.block(node.elif_block)))
+        otherwise = self.block(node.else_block) if node.else_block else None
+        if len(branches) == 1:
+            condition, then = branches[0]
+            if otherwise is None:
+                def run_if(frame):
+                    if condition(frame):
+                        return then(frame)
+                return run_if
+
+            def run_if_else(frame):
+                if condition(frame):
+                    return then(frame)
+                return otherwise(frame)
+            return run_if_else
+
+        def run_branches(frame):
+            for condition, then in branches:
+                if condition(frame):
+                    return then(frame)
+            if otherwise is not None:
+                return otherwise(frame)
+        return run_branches
+
+    def visit_WhileNode(self, node):
+        condition = self.visit(node.condition)
+        body = self.block(node.block)
+        if contains_return(node.block):
+            def run_while_returning(frame):
+                while condition(frame):
+                    result = body(frame)
+                    if result is not None:
+                        return result
+            return run_while_returning
+
+        def run_while(frame):
+            while condition(frame):
+                body(frame)
+        return run_while
+
+    def visit_ForNode(self, node):
+        collection = self.visit(node.collection)
+        target = self.slot(node.variable.name)
+        body = self.block(node.block)
+        if contains_return(node.block):
+            def run_for_returning(frame):
+                for value in collection(frame):
+                    frame[target] = value
+                    result = body(frame)
+                    if result is not None:
+                        return result
+            return run_for_returning
+
+        def run_for(frame):
+            for value in collection(frame):
+                frame[target] = value
+                body(frame)
+        return run_for
+
+    # Expressions
+
+    def visit_RangeNode(self, node):
+        arguments = [self.visit(argument) for argument in (node.start, node.stop, node.step) if argument is not None]
+        return lambda frame: range(*[argument(frame) for argument in arguments])
+
+    def constant(self, value):
+        return lambda frame: value
+
+    def visit_NumberNode(self, node):
+        return self.constant(int(node.value))
+
+    def visit_FloatNode(self, node):
+        return self.constant(float(node.value))
+
+    def visit_StringNode(self, node):
+        return self.constant(string_value(node.value))
+
+    def visit_BooleanNode(self, node):
+        return self.constant(node.value)
+
+    def visit_ListNode(self, node):
+        elements = [self.visit(element) for element in node.elements]
+        return lambda frame: [element(frame) for element in elements]
+
+    def visit_IdentifierNode(self, node):
+        if self.is_local(node.name):
+            index = self.slot(node.name)
+            return lambda frame: frame[index]
+        index = self.global_slots.get(node.name)
+        if index is None:
+            index = self.global_slots[node.name] = len(self.global_slots)
+        globals_ = self.globals
+        return lambda frame: globals_[index]
+
+    def visit_UnaryOpNode(self, node):
+        operand = self.visit(node.operand)
+        if node.operator != '-':
+            return operand
+        return lambda frame: -operand(frame)
+
+    def visit_BinaryOpNode(self, node):
+        # Iterative down the left operands, like Lowering.visit_BinaryOpNode
+        chain = []
+        while isinstance(node, BinaryOpNode):
+            chain.append(node)
+            node = node.left
+        result = self.visit(node)
+        for operation in reversed(chain):
+            result = self.binary(operation.operator, result, operation.right)
+        return result
+
+    def binary(self, operator, left, right_node):
+        function = BINARY_OPERATIONS[operator]
+        if isinstance(right_node, NumberNode):
+            value = int(right_node.value)
+            return lambda frame: function(left(frame), value)
+        right = self.visit(right_node)
+        return lambda frame: function(left(frame), right(frame))
+
+    def visit_FunctionCallNode(self, node):
+        entry = self.bodies.get(node.function_name)
+        if entry is None:
+            raise ValueError(f"Line {node.line}: call to undefined function {node.function_name!r}")
+        expected = len(entry[1].parameters)
+        if len(node.arguments) != expected:
+            raise ValueError(f"Line {node.line}: {node.function_name}() takes {expected} arguments but {len(node.arguments)} were given")
+        arguments = [self.visit(argument) for argument in node.arguments]
+
+        def call(frame):
+            # The body is looked up when called, so functions can call
+            # themselves and ones defined after them
+            return entry[0]([argument(frame) for argument in arguments])
+        return call
+
+
+def compile_closures(ast):
+    # A function that runs the program, printing to its stream argument
+    return ClosureCompiler().compile_program(ast)
@@ -0,0 +1,239 @@
+from ir import Const, Instruction, COMPARISONS, Phi, dominators, place_phis, link_definitions
+
+# Constant folding, constant propagation and copy propagation over the IR.
+#
+# Arithmetic follows the machine: 32-bit two's complement that wraps on
+# overflow. Division rounds down and a remainder takes the sign of the divisor,
+# like Python's // and % and the code the backends emit around idiv. A
+# division that would fault at run time (by zero, or INT_MIN by -1) is left
+# alone.
+
+VARYING = object()  # Lattice value of something that is not a single known constant
+
+COMPARE = {
+    '<': lambda left, right: left < right,
+    '>': lambda left, right: left > right,
+    '<=': lambda left, right: left <= right,
+    '>=': lambda left, right: left >= right,
+    '==': lambda left, right: left == right,
+    '!=': lambda left, right: left != right,
+}
+
+
+def wrap(value):
+    value &= 0xFFFFFFFF
+    return value - 0x100000000 if value & 0x80000000 else value
+
+
+def evaluate(op, values):
+    # Result of op on known integer operands, or None if it cannot be computed
+    # at compile time
+    if op == 'copy':
+        return values[0]
+    if op == 'neg':
+        return wrap(-values[0])
+    if op == 'add':
+        return wrap(values[0] + values[1])
+    if op == 'sub':
+        return wrap(values[0] - values[1])
+    if op == 'mul':
+        return wrap(values[0] * values[1])
+    if op in ('div', 'mod'):
+        left, right = values
+        if right == 0 or (left == -0x80000000 and right == -1):
+            return None
+        return left // right if op == 'div' else left % right
+    if op in COMPARISONS:
+        return 1 if COMPARE[op](values[0], values[1]) else 0
+    return None
+
+
+def constant_value(value):
+    if isinstance(value, Const) and isinstance(value.value, int):
+        return value.value
+    return None
+
+
+def fold_instruction(instruction):
+    # The instruction rewritten for constant or trivial operands, or the
+    # instruction itself when nothing applies
+    op = instruction.op
+    values = [constant_value(arg) for arg in instruction.args]
+    if instruction.dest is not None and instruction.args and None not in values:
+        result = evaluate(op, values)
+        if result is not None:
+            if op == 'copy':
+                return instruction
+            return Instruction('copy', instruction.dest, [Const(result)])
+    if op in ('add', 'sub', 'mul') and len(values) == 2:
+        left, right = instruction.args
+        if values[1] == 0 and op != 'mul' or values[1] == 1 and op == 'mul':
+            return Instruction('copy', instruction.dest, [left])
+        if values[0] == 0 and op == 'add' or values[0] == 1 and op == 'mul':
+            return Instruction('copy', instruction.dest, [right])
+        if op == 'mul' and 0 in values:
+            return Instruction('copy', instruction.dest, [Const(0)])
+        if op == 'sub' and left is right:
+            return Instruction('copy', instruction.dest, [Const(0)])
+    return instruction
+
+
+def fold_terminator(terminator):
+    # A branch whose outcome is known becomes a jump to the side it takes
+    if terminator.op != 'branch':
+        return terminator
+    left, right = (constant_value(arg) for arg in terminator.args)
+    if left is None or right is None:
+        if terminator.args[0] is terminator.args[1] and not isinstance(terminator.args[0], Const):
+            taken = terminator.name in ('<=', '>=', '==')
+            return Instruction('jump', targets=(terminator.targets[0 if taken else 1],))
+        return terminator
+    taken = COMPARE[terminator.name](left, right)
+    return Instruction('jump', targets=(terminator.targets[0 if taken else 1],))
+
+
+def fold_constants(module):
+    # Evaluate instructions whose operands are all constants, simplify x + 0,
+    # x * 1 and the like, and turn branches on constants into jumps
+    for function in module.all_functions():
+        for block in function.blocks:
+            block.instructions = [fold_instruction(instruction) for instruction in block.instructions]
+            block.terminator = fold_terminator(block.terminator)
+
+
+def propagate_constants(module):
+    # Sparse conditional constant propagation (Wegman and Zadeck). Every
+    # definition, including a Phi where definitions meet, holds one lattice
+    # value: unknown yet (absent), a constant, or VARYING. Blocks become
+    # executable as the branch edges that can be taken are found, and a
+    # definition is revisited only when something it reads changes, so each
+    # instruction is evaluated a bounded number of times. Known values then
+    # replace their uses, and instructions and branches that become constant
+    # are folded.
+    for function in module.all_functions():
+        idom = dominators(function)
+        phis = place_phis(function, idom)
+        reaching, readers = link_definitions(function, idom, phis)
+        values = {}
+        executable = set()
+        edges = set()
+        flow = [(None, function.blocks[0])]
+        changed = []
+
+        def lattice(arg, definition):
+            if isinstance(arg, Const):
+                known = constant_value(arg)
+                return VARYING if known is None else known
+            if arg is None:
+                return VARYING  # A string, float or list
+            return values.get(definition) if definition is not None else None
+
+        def update(definition, value):
+            if value is not None and values.get(definition) != value:
+                values[definition] = value
+                changed.append(definition)
+
+        def visit_phi(phi):
+            merged = None
+            for predecessor, definition in phi.operands.items():
+                if (predecessor, phi.block) not in edges or definition is None:
+                    continue
+                value = values.get(definition)
+                if value is None:
+                    continue
+                if merged is None:
+                    merged = value
+                elif merged != value:
+                    merged = VARYING
+                    break
+            update(phi, merged)
+
+        def visit_instruction(instruction):
+            operands = [lattice(arg, definition) for arg, definition in zip(instruction.args, reaching[instruction])]
+            if any(operand is VARYING for operand in operands) or not operands:
+                update(instruction, VARYING)
+            elif None not in operands:
+                result = evaluate(instruction.op, operands)
+                update(instruction, VARYING if result is None else result)
+
+        def visit_terminator(block):
+            terminator = block.terminator
+            targets = terminator.targets
+            if terminator.op == 'branch':
+                left, right = (lattice(arg, definition) for arg, definition in zip(terminator.args, reaching[terminator]))
+                if left is None or right is None:
+                    targets = ()  # Not known yet which way it goes
+                elif left is not VARYING and right is not VARYING:
+                    targets = (targets[0 if COMPARE[terminator.name](left, right) else 1],)
+            for target in targets:
+                if (block, target) not in edges:
+                    flow.append((block, target))
+
+        while flow or changed:
+            if flow:
+                predecessor, block = flow.pop()
+                if (predecessor, block) in edges:
+                    continue
+                edges.add((predecessor, block))
+                for phi in phis[block]:
+                    visit_phi(phi)
+                if block in executable:
+                    continue
+                executable.add(block)
+                for instruction in block.instructions:
+                    if instruction.dest is not None:
+                        visit_instruction(instruction)
+                visit_terminator(block)
+                continue
+            for block, reader in readers.get(changed.pop(), ()):
+                if block not in executable:
+                    continue
+                if isinstance(reader, Phi):
+                    visit_phi(reader)
+                elif reader is block.terminator:
+                    visit_terminator(block)
+                elif reader.dest is not None:
+                    visit_instruction(reader)
+
+        # Blocks never reached keep their code; simplify-cfg removes them once
+        # the branches into them are gone
+        for block in function.blocks:
+            if block not in executable:
+                continue
+            rewritten = []
+            for instruction in block.instructions:
+                substitute(instruction, reaching[instruction], values)
+                rewritten.append(fold_instruction(instruction))
+            block.instructions = rewritten
+            substitute(block.terminator, reaching[block.terminator], values)
+            block.terminator = fold_terminator(block.terminator)
+
+
+def substitute(instruction, definitions, values):
+    args = []
+    for arg, definition in zip(instruction.args, definitions):
+        known = values.get(definition) if definition is not None else None
+        args.append(Const(known) if known is not None and known is not VARYING else arg)
+    instruction.args = args
+
+
+def propagate_copies(module):
+    # Within each block, read the source of a copy instead of its result for
+    # as long as neither is written again, so the copy itself becomes dead
+    for function in module.all_functions():
+        for block in function.blocks:
+            copies = {}  # Result -> source
+            readers = {}  # Source -> results currently copied from it
+            for instruction in block.instructions + [block.terminator]:
+                instruction.args = [copies.get(arg, arg) if arg is not None else arg for arg in instruction.args]
+                dest = instruction.dest
+                if dest is None:
+                    continue
+                if dest in copies:
+                    readers[copies.pop(dest)].discard(dest)
+                for result in readers.pop(dest, ()):
+                    del copies[result]
+                source = instruction.args[0] if instruction.op == 'copy' else None
+                if source is not None and not isinstance(source, Const) and source is not dest:
+                    copies[dest] = source
+                    readers.setdefault(source, set()).add(dest)
@@ -0,0 +1,114 @@
+from ir import Const, Phi, SIDE_EFFECTS, dominators, link_definitions, place_phis
+
+# Dead code elimination over the IR: instructions whose result is never read,
+# and functions nothing can call.
+
+# Functions kept even when no code calls them, besides the top-level code
+ENTRY_POINTS = ('main',)
+
+
+def has_side_effects(instruction):
+    if instruction.op in SIDE_EFFECTS:
+        return True
+    if instruction.op in ('div', 'mod'):
+        # Division by zero traps, so only a known non-zero divisor can go
+        divisor = instruction.args[1]
+        return not (isinstance(divisor, Const) and divisor.value not in (0, -1))
+    return False
+
+
+def block_uses(block):
+    # Values the block reads before writing them, and values it writes
+    used = set()
+    written = set()
+    for instruction in block.instructions + [block.terminator]:
+        for arg in instruction.args:
+            if arg is not None and not isinstance(arg, Const) and arg not in written:
+                used.add(arg)
+        if instruction.dest is not None:
+            written.add(instruction.dest)
+    return used, written
+
+
+def liveness(function):
+    # Values live at the start and at the end of each reachable block, by
+    # backward dataflow. A worklist revisits a block only when the live-in set
+    # of one of its successors has grown.
+    blocks = function.reverse_postorder()
+    predecessors = function.predecessors()
+    summaries = {block: block_uses(block) for block in blocks}
+    live_in = {block: set() for block in blocks}
+    outgoing = {block: set() for block in blocks}
+    # Popped from the end, so the blocks nearest the exits go first
+    pending = list(blocks)
+    queued = set(blocks)
+    while pending:
+        block = pending.pop()
+        queued.discard(block)
+        out = set()
+        for successor in block.successors():
+            out |= live_in[successor]
+        outgoing[block] = out
+        used, written = summaries[block]
+        incoming = used | (out - written)
+        if incoming != live_in[block]:
+            live_in[block] = incoming
+            for predecessor in predecessors[block]:
+                if predecessor in live_in and predecessor not in queued:
+                    queued.add(predecessor)
+                    pending.append(predecessor)
+    return live_in, outgoing
+
+
+def eliminate_dead_code(module):
+    # Drop instructions that write a value nobody reads and do nothing else,
+    # by mark and sweep: instructions with side effects and terminators are
+    # needed, so is every definition a needed instruction or Phi reads, and
+    # the rest goes. This removes dead stores to variables as well as unused
+    # temporaries and entry loads, chains of them and loop-carried values that
+    # only feed themselves, in time linear in the code. Unreachable blocks are
+    # left to simplify-cfg.
+    for function in module.all_functions():
+        idom = dominators(function)
+        reaching, _readers = link_definitions(function, idom, place_phis(function, idom))
+        needed = set()
+        pending = []
+        for block in idom:
+            for instruction in block.instructions + [block.terminator]:
+                if instruction.dest is None or has_side_effects(instruction):
+                    needed.add(instruction)
+                    pending.append(instruction)
+        while pending:
+            item = pending.pop()
+            definitions = item.operands.values() if isinstance(item, Phi) else reaching[item]
+            for definition in definitions:
+                if definition is not None and definition not in needed:
+                    needed.add(definition)
+                    pending.append(definition)
+        for block in idom:
+            block.instructions = [instruction for instruction in block.instructions if instruction in needed]
+
+
+def remove_unreachable_functions(module):
+    # Keep only the functions reachable in the call graph from the top-level
+    # code and the entry points. A fragment compiled on its own may be called
+    # from code that is not in the module, so only whole programs are pruned.
+    if not module.whole_program:
+        return
+    functions = {}
+    for function in module.functions:
+        functions.setdefault(function.name, []).append(function)
+    roots = [function for function in module.functions if function.name in ENTRY_POINTS]
+    if module.toplevel is not None:
+        roots.append(module.toplevel)
+    reachable = set()
+    pending = roots
+    while pending:
+        function = pending.pop()
+        if function in reachable:
+            continue
+        reachable.add(function)
+        for instruction in function.instructions():
+            if instruction.op == 'call':
+                pending.extend(functions.get(instruction.name, ()))
+    module.functions = [function for function in module.functions if function in reachable]
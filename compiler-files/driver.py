@@ -0,0 +1,97 @@
+from lexer import LexicalAnalyzer
+from syntax import Parser
+from generator import CodeGenerator
+from passes import default_pass_manager
+from peephole import PeepholeOptimizer
+from tracing import NO_TRACE
+from stats import phase
+from resolver import resolve_names
+
+
+class CompileResult:
+    def __init__(self, tokens, ast, success, errors, assembly):
+        self.tokens = tokens
+        self.ast = ast
+        self.success = success
+        self.errors = errors
+        self.error_heading = "Syntax Errors:"  # "Name Errors:" or "Compile Errors:" from later phases
+        self.assembly = assembly  # None when it was streamed to an AssemblyWriter
+        self.cached = False  # Set when the result was loaded from a CompilationCache
+        self.ir = None  # IRModule after the optimization passes; not kept in the cache
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['ir'] = None
+        return state
+
+    def print_errors(self):
+        if self.errors:
+            print(self.error_heading)
+            for error in self.errors:
+                print(str(error))
+        else:
+            print("No syntax errors found.")
+
+
+def compile_source(code, engine='regex', tracer=NO_TRACE, cache=None, passes=None, peephole=None, stats=None,
+                   output=None):
+    # Lex, parse and generate code for one source. With a cache, an unchanged
+    # source skips all three phases. passes is the PassManager to optimize
+    # with and peephole the PeepholeOptimizer; None means the defaults. A
+    # CompileStats given as stats collects timings and counts. Given an
+    # AssemblyWriter as output, the assembly is streamed to it function by
+    # function; with a cache it is still collected, since the cache keeps it.
+    if passes is None:
+        passes = default_pass_manager(tracer)
+    if peephole is None:
+        peephole = PeepholeOptimizer()
+    if cache is not None:
+        key = cache.key(code, (('engine', engine), ('passes', passes.pipeline()), ('peephole', peephole.enabled_rules())))
+        result = cache.get(key)
+        if result is not None:
+            result.cached = True
+            if stats is not None:
+                stats.cached = True
+            if output is not None and result.success:
+                output.write_function(result.assembly)
+            return result
+
+    with phase(stats, 'lex'):
+        tokens = LexicalAnalyzer(engine, tracer).tokenize_stream(code)
+    parser = Parser(tokens, tracer)
+    with phase(stats, 'parse'):
+        ast, success = parser.parse()
+    errors = parser.errors
+    heading = "Syntax Errors:"
+    if success:
+        # Undefined names are reported before any code is generated
+        with phase(stats, 'resolve'):
+            errors = resolve_names(ast)
+        success = not errors
+        heading = "Name Errors:"
+    assembly = []
+    if success:
+        generator = CodeGenerator(tracer, passes, peephole, stats, output if cache is None else None)
+        with phase(stats, 'codegen'):
+            generator.generate_assembly(ast)
+        assembly = generator.assembly_code if generator.output is None else None
+        if generator.errors:
+            # Constructs the backend cannot compile; no code was generated
+            errors = generator.errors
+            success = False
+            heading = "Compile Errors:"
+            assembly = []
+    if stats is not None:
+        stats.count_tokens(tokens)
+        stats.count_nodes(ast)
+        stats.add_pass_timings(passes)
+    result = CompileResult(tokens, ast, success, errors, assembly)
+    result.error_heading = heading
+    if success:
+        result.ir = generator.module
+
+    if cache is not None:
+        cache.put(key, result)
+        if output is not None and success:
+            output.write_function(assembly)
+    return result
@@ -0,0 +1,58 @@
+import io
+
+# Streaming output for generated assembly. A code generator hands each finished
+# routine to an AssemblyWriter, which turns it into text and writes it to a sink
+# in large batches, so the whole program's assembly never has to be kept and
+# there is no write per line.
+#
+# A sink is any file object: an open file, an io.BytesIO, a pipe or
+# sys.stdout. Binary sinks get UTF-8 bytes, text sinks get str.
+
+# Text collected before it is written to the sink
+BATCH_SIZE = 64 * 1024
+
+
+class AssemblyWriter:
+    def __init__(self, sink, flush_functions=False, batch_size=BATCH_SIZE):
+        self.sink = sink
+        self.binary = not isinstance(sink, io.TextIOBase)
+        self.flush_functions = flush_functions  # Flush the sink after every routine
+        self.batch_size = batch_size
+        self.pending = []
+        self.pending_size = 0
+        self.lines = 0
+        self.functions = 0
+
+    def write_lines(self, items):
+        # items are asm.Instruction and asm.Label objects or plain lines
+        if not items:
+            return
+        text = '\n'.join(map(str, items)) + '\n'
+        self.pending.append(text.encode('utf-8') if self.binary else text)
+        self.pending_size += len(text)
+        self.lines += len(items)
+        if self.pending_size >= self.batch_size:
+            self.write_pending()
+
+    def write_function(self, items):
+        self.write_lines(items)
+        self.functions += 1
+        if self.flush_functions:
+            self.flush()
+
+    def write_pending(self):
+        if self.pending:
+            self.sink.write((b'' if self.binary else '').join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def flush(self):
+        self.write_pending()
+        self.sink.flush()
+
+
+def write_assembly(items, sink):
+    # Write a whole list of lines in batches, e.g. assembly loaded from the cache
+    writer = AssemblyWriter(sink)
+    writer.write_lines(items)
+    writer.flush()
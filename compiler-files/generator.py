@@ -1,181 +1,349 @@
+import sys
+
 from syntax import *
+from tracing import NO_TRACE
+from ir import Lowering, Const, unrepresentable_values
+from passes import default_pass_manager
+from regalloc import allocate_registers
+from asm import Instruction, Label, parse_lines, quoted_ascii
+from peephole import PeepholeOptimizer
+from emitter import write_assembly
+
+# Instruction for each IR arithmetic operation that works in place on its left operand
+ARITHMETIC_INSTRUCTIONS = {'add': 'add', 'sub': 'sub', 'mul': 'imul'}
+COMMUTATIVE = ('add', 'mul')
+# Jump taken when a comparison holds, and when it does not
+JUMPS = {'>': 'jg', '<': 'jl', '>=': 'jge', '<=': 'jle', '==': 'je', '!=': 'jne'}
+INVERSE_JUMPS = {'>': 'jle', '<': 'jge', '>=': 'jl', '<=': 'jg', '==': 'jne', '!=': 'je'}
+# What an operand of each IR operation is used for, in errors about values the
+# backend cannot represent
+VALUE_USES = dict.fromkeys(('add', 'sub', 'mul', 'div', 'mod', 'neg'), 'arithmetic')
+VALUE_USES.update(dict.fromkeys(tuple(JUMPS) + ('branch',), 'a comparison'))
+VALUE_USES.update({'call': 'a call', 'return': 'return', 'print': 'print', 'len': 'a for loop', 'index': 'a for loop'})
+
+def jump_targets(function):
+    # Blocks that need a label: those reached other than by falling through
+    targets = set()
+    blocks = function.blocks
+    for index, block in enumerate(blocks):
+        following = blocks[index + 1] if index + 1 < len(blocks) else None
+        terminator = block.terminator
+        if terminator.op == 'branch' and terminator.targets[0] is following:
+            targets.add(terminator.targets[1])
+        elif terminator.op != 'return':
+            targets.update(target for target in terminator.targets if target is not following)
+            if terminator.op == 'branch':
+                targets.add(terminator.targets[0])
+    return [block for block in blocks if block in targets]
 
 class CodeGenerator:
-    def __init__(self):
-        self.registers = ["eax", "ebx", "ecx", "edx", "r5", "r6", "r7", "r8", "r9", "r10", "r11"]
-        self.in_use = []
+    # The AST is lowered to the three-address IR, the pass manager's passes run
+    # over it, and each IR function is then emitted one routine at a time with
+    # virtual registers (one per IR variable or temporary) that
+    # allocate_registers() maps onto real registers and stack slots. Given an
+    # emitter.AssemblyWriter as output, each routine is streamed to it as soon
+    # as it is finished instead of being kept in assembly_code.
+    #
+    # Output goes through two cdecl routines the runtime provides:
+    # print(value, text, length) writes the integer and then the length bytes
+    # at text, the end text print gives it, and print_text(text, length) writes
+    # the bytes alone. Each routine is followed by the strings it uses, in
+    # rodata.
+    def __init__(self, tracer=NO_TRACE, passes=None, peephole=None, stats=None, output=None):
+        self.trace = tracer
+        self.stats = stats  # CompileStats to record each routine in, or None
+        self.output = output
+        self.passes = passes if passes is not None else default_pass_manager(tracer)
+        self.peephole = peephole if peephole is not None else PeepholeOptimizer()
+        self.lowering = Lowering(tracer)
+        self.errors = []  # Why the last program or fragment has no code; see check_values()
+        self.unrepresentable = set()
+        self.register_counter = 0
         self.label_counter = 0
-        self.assembly_code = []
+        self.strings = {}  # Text -> its label, for the routine being emitted
+        self.assembly_code = []  # asm.Instruction and asm.Label objects; str() gives the line
+        self.module = None  # IR of the last program or fragment, after the passes
+        self.registers = {}
+        self.code = []
 
     def allocate(self):
-        for register in self.registers:
-            if register not in self.in_use:
-                self.in_use.append(register)
-                return register
-        raise RuntimeError("No available registers")
-    
-    def deallocate(self, remove_reg):
-        if remove_reg in self.in_use:
-            self.in_use.remove(remove_reg)
+        # A fresh virtual register; there is no limit on how many are live
+        self.register_counter += 1
+        return f"%{self.register_counter}"
 
     def generate_label(self):
         self.label_counter += 1
         return f"L{self.label_counter}"
 
     def generate_assembly(self, node):
-        if isinstance(node, ProgramNode):
-            for function in node.functions:
-                self.generate_assembly(function)
-            for statement in node.statements:
-                self.generate_assembly(statement)
-        elif isinstance(node, FunctionDefNode):
-            self.assembly_code.append(f"{node.name}:")
-            self.assembly_code.append("push ebp")
-            self.assembly_code.append("mov ebp, esp")
-            for statement in node.body:
-                self.generate_assembly(statement)
-            self.assembly_code.append("pop ebp")
-            self.assembly_code.append("ret")
-        elif isinstance(node, AssignmentNode):
-            # Handle assignments like count = count + 1
-            if isinstance(node.expression, BinaryOpNode) and node.expression.operator == '+':
-                left_reg = self.generate_assembly(node.expression.left)
-                right_reg = self.generate_assembly(node.expression.right)
-                self.assembly_code.append(f"add {left_reg}, {right_reg}")
-                self.assembly_code.append(f"mov DWORD PTR [{node.identifier.name}], {left_reg}")
-                self.deallocate(left_reg)
-                self.deallocate(right_reg)
+        # Nothing is generated for a program with errors; they are in
+        # self.errors
+        self.lower_program(node)
+        if not self.errors:
+            self.emit_module(self.module)
+
+    def lower_program(self, node):
+        # Lower, optimize and check without emitting, so the IR can be shown first
+        if self.trace.codegen:
+            self.trace.emit('codegen', 'visit', node)
+        self.module = self.lowering.lower_program(node)
+        self.passes.run(self.module)
+        self.errors = self.lowering.errors or self.check_values(self.module)
+        return self.module
+
+    def generate_fragment(self, nodes):
+        # Code for some top-level nodes on their own, for incremental compiles.
+        # Labels keep counting, so fragments from one generator never clash.
+        saved = self.assembly_code, self.output
+        self.assembly_code, self.output = [], None
+        functions = [node for node in nodes if isinstance(node, FunctionDefNode)]
+        statements = [node for node in nodes if not isinstance(node, FunctionDefNode)]
+        self.module = self.lowering.lower_items(functions, statements)
+        self.passes.run(self.module)
+        self.errors = self.lowering.errors or self.check_values(self.module)
+        if not self.errors:
+            self.emit_module(self.module)
+        fragment = self.assembly_code
+        self.assembly_code, self.output = saved
+        return fragment
+
+    def check_values(self, module):
+        # Strings, floats and lists lower to None and have no machine
+        # representation. Assigning one is compiled to nothing, but a routine
+        # that computes with one, prints it or passes it on cannot be compiled.
+        self.unrepresentable = unrepresentable_values(module)
+        errors = []
+        for function in module.all_functions():
+            for instruction in function.instructions():
+                use = VALUE_USES.get(instruction.op)
+                if use is not None and any(arg is None or arg in self.unrepresentable for arg in instruction.args):
+                    errors.append(Error(f"{function.name or '<toplevel>'}: a string, float or list value reaches "
+                                        f"{use}, which the 32-bit backend cannot compile", function.line))
+                    break
+        return errors
+
+    def emit_module(self, module):
+        for function in module.all_functions():
+            self.emit_function(function)
+
+    def emit_function(self, function):
+        self.registers = {}
+        self.code = []
+        self.strings = {}
+        first_register = self.register_counter
+        labels = {block: self.generate_label() for block in jump_targets(function)}
+        exit_label = self.generate_label()
+        exit_used = False
+
+        for index, block in enumerate(function.blocks):
+            following = function.blocks[index + 1] if index + 1 < len(function.blocks) else None
+            if block in labels:
+                self.code.append(f"{labels[block]}:")
+            for instruction in block.instructions:
+                self.emit_instruction(instruction)
+
+            terminator = block.terminator
+            if terminator.op == 'return':
+                if terminator.args:
+                    self.code.append(f"mov eax, {self.operand(terminator.args[0])}")
+                if following is not None:
+                    self.code.append(f"jmp {exit_label}")
+                    exit_used = True
+            elif terminator.op == 'jump':
+                if terminator.targets[0] is not following:
+                    self.code.append(f"jmp {labels[terminator.targets[0]]}")
             else:
-                reg = self.generate_assembly(node.expression)
-                self.assembly_code.append(f"mov DWORD PTR [{node.identifier.name}], {reg}")
-                self.deallocate(reg)
-        elif isinstance(node, BinaryOpNode):
-            # Handle binary operations like x + 2
-            left_reg = self.generate_assembly(node.left)
-            right_reg = self.generate_assembly(node.right)
-            if node.operator == '+':
-                self.assembly_code.append(f"add {left_reg}, {right_reg}")
-            elif node.operator == '-':
-                self.assembly_code.append(f"sub {left_reg}, {right_reg}")
-            elif node.operator == '*':
-                self.assembly_code.append(f"imul {left_reg}, {right_reg}")
-            elif node.operator == '/':
-                self.assembly_code.append("cdq")  # Sign-extend for division
-                self.assembly_code.append(f"idiv {right_reg}")
-            self.deallocate(right_reg)
-            return left_reg
-
-        elif isinstance(node, NumberNode):
-            reg = self.allocate()
-            self.assembly_code.append(f"mov {reg}, {node.value}")
-            return reg
-        elif isinstance(node, IdentifierNode):
-            reg = self.allocate()
-            self.assembly_code.append(f"mov {reg}, [{node.name}]")
-            return reg
-        elif isinstance(node, PrintNode):
-            for param in node.parameters:
-                reg = self.generate_assembly(param)
-                self.assembly_code.append(f"push {reg}")
-                self.assembly_code.append("call print")
-                self.assembly_code.append("add esp, 4")
-                self.deallocate(reg)
-        elif isinstance(node, IfNode):
-            # If-elif-else handling
-            else_label = self.generate_label()
-            elif_label = None
-            end_label = self.generate_label()
-
-            # If condition
-            condition_reg = self.generate_assembly(node.condition)
-            self.assembly_code.append(f"cmp DWORD PTR [{node.condition.left.name}], DWORD PTR [{node.condition.right.name}]")
-            self.assembly_code.append(f"jle {else_label}")  # Jump to elif/else if x <= y
-            for statement in node.block:
-                self.generate_assembly(statement)
-            self.assembly_code.append(f"jmp {end_label}")  # Skip elif/else
-
-            # Elif condition
-            if node.elif_condition:
-                elif_label = self.generate_label()
-                self.assembly_code.append(f"{elif_label}:")
-                self.assembly_code.append(f"cmp DWORD PTR [{node.elif_condition.left.name}], DWORD PTR [{node.elif_condition.right.name}]")
-                self.assembly_code.append(f"jne {else_label}")  # Jump to else if x != y
-                for statement in node.elif_block:
-                    self.generate_assembly(statement)
-                self.assembly_code.append(f"jmp {end_label}")
-
-            # Else block
-            self.assembly_code.append(f"{else_label}:")
-            if node.else_block:
-                for statement in node.else_block:
-                    self.generate_assembly(statement)
-
-            # End of if-elif-else
-            self.assembly_code.append(f"{end_label}:")
-            self.deallocate(condition_reg)
-        elif isinstance(node, WhileNode):
-            start_label = self.generate_label()
-            end_label = self.generate_label()
-
-            # Start of the loop
-            self.assembly_code.append(f"{start_label}:")
-
-            # Evaluate the loop condition
-            condition_reg = self.generate_assembly(node.condition.left)
-            compare_value = self.generate_assembly(node.condition.right)
-            self.assembly_code.append(f"cmp {condition_reg}, {compare_value}")
-            self.assembly_code.append(f"jge {end_label}")  # Exit loop if count >= 3
-            self.deallocate(compare_value)
-
-            # Loop body
-            for statement in node.block:
-                self.generate_assembly(statement)
-
-            # Jump back to the start of the loop
-            self.assembly_code.append(f"jmp {start_label}")
-
-            # End of loop
-            self.assembly_code.append(f"{end_label}:")
-            self.deallocate(condition_reg)
-        elif isinstance(node, ForNode):
-            start_label = self.generate_label()
-            end_label = self.generate_label()
-            counter_reg = self.allocate()
-            collection_reg = self.allocate()
-
-            # Generate code to get the collection
-            self.generate_assembly(node.collection)
-            self.assembly_code.append(f"mov {collection_reg}, eax")
-
-            # Initialize counter
-            self.assembly_code.append(f"mov {counter_reg}, 0")
-
-            # Start of loop
-            self.assembly_code.append(f"{start_label}:")
-
-            # Compare counter with collection length
-            self.assembly_code.append(f"cmp {counter_reg}, [len_{collection_reg}]")
-            self.assembly_code.append(f"jge {end_label}")
-
-            # Get current element
-            self.assembly_code.append(f"mov eax, [{collection_reg} + {counter_reg} * 4]")
-            self.assembly_code.append(f"mov [{node.variable.name}], eax")
-
-            # Generate code for loop body
-            for statement in node.block:
-                self.generate_assembly(statement)
-
-            # Increment counter
-            self.assembly_code.append(f"inc {counter_reg}")
-            self.assembly_code.append(f"jmp {start_label}")
-
-            # End of loop
-            self.assembly_code.append(f"{end_label}:")
-
-            self.deallocate(counter_reg)
-            self.deallocate(collection_reg)
-
-
-    def print_assembly(self):
-        for line in self.assembly_code:
-            print(line)
+                if_true, if_false = terminator.targets
+                left = self.register_operand(terminator.args[0])
+                right = self.operand(terminator.args[1])
+                self.code.append(f"cmp {left}, {right}")
+                if if_true is following:
+                    self.code.append(f"{INVERSE_JUMPS[terminator.name]} {labels[if_false]}")
+                else:
+                    self.code.append(f"{JUMPS[terminator.name]} {labels[if_true]}")
+                    if if_false is not following:
+                        self.code.append(f"jmp {labels[if_false]}")
+        if exit_used:
+            self.code.append(f"{exit_label}:")  # Where returns jump to
+
+        allocation = allocate_registers(self.code)
+        code = self.wrap(function, allocation)
+        if self.stats is not None:
+            instructions = sum(1 for item in code if isinstance(item, Instruction))
+            self.stats.add_routine(function.name or '<toplevel>', instructions,
+                                   self.register_counter - first_register, allocation.pressure)
+        if self.strings:
+            code.append(Instruction('.section', ['.rodata']))
+            for text, label in self.strings.items():
+                code.append(Label(label))
+                code.append(Instruction('.ascii', [quoted_ascii(text)]))
+            code.append(Instruction('.text'))
+        if self.output is not None:
+            self.output.write_function(code)
+        else:
+            self.assembly_code.extend(code)
+
+    def wrap(self, function, allocation):
+        # Structured instructions for the allocated routine inside its frame
+        body = self.peephole.optimize(parse_lines(allocation.code))
+        frame_size = allocation.frame_size()
+        code = []
+        if function.name is not None:
+            saved_registers = allocation.saved_registers()
+            code.append(Label(function.name))
+            code.append(Instruction('push', ['ebp']))
+            code.append(Instruction('mov', ['ebp', 'esp']))
+            if frame_size:
+                code.append(Instruction('sub', ['esp', str(frame_size)]))
+            for register in saved_registers:
+                code.append(Instruction('push', [register]))
+            code.extend(body)
+            for register in reversed(saved_registers):
+                code.append(Instruction('pop', [register]))
+            if frame_size:
+                code.append(Instruction('mov', ['esp', 'ebp']))
+            code.append(Instruction('pop', ['ebp']))
+            code.append(Instruction('ret'))
+        elif frame_size:
+            # Top-level code only needs a frame for its spill slots
+            code.append(Instruction('push', ['ebp']))
+            code.append(Instruction('mov', ['ebp', 'esp']))
+            code.append(Instruction('sub', ['esp', str(frame_size)]))
+            code.extend(body)
+            code.append(Instruction('mov', ['esp', 'ebp']))
+            code.append(Instruction('pop', ['ebp']))
+        else:
+            code.extend(body)
+        return code
+
+    def operand(self, value):
+        # An immediate for a constant, otherwise the value's virtual register
+        if isinstance(value, Const):
+            return str(value.value)
+        if value not in self.registers:
+            self.registers[value] = self.allocate()
+        return self.registers[value]
+
+    def text_operand(self, text):
+        # The address of the text; labels keep counting like the code labels
+        if text not in self.strings:
+            self.strings[text] = self.generate_label()
+        return f"OFFSET {self.strings[text]}"
+
+    def push_text(self, text):
+        self.code.append(f"push {len(text.encode('utf-8'))}")
+        self.code.append(f"push {self.text_operand(text)}")
+
+    def register_operand(self, value):
+        # Like operand(), but never an immediate
+        if isinstance(value, Const):
+            register = self.allocate()
+            self.code.append(f"mov {register}, {value.value}")
+            return register
+        return self.operand(value)
+
+    def emit_instruction(self, instruction):
+        op = instruction.op
+        args = instruction.args
+        if op == 'copy':
+            if args[0] is None or args[0] in self.unrepresentable:
+                return  # Never read as a number; see check_values()
+            self.code.append(f"mov {self.operand(instruction.dest)}, {self.operand(args[0])}")
+        elif op in ARITHMETIC_INSTRUCTIONS:
+            self.emit_arithmetic(instruction)
+        elif op in ('div', 'mod'):
+            # idiv truncates toward zero. When the remainder is not zero and
+            # its sign differs from the divisor's, the quotient is one too big
+            # and the remainder one divisor short of rounding down.
+            divisor = self.register_operand(args[1])
+            done_label = self.generate_label()
+            self.code.append(f"mov eax, {self.operand(args[0])}")
+            self.code.append("cdq")  # Sign-extend for division
+            self.code.append(f"idiv {divisor}")
+            self.code.append("test edx, edx")
+            self.code.append(f"je {done_label}")
+            if op == 'div':
+                self.code.append(f"xor edx, {divisor}")
+                self.code.append(f"jns {done_label}")
+                self.code.append("dec eax")
+            else:
+                self.code.append("mov eax, edx")
+                self.code.append(f"xor eax, {divisor}")
+                self.code.append(f"jns {done_label}")
+                self.code.append(f"add edx, {divisor}")
+            self.code.append(f"{done_label}:")
+            self.code.append(f"mov {self.operand(instruction.dest)}, {'eax' if op == 'div' else 'edx'}")
+        elif op == 'neg':
+            dest = self.operand(instruction.dest)
+            if args[0] is not instruction.dest:
+                self.code.append(f"mov {dest}, {self.operand(args[0])}")
+            self.code.append(f"neg {dest}")
+        elif op in INVERSE_JUMPS:
+            # 1 if the comparison holds, else 0; mov leaves the flags alone
+            left = self.register_operand(args[0])
+            right = self.operand(args[1])
+            dest = self.operand(instruction.dest)
+            done_label = self.generate_label()
+            self.code.append(f"cmp {left}, {right}")
+            self.code.append(f"mov {dest}, 0")
+            self.code.append(f"{INVERSE_JUMPS[op]} {done_label}")
+            self.code.append(f"mov {dest}, 1")
+            self.code.append(f"{done_label}:")
+        elif op == 'call':
+            # cdecl: arguments pushed right to left, result in eax
+            arguments = [self.operand(argument) for argument in args]
+            for argument in reversed(arguments):
+                self.code.append(f"push {argument}")
+            self.code.append(f"call {instruction.name}")
+            if arguments:
+                self.code.append(f"add esp, {4 * len(arguments)}")
+            self.code.append(f"mov {self.operand(instruction.dest)}, eax")
+        elif op == 'print':
+            self.push_text(instruction.name)
+            self.code.append(f"push {self.operand(args[0])}")
+            self.code.append("call print")
+            self.code.append("add esp, 12")
+        elif op == 'print_text':
+            self.push_text(instruction.name)
+            self.code.append("call print_text")
+            self.code.append("add esp, 8")
+        elif op == 'load':
+            if instruction.dest in self.unrepresentable:
+                return
+            self.code.append(f"mov {self.operand(instruction.dest)}, DWORD PTR [{instruction.name}]")
+        elif op == 'store':
+            if args[0] is None or args[0] in self.unrepresentable:
+                return
+            self.code.append(f"mov DWORD PTR [{instruction.name}], {self.operand(args[0])}")
+        elif op == 'param':
+            self.code.append(f"mov {self.operand(instruction.dest)}, DWORD PTR [ebp+{8 + 4 * instruction.name}]")
+        elif op == 'len':
+            # The length is stored just before the elements
+            self.code.append(f"mov {self.operand(instruction.dest)}, DWORD PTR [{self.register_operand(args[0])}-4]")
+        elif op == 'index':
+            array = self.register_operand(args[0])
+            index = self.register_operand(args[1])
+            self.code.append(f"mov {self.operand(instruction.dest)}, DWORD PTR [{array}+{index}*4]")
+        else:
+            raise ValueError(f"unknown IR op {op!r}")
+
+    def emit_arithmetic(self, instruction):
+        mnemonic = ARITHMETIC_INSTRUCTIONS[instruction.op]
+        left, right = instruction.args
+        dest = self.operand(instruction.dest)
+        if left is instruction.dest:
+            self.code.append(f"{mnemonic} {dest}, {self.operand(right)}")
+        elif right is instruction.dest and instruction.op in COMMUTATIVE:
+            self.code.append(f"{mnemonic} {dest}, {self.operand(left)}")
+        elif right is instruction.dest:
+            # x = e - x: work in a temporary so x is still there to subtract
+            temporary = self.allocate()
+            self.code.append(f"mov {temporary}, {self.operand(left)}")
+            self.code.append(f"{mnemonic} {temporary}, {dest}")
+            self.code.append(f"mov {dest}, {temporary}")
+        else:
+            self.code.append(f"mov {dest}, {self.operand(left)}")
+            self.code.append(f"{mnemonic} {dest}, {self.operand(right)}")
+
+    def print_assembly(self, sink=None):
+        write_assembly(self.assembly_code, sink or sys.stdout)
@@ -0,0 +1,223 @@
+from bisect import bisect_right
+
+from lexer import LexicalAnalyzer
+from syntax import Parser, ProgramNode, FunctionDefNode, Error
+from generator import CodeGenerator
+from resolver import Resolver, GLOBAL
+from tracing import NO_TRACE
+
+# Incremental compilation for editor integrations.
+#
+# A program is split into top-level items: a function definition or a top-level
+# statement together with its indented block and any elif/else lines. Whether a
+# line starts an item depends only on that line, so an edit can only move item
+# boundaries inside the lines it touches. apply_edit() relexes, reparses and
+# regenerates just the items overlapping the edit and reuses every other item's
+# tokens, AST and assembly as they are.
+#
+# Each item is lexed and parsed on its own, so line numbers inside an item's
+# tokens and nodes are relative to the item; item.first_line maps them back to
+# the file. That keeps reused items valid when lines are inserted above them.
+#
+# Undefined names depend on the whole program, so every result resolves each
+# item again against the globals and functions all the items bind.
+
+CONTINUATION_KEYWORDS = ('elif', 'else')
+
+
+class TextEdit:
+    # Replace source[start:end] with text
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __repr__(self):
+        return f"TextEdit(start={self.start}, end={self.end}, text={self.text!r})"
+
+
+class SourceItem:
+    def __init__(self, start, end, first_line, text):
+        self.start = start  # Offset of the item in the file
+        self.end = end
+        self.first_line = first_line
+        self.text = text
+        self.tokens = None
+        self.nodes = []
+        self.parsed = False
+        self.errors = []  # Parse or compile errors, with lines relative to the item
+        self.assembly = []
+
+    def moved(self, delta, line_delta):
+        # Copy at a new position sharing the tokens, AST and code; the previous
+        # result keeps the original untouched
+        item = SourceItem(self.start + delta, self.end + delta, self.first_line + line_delta, self.text)
+        item.tokens = self.tokens
+        item.nodes = self.nodes
+        item.parsed = self.parsed
+        item.errors = self.errors
+        item.assembly = self.assembly
+        return item
+
+    def is_function(self):
+        return len(self.nodes) == 1 and isinstance(self.nodes[0], FunctionDefNode)
+
+
+class IncrementalResult:
+    def __init__(self, source, items, reused=0):
+        self.source = source
+        self.items = items
+        self.reused = reused  # Items carried over unchanged from the previous result
+        functions = []
+        statements = []
+        for item in items:
+            for node in item.nodes:
+                if isinstance(node, FunctionDefNode):
+                    functions.append(node)
+                else:
+                    statements.append(node)
+        self.program = ProgramNode(functions, statements)
+        self.name_errors = self.resolve_names() if all(item.parsed for item in items) else []
+        self.success = not any(item.errors for item in items) and not self.name_errors
+
+    def resolve_names(self):
+        # Undefined names and calls, with file line numbers
+        program_scope = Resolver(report_undefined=False).resolve(self.program)
+        known_globals = program_scope.names(GLOBAL)
+        known_functions = [function.name for function in self.program.functions]
+        errors = []
+        for item in self.items:
+            functions = [node for node in item.nodes if isinstance(node, FunctionDefNode)]
+            statements = [node for node in item.nodes if not isinstance(node, FunctionDefNode)]
+            resolver = Resolver(known_globals=known_globals, known_functions=known_functions)
+            resolver.resolve_items(functions, statements)
+            errors.extend(file_error(error, item) for error in resolver.errors)
+        return errors
+
+    def errors(self):
+        # Parse, compile and name errors with file line numbers
+        errors = [file_error(error, item) for item in self.items for error in item.errors]
+        return errors + self.name_errors
+
+    def assembly(self):
+        # Same order as CodeGenerator: every function first, then top-level statements
+        lines = []
+        for item in self.items:
+            if item.is_function():
+                lines.extend(item.assembly)
+        for item in self.items:
+            if not item.is_function():
+                lines.extend(item.assembly)
+        return lines
+
+
+def file_error(error, item):
+    # The error with its line in the item turned into a line in the file
+    line = error.line_number
+    if isinstance(line, int):
+        line += item.first_line - 1
+    return Error(error.message, line)
+
+
+def starts_item(source, offset):
+    # True if the line at offset begins a new top-level item
+    if offset >= len(source):
+        return False
+    ch = source[offset]
+    if ch in ' \t\r\n\f\v#':
+        return False
+    for keyword in CONTINUATION_KEYWORDS:
+        if source.startswith(keyword, offset):
+            after = source[offset + len(keyword):offset + len(keyword) + 1]
+            if not (after.isalnum() or after == '_'):
+                return False
+    return True
+
+
+def item_starts(source, start, end):
+    # Offsets of the item-starting lines in source[start:end]; start must be a line start
+    starts = []
+    offset = start
+    while offset < end:
+        if starts_item(source, offset):
+            starts.append(offset)
+        newline = source.find('\n', offset, end)
+        if newline == -1:
+            break
+        offset = newline + 1
+    return starts
+
+
+class IncrementalCompiler:
+    def __init__(self, engine='table', tracer=NO_TRACE):
+        self.analyzer = LexicalAnalyzer(engine, tracer)
+        self.tracer = tracer
+        # One generator for the whole session so labels stay unique across items
+        self.generator = CodeGenerator(tracer)
+
+    def compile(self, source):
+        items = self.build_items(source, 0, len(source), 1)
+        return IncrementalResult(source, items)
+
+    def apply_edit(self, previous, edit):
+        old_items = previous.items
+        old_source = previous.source
+        source = old_source[:edit.start] + edit.text + old_source[edit.end:]
+        delta = len(edit.text) - (edit.end - edit.start)
+        line_delta = edit.text.count('\n') - old_source.count('\n', edit.start, edit.end)
+
+        if not old_items:
+            return IncrementalResult(source, self.build_items(source, 0, len(source), 1))
+
+        # Items overlapping the edit, in the old item list
+        starts = [item.start for item in old_items]
+        first = max(bisect_right(starts, edit.start) - 1, 0)
+        last = max(bisect_right(starts, edit.end) - 1, first)
+
+        # If the first rebuilt line no longer starts an item, it now belongs to the
+        # item above, so that one has to be rebuilt too
+        region_start = old_items[first].start
+        while first > 0 and not starts_item(source, region_start):
+            first -= 1
+            region_start = old_items[first].start
+
+        region_end = old_items[last].end + delta
+        first_line = old_items[first].first_line
+        rebuilt = self.build_items(source, region_start, region_end, first_line)
+
+        # Later items keep their tokens, AST and code; only their position moves
+        moved = [item.moved(delta, line_delta) for item in old_items[last + 1:]]
+
+        items = old_items[:first] + rebuilt + moved
+        return IncrementalResult(source, items, reused=len(items) - len(rebuilt))
+
+    def build_items(self, source, start, end, first_line):
+        if start >= end:
+            return []
+        starts = item_starts(source, start, end)
+        # Leading blank or comment lines stay with the item that follows them
+        if not starts or starts[0] != start:
+            starts.insert(0, start)
+
+        items = []
+        line = first_line
+        for index, item_start in enumerate(starts):
+            item_end = starts[index + 1] if index + 1 < len(starts) else end
+            text = source[item_start:item_end]
+            item = SourceItem(item_start, item_end, line, text)
+            self.build_item(item)
+            items.append(item)
+            line += text.count('\n')
+        return items
+
+    def build_item(self, item):
+        item.tokens = self.analyzer.tokenize_stream(item.text)
+        parser = Parser(item.tokens, self.tracer)
+        program, success = parser.parse()
+        item.nodes = [node for node in program.functions + program.statements if node is not None]
+        item.parsed = success
+        item.errors = parser.errors
+        if success:
+            item.assembly = self.generator.generate_fragment(item.nodes)
+            if self.generator.errors:
+                item.errors = self.generator.errors
@@ -0,0 +1,137 @@
+from syntax import *
+from ir import AUGMENTED_OPERATORS
+from bytecode import string_value
+
+# Straightforward tree-walking interpreter: every run visits the AST again and
+# looks names up in dictionaries. It is the baseline the bytecode VM is
+# measured against, and follows the same Python semantics.
+
+BINARY_OPERATIONS = {
+    '+': lambda left, right: left + right,
+    '-': lambda left, right: left - right,
+    '*': lambda left, right: left * right,
+    '/': lambda left, right: left / right,
+    '%': lambda left, right: left % right,
+    '**': lambda left, right: left ** right,
+    '<': lambda left, right: left < right,
+    '>': lambda left, right: left > right,
+    '<=': lambda left, right: left <= right,
+    '>=': lambda left, right: left >= right,
+    '==': lambda left, right: left == right,
+    '!=': lambda left, right: left != right,
+}
+
+
+class ReturnValue(Exception):
+    def __init__(self, value):
+        self.value = value
+
+
+class TreeInterpreter(NodeVisitor):
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.functions = {}
+        self.globals = {}
+        self.scope = self.globals
+
+    def run(self, program):
+        for function in program.functions:
+            self.functions[function.name] = function
+        self.scope = self.globals
+        self.execute(program.statements)
+
+    def execute(self, statements):
+        for statement in statements:
+            if statement is not None:
+                self.visit(statement)
+
+    def generic_visit(self, node):
+        raise ValueError(f"Line {node.line}: {type(node).__name__} is not supported by the interpreter")
+
+    def visit_AssignmentNode(self, node):
+        self.scope[node.identifier.name] = self.visit(node.expression)
+
+    def visit_AugmentedAssignmentNode(self, node):
+        operation = BINARY_OPERATIONS[AUGMENTED_OPERATORS[node.operator]]
+        name = node.identifier.name
+        self.scope[name] = operation(self.lookup(name), self.visit(node.expression))
+
+    def visit_PrintNode(self, node):
+        print(*[self.visit(parameter) for parameter in node.parameters], file=self.stream)
+
+    def visit_ReturnNode(self, node):
+        raise ReturnValue(self.visit(node.value) if node.value is not None else None)
+
+    def visit_IfNode(self, node):
+        if self.visit(node.condition):
+            self.execute(node.block)
+        elif node.elif_condition is not None and self.visit(node.elif_condition):
+            self.execute(node.elif_block)
+        elif node.else_block:
+            self.execute(node.else_block)
+
+    def visit_WhileNode(self, node):
+        while self.visit(node.condition):
+            self.execute(node.block)
+
+    def visit_ForNode(self, node):
+        for value in self.visit(node.collection):
+            self.scope[node.variable.name] = value
+            self.execute(node.block)
+
+    def visit_RangeNode(self, node):
+        return range(*[self.visit(argument) for argument in (node.start, node.stop, node.step) if argument is not None])
+
+    def visit_NumberNode(self, node):
+        return int(node.value)
+
+    def visit_FloatNode(self, node):
+        return float(node.value)
+
+    def visit_StringNode(self, node):
+        return string_value(node.value)
+
+    def visit_BooleanNode(self, node):
+        return node.value
+
+    def visit_ListNode(self, node):
+        return [self.visit(element) for element in node.elements]
+
+    def visit_IdentifierNode(self, node):
+        return self.lookup(node.name)
+
+    def lookup(self, name):
+        # A function's own names first, then the globals
+        if name in self.scope:
+            return self.scope[name]
+        return self.globals.get(name)
+
+    def visit_UnaryOpNode(self, node):
+        value = self.visit(node.operand)
+        return -value if node.operator == '-' else value
+
+    def visit_BinaryOpNode(self, node):
+        # Iterative down the left operands, like Lowering.visit_BinaryOpNode
+        chain = []
+        while isinstance(node, BinaryOpNode):
+            chain.append(node)
+            node = node.left
+        result = self.visit(node)
+        for operation in reversed(chain):
+            result = BINARY_OPERATIONS[operation.operator](result, self.visit(operation.right))
+        return result
+
+    def visit_FunctionCallNode(self, node):
+        function = self.functions.get(node.function_name)
+        if function is None:
+            raise ValueError(f"Line {node.line}: call to undefined function {node.function_name!r}")
+        arguments = [self.visit(argument) for argument in node.arguments]
+        caller = self.scope
+        self.scope = dict(zip(function.parameters, arguments))
+        try:
+            self.execute(function.body)
+        except ReturnValue as returned:
+            return returned.value
+        finally:
+            self.scope = caller
+        return None
@@ -0,0 +1,765 @@
+from syntax import *
+from tracing import NO_TRACE
+from resolver import Resolver, GLOBAL, PARAMETER, LOCAL
+
+# Three-address intermediate representation between the AST and assembly.
+#
+# Every instruction reads at most a few operands and writes at most one result.
+# Operands are Temp (compiler temporaries), Var (source variables, one object
+# per name and function) and Const (integer immediates). Values the backend
+# cannot represent yet, such as strings and lists, lower to None. Anything else
+# the IR cannot express is reported in Lowering.errors rather than lowered to
+# code that does something different. Variables may be assigned any number of
+# times; the IR is not in SSA form.
+#
+# A function is a list of basic blocks in layout order, entry first. Each block
+# is a run of straight-line instructions ending in exactly one terminator:
+#   jump    targets=(block,)
+#   branch  args=(left, right), name=comparison, targets=(if_true, if_false)
+#   return  args=() or (value,)
+#
+# Ordinary instructions (dest <- op args):
+#   copy, neg                     dest <- one operand
+#   add, sub, mul, div, mod       dest <- two operands; div and mod round
+#                                 down like Python's // and %
+#   < > <= >= == !=               dest <- 1 if the comparison holds, else 0
+#   call    name=function         dest <- call with args
+#   print   name=end              print args[0] followed by the text end
+#   print_text name=text          print the text
+#   load    name=global           dest <- the global's memory cell
+#   store   name=global           the global's memory cell <- args[0]
+#   param   name=index            dest <- the index-th argument
+#   len                           dest <- length of the array args[0]
+#   index                         dest <- args[0][args[1]]
+
+COMPARISONS = ('<', '>', '<=', '>=', '==', '!=')
+# '/' is not here: it gives a float, which the IR has no type for
+BINARY_OPS = {'+': 'add', '-': 'sub', '*': 'mul', '%': 'mod'}
+AUGMENTED_OPERATORS = {'PLUS_ASSIGN': '+', 'MINUS_ASSIGN': '-', 'TIMES_ASSIGN': '*', 'DIVIDE_ASSIGN': '/'}
+TERMINATORS = ('jump', 'branch', 'return')
+# Instructions that do something besides writing dest, so they are kept even
+# when nothing reads their result
+SIDE_EFFECTS = frozenset(('call', 'print', 'print_text', 'store'))
+
+
+class Temp:
+    __slots__ = ('number',)
+
+    def __init__(self, number):
+        self.number = number
+
+    def __repr__(self):
+        return f"t{self.number}"
+
+
+class Var:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+class Const:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return str(self.value)
+
+
+class Instruction:
+    __slots__ = ('op', 'dest', 'args', 'name', 'targets')
+
+    def __init__(self, op, dest=None, args=(), name=None, targets=()):
+        self.op = op
+        self.dest = dest
+        self.args = list(args)
+        self.name = name
+        self.targets = targets
+
+    def is_terminator(self):
+        return self.op in TERMINATORS
+
+    def __repr__(self):
+        args = ', '.join(repr(arg) for arg in self.args)
+        if self.op == 'jump':
+            return f"jump {self.targets[0].label}"
+        if self.op == 'branch':
+            return f"branch {self.args[0]!r} {self.name} {self.args[1]!r} ? {self.targets[0].label} : {self.targets[1].label}"
+        if self.op == 'return':
+            return f"return {args}".rstrip()
+        if self.op == 'call':
+            text = f"call {self.name}({args})"
+        elif self.op in ('load', 'store'):
+            text = f"{self.op} [{self.name}]" + (f", {args}" if args else "")
+        elif self.op == 'param':
+            text = f"param {self.name}"
+        elif self.op == 'print_text':
+            text = f"print_text {self.name!r}"
+        else:
+            text = f"{self.op} {args}"
+        if self.dest is not None:
+            text = f"{self.dest!r} = {text}"
+        return text
+
+
+class BasicBlock:
+    def __init__(self, label):
+        self.label = label
+        self.instructions = []
+        self.terminator = None
+
+    def successors(self):
+        return self.terminator.targets if self.terminator is not None else ()
+
+    def __repr__(self):
+        lines = [f"{self.label}:"]
+        lines.extend(f"    {instruction!r}" for instruction in self.instructions)
+        if self.terminator is not None:
+            lines.append(f"    {self.terminator!r}")
+        return "\n".join(lines)
+
+
+class IRFunction:
+    # name is None for the top-level statements
+    def __init__(self, name, parameters=()):
+        self.name = name
+        self.parameters = list(parameters)
+        self.blocks = []
+        self.variables = {}
+        self.scope = None  # resolver.Scope of the names the function binds
+        self.line = None  # Source line the function starts on, for errors
+        self.temp_counter = 0
+        self.block_counter = 0
+
+    def new_block(self):
+        self.block_counter += 1
+        block = BasicBlock(f"B{self.block_counter}")
+        self.blocks.append(block)
+        return block
+
+    def new_temp(self):
+        self.temp_counter += 1
+        return Temp(self.temp_counter)
+
+    def variable(self, name):
+        if name not in self.variables:
+            self.variables[name] = Var(name)
+        return self.variables[name]
+
+    def predecessors(self):
+        predecessors = {block: [] for block in self.blocks}
+        for block in self.blocks:
+            for successor in block.successors():
+                predecessors[successor].append(block)
+        return predecessors
+
+    def reverse_postorder(self):
+        # Blocks reachable from the entry, each one ahead of its successors
+        # except along loop back edges. Successors are explored last to first
+        # so a loop body comes right after its header, not after everything
+        # that follows the loop.
+        entry = self.blocks[0]
+        order = []
+        visited = {entry}
+        stack = [(entry, reversed(entry.successors()))]
+        while stack:
+            block, successors = stack[-1]
+            for successor in successors:
+                if successor not in visited:
+                    visited.add(successor)
+                    stack.append((successor, reversed(successor.successors())))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        order.reverse()
+        return order
+
+    def instructions(self):
+        for block in self.blocks:
+            yield from block.instructions
+            yield block.terminator
+
+    def __repr__(self):
+        header = f"function {self.name}({', '.join(self.parameters)})" if self.name else "toplevel"
+        return "\n".join([header] + [repr(block) for block in self.blocks])
+
+
+class IRModule:
+    def __init__(self, functions, toplevel, whole_program=False):
+        self.functions = functions
+        self.toplevel = toplevel  # IRFunction for the top-level statements, or None
+        self.whole_program = whole_program  # False for an incremental fragment
+
+    def all_functions(self):
+        return self.functions + ([self.toplevel] if self.toplevel is not None else [])
+
+    def __repr__(self):
+        return "\n\n".join(repr(function) for function in self.all_functions())
+
+
+def unrepresentable_values(module):
+    # Values that may hold a string, float or list: the results of copying
+    # None, and whatever they flow into through copies, globals and returns
+    tainted = set()
+    tainted_globals = set()
+    tainted_functions = set()
+    changed = True
+    while changed:
+        changed = False
+        for function in module.all_functions():
+            for instruction in function.instructions():
+                op = instruction.op
+                incoming = any(arg is None or arg in tainted for arg in instruction.args)
+                if op == 'load':
+                    incoming = instruction.name in tainted_globals
+                elif op == 'call':
+                    incoming = instruction.name in tainted_functions
+                if not incoming:
+                    continue
+                if op == 'store' and instruction.name not in tainted_globals:
+                    tainted_globals.add(instruction.name)
+                    changed = True
+                elif op == 'return' and function.name is not None and function.name not in tainted_functions:
+                    tainted_functions.add(function.name)
+                    changed = True
+                elif instruction.dest is not None and op in ('copy', 'load', 'call') and instruction.dest not in tainted:
+                    tainted.add(instruction.dest)
+                    changed = True
+    return tainted
+
+
+def dominators(function):
+    # Immediate dominator of every reachable block (Cooper, Harvey and Kennedy)
+    order = function.reverse_postorder()
+    position = {block: index for index, block in enumerate(order)}
+    predecessors = function.predecessors()
+    entry = order[0]
+    idom = {entry: entry}
+
+    def intersect(first, second):
+        while first is not second:
+            while position[first] > position[second]:
+                first = idom[first]
+            while position[second] > position[first]:
+                second = idom[second]
+        return first
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new = None
+            for predecessor in predecessors[block]:
+                if predecessor in idom:
+                    new = predecessor if new is None else intersect(predecessor, new)
+            if idom.get(block) is not new:
+                idom[block] = new
+                changed = True
+    return idom
+
+
+def dominates(first, second, idom):
+    while True:
+        if second is first:
+            return True
+        if idom[second] is second:
+            return False
+        second = idom[second]
+
+
+def dominance_frontiers(function, idom):
+    # Blocks where each reachable block's dominance ends: the joins it reaches
+    # without dominating them (Cooper, Harvey and Kennedy)
+    frontiers = {block: set() for block in idom}
+    for block, predecessors in function.predecessors().items():
+        predecessors = [predecessor for predecessor in predecessors if predecessor in idom]
+        if block not in idom or len(predecessors) < 2:
+            continue
+        for predecessor in predecessors:
+            runner = predecessor
+            while runner is not idom[block]:
+                frontiers[runner].add(block)
+                runner = idom[runner]
+    return frontiers
+
+
+class Phi:
+    # Where the definitions of one value from several predecessors meet
+    __slots__ = ('value', 'block', 'operands')
+
+    def __init__(self, value, block):
+        self.value = value
+        self.block = block
+        self.operands = {}  # Predecessor -> definition reaching the end of it, None if undefined there
+
+
+def upward_exposed(function):
+    # Values read in some block before that block writes them
+    exposed = set()
+    for block in function.blocks:
+        written = set()
+        for instruction in block.instructions + [block.terminator]:
+            for arg in instruction.args:
+                if arg is not None and not isinstance(arg, Const) and arg not in written:
+                    exposed.add(arg)
+            if instruction.dest is not None:
+                written.add(instruction.dest)
+    return exposed
+
+
+def place_phis(function, idom):
+    # Block -> its Phis, at the iterated dominance frontier of the blocks that
+    # write each value. Only values some block reads before writing them flow
+    # between blocks, so only those need one.
+    frontiers = dominance_frontiers(function, idom)
+    crossing = upward_exposed(function)
+    written = {}
+    for block in idom:
+        for instruction in block.instructions:
+            if instruction.dest in crossing:
+                written.setdefault(instruction.dest, set()).add(block)
+    phis = {block: [] for block in idom}
+    for value, blocks in written.items():
+        placed = set()
+        pending = list(blocks)
+        while pending:
+            for frontier in frontiers[pending.pop()]:
+                if frontier not in placed:
+                    placed.add(frontier)
+                    phis[frontier].append(Phi(value, frontier))
+                    if frontier not in blocks:
+                        pending.append(frontier)
+    return phis
+
+
+def link_definitions(function, idom, phis):
+    # Walk the dominator tree keeping the definition that reaches each point
+    # of every value, as SSA renaming does, without rewriting the IR. Returns the definitions read by
+    # each instruction's arguments (None for a constant or an undefined
+    # value) and each definition's readers as (block, Phi or instruction).
+    children = {block: [] for block in idom}
+    for block, parent in idom.items():
+        if parent is not block:
+            children[parent].append(block)
+    current = {}  # Value -> stack of definitions, innermost last
+    reaching = {}
+    readers = {}
+
+    def lookup(arg):
+        if arg is None or isinstance(arg, Const):
+            return None
+        stack = current.get(arg)
+        return stack[-1] if stack else None
+
+    entry = function.blocks[0]
+    pending = [(entry, True)]
+    while pending:
+        block, entering = pending.pop()
+        if not entering:
+            for phi in phis[block]:
+                current[phi.value].pop()
+            for instruction in block.instructions:
+                if instruction.dest is not None:
+                    current[instruction.dest].pop()
+            continue
+        for phi in phis[block]:
+            current.setdefault(phi.value, []).append(phi)
+        for instruction in block.instructions + [block.terminator]:
+            definitions = [lookup(arg) for arg in instruction.args]
+            reaching[instruction] = definitions
+            for definition in definitions:
+                if definition is not None:
+                    readers.setdefault(definition, []).append((block, instruction))
+            if instruction.dest is not None:
+                current.setdefault(instruction.dest, []).append(instruction)
+        for successor in block.successors():
+            for phi in phis[successor]:
+                definition = lookup(phi.value)
+                phi.operands[block] = definition
+                if definition is not None:
+                    readers.setdefault(definition, []).append((successor, phi))
+        pending.append((block, False))
+        pending.extend((child, True) for child in children[block])
+    return reaching, readers
+
+
+def string_value(text):
+    # Literal text as the lexer keeps it, quotes included
+    return text[1:-1]
+
+
+class Lowering(NodeVisitor):
+    # Turns the AST into an IRModule, one IRFunction per function plus one for
+    # the top-level statements.
+    #
+    # Which names are parameters, locals and globals comes from the resolver's
+    # scopes. Globals are loaded into their Var on entry and stored back at the
+    # end of the top-level code, and before calls for the ones a function
+    # reads. Parameters are read with param on entry. A local read before it is
+    # assigned is 0, and falling off the end of a function returns 0.
+    #
+    # Constructs that cannot be lowered are added to errors; a backend must not
+    # generate code for a module lowered with errors.
+    def __init__(self, tracer=NO_TRACE):
+        self.trace = tracer
+        self.errors = []
+        self.function = None
+        self.block = None
+        self.stored_globals = []
+        self.shared_globals = []
+        self.function_globals = None  # Globals any function reads; None if unknown
+
+    def lower_program(self, node):
+        # The driver resolves names first to report undefined ones; an AST
+        # that skipped it is resolved here without reporting
+        if node.scope is None:
+            Resolver(report_undefined=False).resolve(node)
+        self.function_globals = {name for function in node.functions for name in function.scope.globals_read}
+        module = self.lower_scopes(node.functions, node.statements, node.scope)
+        module.whole_program = True
+        return module
+
+    def lower_items(self, functions, statements):
+        # A fragment cannot tell undefined names from globals bound elsewhere
+        scope = Resolver(report_undefined=False).resolve_items(functions, statements)
+        return self.lower_scopes(functions, statements, scope)
+
+    def lower_scopes(self, functions, statements, module_scope):
+        self.errors = []
+        lowered = [self.lower_function(function.body, function.scope) for function in functions]
+        toplevel = self.lower_function(statements, module_scope) if statements else None
+        return IRModule(lowered, toplevel)
+
+    def lower_function(self, statements, scope):
+        function = scope.function
+        if function is not None:
+            self.function = IRFunction(function.name, scope.names(PARAMETER))
+            self.stored_globals = []
+            self.shared_globals = []
+        else:
+            self.function = IRFunction(None)
+            self.stored_globals = scope.names(GLOBAL)
+            if self.function_globals is None:
+                self.shared_globals = self.stored_globals
+            else:
+                self.shared_globals = [name for name in self.stored_globals if name in self.function_globals]
+        self.function.scope = scope
+        self.function.line = function.line if function is not None else statements[0].line
+
+        entry = self.function.new_block()
+        self.block = self.function.new_block()
+        self.lower_block(statements)
+        self.store_globals(self.stored_globals)
+        self.terminate('return', args=[Const(0)] if function is not None else [])
+
+        # Every variable starts out with its value on entry; passes and the
+        # register allocator drop the ones overwritten before they are read
+        for name, variable in self.function.variables.items():
+            symbol = scope.symbols.get(name)
+            kind = symbol.kind if symbol is not None else GLOBAL
+            if kind == PARAMETER:
+                # Parameters take the first frame slots, in order
+                entry.instructions.append(Instruction('param', variable, name=symbol.slot - 1))
+            elif kind == LOCAL:
+                entry.instructions.append(Instruction('copy', variable, [Const(0)]))
+            else:
+                entry.instructions.append(Instruction('load', variable, name=name))
+        entry.terminator = Instruction('jump', targets=(self.function.blocks[1],))
+        return self.function
+
+    def emit(self, op, dest=None, args=(), name=None):
+        self.block.instructions.append(Instruction(op, dest, args, name))
+        return dest
+
+    def terminate(self, op, args=(), name=None, targets=()):
+        # Ends the current block. Code after a return goes into a fresh block
+        # that nothing jumps to.
+        self.block.terminator = Instruction(op, args=args, name=name, targets=targets)
+        self.block = None
+
+    def start_block(self, block=None):
+        if block is None:
+            block = self.function.new_block()
+        elif block not in self.function.blocks:
+            self.function.blocks.append(block)
+        self.block = block
+        return block
+
+    def detached_block(self):
+        # A block that is placed in the layout later, by start_block()
+        self.function.block_counter += 1
+        return BasicBlock(f"B{self.function.block_counter}")
+
+    def lower_statement(self, node):
+        if self.block is None:
+            self.start_block()
+        if self.trace.codegen:
+            self.trace.emit('codegen', 'visit', node)
+        self.visit(node)
+
+    def lower_block(self, statements):
+        for statement in statements:
+            self.lower_statement(statement)
+        if self.block is None:
+            self.start_block()
+
+    def store_globals(self, names):
+        for name in names:
+            self.emit('store', args=[self.function.variable(name)], name=name)
+
+    def value(self, node):
+        # Operand holding the value of an expression
+        if self.trace.codegen:
+            self.trace.emit('codegen', 'visit', node)
+        return self.visit(node)
+
+    def error(self, message, line):
+        self.errors.append(Error(message, line))
+
+    def generic_visit(self, node):
+        self.error(f"{type(node).__name__} is not supported by the compiler", node.line)
+        return None
+
+    def visit_StringNode(self, node):
+        return None  # No machine representation yet; see the module comment
+
+    def visit_FloatNode(self, node):
+        return None
+
+    def visit_FStringNode(self, node):
+        return None
+
+    def visit_ListNode(self, node):
+        for element in node.elements:
+            self.value(element)
+        return None
+
+    def visit_NumberNode(self, node):
+        return Const(int(node.value))
+
+    def visit_BooleanNode(self, node):
+        return Const(1 if node.value else 0)
+
+    def visit_IdentifierNode(self, node):
+        return self.function.variable(node.name)
+
+    def visit_UnaryOpNode(self, node):
+        operand = self.value(node.operand)
+        if node.operator != '-':
+            return operand
+        if isinstance(operand, Const):
+            return Const(-operand.value)
+        return self.emit('neg', self.function.new_temp(), [operand])
+
+    def visit_BinaryOpNode(self, node):
+        # Walk down the left operands first so a long chain like 1 + 2 + ... + n
+        # does not recurse once per operator
+        chain = []
+        while isinstance(node, BinaryOpNode):
+            chain.append(node)
+            node = node.left
+        result = self.value(node)
+        for operation in reversed(chain):
+            right = self.value(operation.right)
+            if operation.operator == '**':
+                result = self.power(result, right, operation.line)
+            elif operation.operator == '/':
+                result = self.true_division(operation.line)
+            else:
+                result = self.binary(operation.operator, result, right)
+        return result
+
+    def power(self, base, exponent, line):
+        # Square and multiply, so the exponent has to be known here. Python
+        # gives a float for a negative one, which the IR has no type for.
+        if not isinstance(exponent, Const) or exponent.value < 0:
+            self.error("'**' needs a constant exponent that is not negative", line)
+            return Const(0)
+        result = None
+        square = base
+        remaining = exponent.value
+        while True:
+            if remaining & 1:
+                result = square if result is None else self.emit('mul', self.function.new_temp(), [result, square])
+            remaining >>= 1
+            if not remaining:
+                return result if result is not None else Const(1)
+            square = self.emit('mul', self.function.new_temp(), [square, square])
+
+    def true_division(self, line):
+        # Python's / always gives a float, even for integers that divide evenly
+        self.error("'/' gives a float, which compiled code cannot represent", line)
+        return Const(0)
+
+    def binary(self, operator, left, right, dest=None):
+        if dest is None:
+            dest = self.function.new_temp()
+        if operator in BINARY_OPS:
+            return self.emit(BINARY_OPS[operator], dest, [left, right])
+        if operator in COMPARISONS:
+            return self.emit(operator, dest, [left, right])
+        raise ValueError(f"Unknown binary operator: {operator!r}")
+
+    def visit_FunctionCallNode(self, node):
+        arguments = [self.value(argument) for argument in node.arguments]
+        self.store_globals(self.shared_globals)
+        return self.emit('call', self.function.new_temp(), arguments, node.function_name)
+
+    def visit_AssignmentNode(self, node):
+        target = self.function.variable(node.identifier.name)
+        expression = node.expression
+        if isinstance(expression, BinaryOpNode) and (expression.operator in BINARY_OPS or expression.operator in COMPARISONS):
+            # Write the last operation straight into the variable
+            left = self.value(expression.left)
+            right = self.value(expression.right)
+            self.binary(expression.operator, left, right, target)
+        else:
+            self.emit('copy', target, [self.value(expression)])
+
+    def visit_AugmentedAssignmentNode(self, node):
+        target = self.function.variable(node.identifier.name)
+        operator = AUGMENTED_OPERATORS[node.operator]
+        value = self.value(node.expression)
+        if operator == '/':
+            self.true_division(node.line)
+            return
+        self.binary(operator, target, value, target)
+
+    def visit_PrintNode(self, node):
+        # Values are separated by spaces and followed by a newline, as in
+        # Python. All of them are computed before anything is printed, since a
+        # call among them may print too.
+        values = [None if isinstance(param, StringNode) else self.value(param) for param in node.parameters]
+        if not values:
+            self.emit('print_text', name='\n')
+        for index, (param, value) in enumerate(zip(node.parameters, values)):
+            end = '\n' if index == len(values) - 1 else ' '
+            if isinstance(param, StringNode):
+                self.emit('print_text', name=string_value(param.value) + end)
+            else:
+                self.emit('print', args=[value], name=end)
+
+    def visit_ReturnNode(self, node):
+        value = self.value(node.value) if node.value is not None else Const(0)
+        self.terminate('return', args=[value])
+
+    def branch(self, condition, if_true, if_false):
+        if isinstance(condition, BinaryOpNode) and condition.operator in COMPARISONS:
+            left = self.value(condition.left)
+            right = self.value(condition.right)
+            self.terminate('branch', [left, right], condition.operator, (if_true, if_false))
+        else:
+            self.terminate('branch', [self.value(condition), Const(0)], '!=', (if_true, if_false))
+
+    def visit_IfNode(self, node):
+        then_block = self.detached_block()
+        elif_block = self.detached_block() if node.elif_condition else None
+        else_block = self.detached_block() if node.else_block else None
+        end_block = self.detached_block()
+
+        self.branch(node.condition, then_block, elif_block or else_block or end_block)
+        self.start_block(then_block)
+        self.lower_block(node.block)
+        self.terminate('jump', targets=(end_block,))
+
+        if elif_block is not None:
+            elif_body = self.detached_block()
+            self.start_block(elif_block)
+            self.branch(node.elif_condition, elif_body, else_block or end_block)
+            self.start_block(elif_body)
+            self.lower_block(node.elif_block)
+            self.terminate('jump', targets=(end_block,))
+
+        if else_block is not None:
+            self.start_block(else_block)
+            self.lower_block(node.else_block)
+            self.terminate('jump', targets=(end_block,))
+
+        self.start_block(end_block)
+
+    def visit_WhileNode(self, node):
+        header = self.detached_block()
+        body = self.detached_block()
+        exit_block = self.detached_block()
+
+        self.terminate('jump', targets=(header,))
+        self.start_block(header)
+        self.branch(node.condition, body, exit_block)
+        self.start_block(body)
+        self.lower_block(node.block)
+        self.terminate('jump', targets=(header,))
+        self.start_block(exit_block)
+
+    def visit_ForNode(self, node):
+        if isinstance(node.collection, RangeNode):
+            return self.lower_range_loop(node)
+        header = self.detached_block()
+        body = self.detached_block()
+        exit_block = self.detached_block()
+
+        collection = self.value(node.collection)
+        counter = self.emit('copy', self.function.new_temp(), [Const(0)])
+        self.terminate('jump', targets=(header,))
+
+        self.start_block(header)
+        length = self.emit('len', self.function.new_temp(), [collection])
+        self.terminate('branch', [counter, length], '<', (body, exit_block))
+
+        self.start_block(body)
+        self.emit('index', self.function.variable(node.variable.name), [collection, counter])
+        self.lower_block(node.block)
+        self.emit('add', counter, [counter, Const(1)])
+        self.terminate('jump', targets=(header,))
+        self.start_block(exit_block)
+
+    def lower_range_loop(self, node):
+        # A counter in a temporary runs from start to stop, so the loop needs
+        # no array and one compare and branch per iteration. Bounds and step
+        # are evaluated once, like Python does, and the loop variable gets a
+        # copy of the counter, so assigning to it in the body does not change
+        # the iteration.
+        loop_range = node.collection
+        start = self.value(loop_range.start) if loop_range.start is not None else Const(0)
+        counter = self.emit('copy', self.function.new_temp(), [start])
+        stop = self.loop_bound(loop_range.stop)
+        step = self.loop_bound(loop_range.step) if loop_range.step is not None else Const(1)
+
+        header = self.detached_block()
+        body = self.detached_block()
+        exit_block = self.detached_block()
+
+        self.terminate('jump', targets=(header,))
+
+        self.start_block(header)
+        if isinstance(step, Const):
+            self.terminate('branch', [counter, stop], '<' if step.value > 0 else '>', (body, exit_block))
+        else:
+            # The direction is only known at run time
+            counting_up = self.detached_block()
+            counting_down = self.detached_block()
+            self.terminate('branch', [step, Const(0)], '>', (counting_up, counting_down))
+            self.start_block(counting_up)
+            self.terminate('branch', [counter, stop], '<', (body, exit_block))
+            self.start_block(counting_down)
+            self.terminate('branch', [counter, stop], '>', (body, exit_block))
+
+        self.start_block(body)
+        self.emit('copy', self.function.variable(node.variable.name), [counter])
+        self.lower_block(node.block)
+        self.emit('add', counter, [counter, step])
+        self.terminate('jump', targets=(header,))
+        self.start_block(exit_block)
+
+    def loop_bound(self, node):
+        # A range bound, copied so the body cannot change it
+        bound = self.value(node)
+        if not isinstance(bound, Var):
+            return bound
+        return self.emit('copy', self.function.new_temp(), [bound])
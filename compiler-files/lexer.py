@@ -1,7 +1,273 @@
+import mmap
+import os
 import re
+from array import array
+from bisect import bisect_right
+from collections import deque
+
+from tracing import NO_TRACE
+
+# Token kinds are small integers so the parser can compare them directly.
+# TOKEN_TYPES maps a kind back to its name.
+TOKEN_TYPES = (
+    'DEF', 'MAIN', 'IF', 'FOR', 'ELSE', 'ELIF', 'WHILE', 'PRINT', 'NONE', 'TRUE', 'FALSE', 'IN', 'RANGE', 'RETURN',
+    'COMMENT', 'STRING', 'FSTRING', 'COMMA',
+    'PLUS_ASSIGN', 'MINUS_ASSIGN', 'TIMES_ASSIGN', 'DIVIDE_ASSIGN',
+    'PLUS', 'MINUS', 'EXP', 'MULT', 'DIV', 'MOD',
+    'EQ', 'NEQ', 'LTE', 'GTE', 'LT', 'GT',
+    'ASSIGN',
+    'LPAREN', 'RPAREN', 'COLON', 'LBRACK', 'RBRACK',
+    'IDENTIFIER', 'FLOAT', 'NUMBER',
+    'NEWLINE', 'WHITESPACE',
+    'INDENT', 'DEDENT',
+)
+TOKEN_KIND = {name: kind for kind, name in enumerate(TOKEN_TYPES)}
+
+(T_DEF, T_MAIN, T_IF, T_FOR, T_ELSE, T_ELIF, T_WHILE, T_PRINT, T_NONE, T_TRUE, T_FALSE, T_IN, T_RANGE, T_RETURN,
+ T_COMMENT, T_STRING, T_FSTRING, T_COMMA,
+ T_PLUS_ASSIGN, T_MINUS_ASSIGN, T_TIMES_ASSIGN, T_DIVIDE_ASSIGN,
+ T_PLUS, T_MINUS, T_EXP, T_MULT, T_DIV, T_MOD,
+ T_EQ, T_NEQ, T_LTE, T_GTE, T_LT, T_GT,
+ T_ASSIGN,
+ T_LPAREN, T_RPAREN, T_COLON, T_LBRACK, T_RBRACK,
+ T_IDENTIFIER, T_FLOAT, T_NUMBER,
+ T_NEWLINE, T_WHITESPACE,
+ T_INDENT, T_DEDENT) = range(len(TOKEN_TYPES))
+
+# Operators and punctuation for the table-driven scanner, keyed by first byte.
+# Each entry holds the one-byte kind (None if the byte alone is not a token) and
+# the two-byte kinds keyed by second byte, which are preferred as the longer match.
+OPERATOR_TABLE = {
+    ord('+'): (T_PLUS, {ord('='): T_PLUS_ASSIGN}),
+    ord('-'): (T_MINUS, {ord('='): T_MINUS_ASSIGN}),
+    ord('*'): (T_MULT, {ord('*'): T_EXP, ord('='): T_TIMES_ASSIGN}),
+    ord('/'): (T_DIV, {ord('='): T_DIVIDE_ASSIGN}),
+    ord('%'): (T_MOD, {}),
+    ord('='): (T_ASSIGN, {ord('='): T_EQ}),
+    ord('!'): (None, {ord('='): T_NEQ}),
+    ord('<'): (T_LT, {ord('='): T_LTE}),
+    ord('>'): (T_GT, {ord('='): T_GTE}),
+    ord('('): (T_LPAREN, {}),
+    ord(')'): (T_RPAREN, {}),
+    ord(':'): (T_COLON, {}),
+    ord('['): (T_LBRACK, {}),
+    ord(']'): (T_RBRACK, {}),
+    ord(','): (T_COMMA, {}),
+}
+
+# Character classes for the first-byte dispatch table
+CHAR_SKIP, CHAR_SPACE, CHAR_NEWLINE, CHAR_NAME, CHAR_DIGIT, CHAR_QUOTE, CHAR_COMMENT, CHAR_OPERATOR = range(8)
+
+ENGINES = ('regex', 'table')
+
+UNINDENT_MISMATCH = "Unindent does not match any outer indentation level"
+
+
+class LineIndex:
+    # Byte offset where each line starts, found in one scan over the source.
+    # Offsets map to a line and column by binary search, so diagnostics need no
+    # line number stored per token.
+    def __init__(self, buffer):
+        self.starts = array('Q', [0])
+        find = buffer.find
+        position = find(b'\n')
+        while position != -1:
+            self.starts.append(position + 1)
+            position = find(b'\n', position + 1)
+        self.size = len(buffer)
+
+    def line(self, offset):
+        return bisect_right(self.starts, offset)
+
+    def position(self, offset):
+        # (line, column), both counted from 1; columns are in bytes
+        line = bisect_right(self.starts, offset)
+        return line, offset - self.starts[line - 1] + 1
+
+    def line_count(self):
+        # A final line without a newline still counts, an empty one after it does not
+        return len(self.starts) - (1 if self.starts[-1] == self.size else 0)
+
+
+class TokenStream:
+    # Tokens stored column-wise: one byte per kind and unsigned ints for the
+    # byte span of each token. Lexemes are only decoded from the source buffer
+    # when value() asks for them, and lines and columns come from a LineIndex
+    # built the first time one is needed.
+    def __init__(self, source):
+        self.source = source
+        self.buffer = memoryview(source)
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.line_index = None
+        self.errors = []  # (line, message) for indentation errors found while lexing
+
+    def append(self, kind, start, end):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def lines(self):
+        if self.line_index is None:
+            self.line_index = LineIndex(self.source)
+        return self.line_index
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def kind(self, index):
+        return self.kinds[index] if index < len(self.kinds) else None
+
+    def value(self, index):
+        return str(self.buffer[self.starts[index]:self.ends[index]], 'utf-8')
+
+    def line(self, index):
+        return self.lines().line(self.starts[index])
+
+    def column(self, index):
+        return self.lines().position(self.starts[index])[1]
+
+    def token(self, index):
+        if index >= len(self.kinds):
+            return None
+        return (TOKEN_TYPES[self.kinds[index]], self.value(index), self.line(index))
+
+    def __getitem__(self, index):
+        return self.token(index)
+
+    def __iter__(self):
+        for index in range(len(self.kinds)):
+            yield self.token(index)
+
+    def __getstate__(self):
+        # A memoryview cannot be pickled and neither can a mapped file, so the
+        # source is saved as bytes and the view rebuilt on load
+        state = {name: getattr(self, name) for name in ('kinds', 'starts', 'ends', 'line_index', 'errors')}
+        state['source'] = bytes(self.source)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.buffer = memoryview(self.source)
+
+
+class TokenList:
+    # Same interface as TokenStream over a list of (type, value, line) tuples
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.kinds = array('B', [TOKEN_KIND[token[0]] for token in tokens])
+        self.errors = []
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def kind(self, index):
+        return self.kinds[index] if index < len(self.kinds) else None
+
+    def value(self, index):
+        return self.tokens[index][1]
+
+    def line(self, index):
+        return self.tokens[index][2]
+
+    def column(self, index):
+        return None  # Plain tuples carry no offsets
+
+    def token(self, index):
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def __getitem__(self, index):
+        return self.tokens[index]
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+
+class TokenWindow:
+    # Same interface as TokenStream over a lazy (kind, start, end) iterator.
+    # Only the last `size` tokens are kept, so the parser can overlap with the
+    # lexer and never holds the whole token list; it may look at most `size`
+    # tokens ahead of the oldest one it still needs.
+    def __init__(self, tokens, source, size=8, errors=None):
+        self.tokens = iter(tokens)
+        self.errors = errors if errors is not None else []  # Filled in as the lexer gets to them
+        self.source = source
+        self.buffer = memoryview(source)
+        self.window = deque()
+        self.base = 0
+        self.size = size
+        self.exhausted = False
+        self.line_index = None
+
+    def lines(self):
+        if self.line_index is None:
+            self.line_index = LineIndex(self.source)
+        return self.line_index
+
+    def fetch(self, index):
+        # Returns (kind, start, end) or None past the end of input
+        offset = index - self.base
+        window = self.window
+        while offset >= len(window):
+            if self.exhausted:
+                return None
+            try:
+                window.append(next(self.tokens))
+            except StopIteration:
+                self.exhausted = True
+                return None
+            if len(window) > self.size:
+                window.popleft()
+                self.base += 1
+                offset -= 1
+        if offset < 0:
+            raise IndexError(f"Token {index} has already left the lookahead window")
+        return window[offset]
+
+    def kind(self, index):
+        entry = self.fetch(index)
+        return entry[0] if entry is not None else None
+
+    def value(self, index):
+        entry = self.fetch(index)
+        return str(self.buffer[entry[1]:entry[2]], 'utf-8')
+
+    def line(self, index):
+        return self.lines().line(self.fetch(index)[1])
+
+    def column(self, index):
+        return self.lines().position(self.fetch(index)[1])[1]
+
+    def token(self, index):
+        entry = self.fetch(index)
+        if entry is None:
+            return None
+        return (TOKEN_TYPES[entry[0]], str(self.buffer[entry[1]:entry[2]], 'utf-8'), self.lines().line(entry[1]))
+
+
+def source_buffer(code):
+    # The scanners work on bytes so token spans can be sliced out of a memoryview
+    if isinstance(code, str):
+        return code.encode('utf-8')
+    return code
+
+
+def map_source(path):
+    # Maps a source file read-only so it is lexed straight from the page cache
+    # instead of being read into a str first. An empty file cannot be mapped.
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
 
 class LexicalAnalyzer:
-    def __init__(self):
+    def __init__(self, engine='regex', tracer=NO_TRACE):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown lexer engine: {engine!r} (expected one of {', '.join(ENGINES)})")
+        self.engine = engine
+        self.trace = tracer
         self.token_rules = [
             # Reserved keywords
             ('DEF', r'\bdef\b'),
@@ -45,10 +311,10 @@ class LexicalAnalyzer:
             # Comparison operators
             ('EQ', r'=='),
             ('NEQ', r'!='),
+            ('LTE', r'<='),  # Two-character operators must be tried before '<' and '>'
+            ('GTE', r'>='),
             ('LT', r'<'),
             ('GT', r'>'),
-            ('LTE', r'<='),
-            ('GTE', r'>='),
 
             # Assignment
             ('ASSIGN', r'='),
@@ -62,60 +328,201 @@ class LexicalAnalyzer:
                 
             # Identifiers and numbers
             ('IDENTIFIER', r'[a-zA-Z_][a-zA-Z0-9_]*'), # Since identifiers can be anything, we have rules saying the identifier can be a-z or A-Z with underscores. Note that the first character can not be a digit, which is why we have two brackets, the second one using * to denote that we can have 'zero or more' occurrences
+            ('FLOAT', r'\d+\.\d+'),  # Must come before NUMBER, otherwise '1.5' lexes as NUMBER '1' followed by NUMBER '5'
             ('NUMBER', r'\d+'),  # \d in regex means "string contains digits", so this means one or more occurrences of a digit
-            ('FLOAT', r'\d+\.\d+'),    
                 
-            # Whitespace (skip these characters)
-            ('INDENT', r'   '),
+            # Whitespace (skip these characters). Indentation is measured by
+            # tokenize() itself, so leading spaces are just whitespace here.
             ('NEWLINE', r'\n'),
-            ('WHITESPACE', r'\s+'),
+            ('WHITESPACE', r'[ \t\r\f\v]+'),
         ]
 
         self.token_regex = '|'.join(f'(?P<{name}>{pattern})' for name, pattern in self.token_rules)
-    
-    def tokenize(self, code):
-        tokens = []
-        line_number = 1
-        prev_level = 0
-        current_indent = 0
+        self.token_pattern = re.compile(self.token_regex.encode('ascii'), re.ASCII)
+        # Regex group number -> token kind, looked up through match.lastindex
+        self.group_kinds = [None] * (self.token_pattern.groups + 1)
+        for name, group in self.token_pattern.groupindex.items():
+            self.group_kinds[group] = TOKEN_KIND[name]
 
-        for token in re.finditer(self.token_regex, code):
-            token_type = token.lastgroup
-            token_value = token.group()
+        # Tables for the table-driven scanner
+        self.keywords = {}
+        for name, pattern in self.token_rules:
+            if pattern.startswith(r'\b'):
+                self.keywords[pattern[2:-2].encode('ascii')] = TOKEN_KIND[name]
 
-            if token_type in {'WHITESPACE'}:
-                continue
+        self.char_classes = [CHAR_SKIP] * 256
+        for ch in b' \t\r\f\v':
+            self.char_classes[ch] = CHAR_SPACE
+        self.char_classes[ord('\n')] = CHAR_NEWLINE
+        for ch in b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_':
+            self.char_classes[ch] = CHAR_NAME
+        for ch in b'0123456789':
+            self.char_classes[ch] = CHAR_DIGIT
+        self.char_classes[ord('"')] = CHAR_QUOTE
+        self.char_classes[ord("'")] = CHAR_QUOTE
+        self.char_classes[ord('#')] = CHAR_COMMENT
+        for ch in OPERATOR_TABLE:
+            self.char_classes[ch] = CHAR_OPERATOR
 
-            if token_type in {'INDENT'}:
-                current_indent += 1
-                tokens.append((token_type, token_value, line_number))
-            elif token_type in {'NEWLINE'}:
-                tokens.append((token_type, token_value, line_number))
-                print(line_number)
-                print(f"Previous indent level: {prev_level}")
-                print(f"Current indent level: {current_indent}")
-                
+        self.name_pattern = re.compile(rb'[a-zA-Z0-9_]*')
+        self.number_pattern = re.compile(rb'[0-9]+(\.[0-9]+)?')
+        self.space_pattern = re.compile(rb'[ \t\r\f\v]*')
+
+    def scan(self, buffer):
+        # Yields raw (kind, start, end) triples over a bytes-like buffer, without indentation handling
+        if self.engine == 'table':
+            return self.scan_table(buffer)
+        return self.scan_regex(buffer)
+
+    def scan_regex(self, buffer):
+        group_kinds = self.group_kinds
+        for token in self.token_pattern.finditer(buffer):
+            yield (group_kinds[token.lastindex], token.start(), token.end())
 
-                if current_indent < prev_level:
-                    tokens_copy = tokens[:]
-                    newline_seen = False   
+    def scan_table(self, buffer):
+        char_classes = self.char_classes
+        keywords = self.keywords
+        name_match = self.name_pattern.match
+        number_match = self.number_pattern.match
+        space_match = self.space_pattern.match
+        length = len(buffer)
+        pos = 0
 
-                    for i in range(len(tokens_copy) - 1, -1, -1):
-                        if tokens_copy[i][0] == 'NEWLINE':
-                            if not newline_seen:
-                                newline_seen = True
-                                continue
-                            tokens.insert(i + 1, ('DEDENT', '', tokens_copy[i][2]+1))
-                            break
+        while pos < length:
+            ch = buffer[pos]
+            char_class = char_classes[ch]
 
-                prev_level = current_indent
-                current_indent = 0
-                line_number += 1 
+            if char_class == CHAR_SPACE:
+                end = space_match(buffer, pos + 1).end()
+                yield (T_WHITESPACE, pos, end)
+                pos = end
+
+            elif char_class == CHAR_NAME:
+                if ch == 0x66 and pos + 1 < length and buffer[pos + 1] == 0x22:  # f"
+                    close = buffer.find(b'"', pos + 2)
+                    if close != -1:
+                        yield (T_FSTRING, pos, close + 1)
+                        pos = close + 1
+                        continue
+                end = name_match(buffer, pos + 1).end()
+                kind = keywords.get(buffer[pos:end], T_IDENTIFIER)
+                # Keywords need a word boundary on the left, which a preceding digit breaks
+                if kind != T_IDENTIFIER and pos and char_classes[buffer[pos - 1]] == CHAR_DIGIT:
+                    kind = T_IDENTIFIER
+                yield (kind, pos, end)
+                pos = end
+
+            elif char_class == CHAR_NEWLINE:
+                yield (T_NEWLINE, pos, pos + 1)
+                pos += 1
+
+            elif char_class == CHAR_OPERATOR:
+                single, double = OPERATOR_TABLE[ch]
+                if double and pos + 1 < length and buffer[pos + 1] in double:
+                    yield (double[buffer[pos + 1]], pos, pos + 2)
+                    pos += 2
+                elif single is not None:
+                    yield (single, pos, pos + 1)
+                    pos += 1
+                else:
+                    pos += 1  # Lone '!' is not a token
+
+            elif char_class == CHAR_DIGIT:
+                number = number_match(buffer, pos)
+                yield (T_FLOAT if number.group(1) else T_NUMBER, pos, number.end())
+                pos = number.end()
+
+            elif char_class == CHAR_QUOTE:
+                close = buffer.find(b'"' if ch == 0x22 else b"'", pos + 1)
+                if close == -1:
+                    pos += 1  # Unterminated string, skip the quote like the regex engine does
+                else:
+                    yield (T_STRING, pos, close + 1)
+                    pos = close + 1
+
+            elif char_class == CHAR_COMMENT:
+                end = buffer.find(b'\n', pos)
+                if end == -1:
+                    end = length
+                yield (T_COMMENT, pos, end)
+                pos = end
 
             else:
-                tokens.append((token_type, token_value, line_number))
+                pos += 1  # Characters no rule matches are skipped
+
+    def lex(self, buffer, errors=None):
+        # Single forward pass yielding (kind, start, end) tuples.
+        # Indentation is tracked with a stack of column widths and INDENT/DEDENT
+        # tokens are yielded as soon as the first real token of a line is seen.
+        # Blank and comment-only lines never change the indentation level.
+        # An unindent to a column no enclosing block starts at is recorded in
+        # errors as (line, message), or raised as IndentationError without it.
+        # Lines are not counted as tokens go by; the few places that need one
+        # look it up in a LineIndex built the first time.
+        indent_stack = [0]
+        line_start = 0
+        at_line_start = True
+        lines = None
+
+        for kind, start, end in self.scan(buffer):
+            if kind == T_WHITESPACE:
+                continue
+
+            if kind == T_NEWLINE:
+                yield (kind, start, end)
+                line_start = end
+                at_line_start = True
+                continue
+
+            if at_line_start:
+                at_line_start = False
+                if kind != T_COMMENT:
+                    width = len(bytes(buffer[line_start:start]).expandtabs(8))
+                    previous_level = len(indent_stack) - 1
+
+                    if width > indent_stack[-1]:
+                        indent_stack.append(width)
+                        yield (T_INDENT, line_start, start)
+                    else:
+                        while width < indent_stack[-1]:
+                            indent_stack.pop()
+                            yield (T_DEDENT, start, start)
+                        if width > indent_stack[-1]:
+                            # Python rejects this; the line stays in the enclosing block
+                            lines = lines or LineIndex(buffer)
+                            if errors is None:
+                                raise IndentationError(f"Line {lines.line(start)}: {UNINDENT_MISMATCH}")
+                            errors.append((lines.line(start), UNINDENT_MISMATCH))
+
+                    if self.trace.lex and len(indent_stack) - 1 != previous_level:
+                        lines = lines or LineIndex(buffer)
+                        self.trace.emit('lex', 'indent', (lines.line(start), previous_level, len(indent_stack) - 1))
+
+            yield (kind, start, end)
+
+        # Close every block that is still open at end of input
+        end = len(buffer)
+        while len(indent_stack) > 1:
+            indent_stack.pop()
+            yield (T_DEDENT, end, end)
+
+    def tokenize(self, code):
+        # Yields (type, value, line) tuples
+        buffer = source_buffer(code)
+        lines = LineIndex(buffer)
+        for kind, start, end in self.lex(buffer):
+            yield (TOKEN_TYPES[kind], str(buffer[start:end], 'utf-8'), lines.line(start))
 
-        while prev_level > 0:
-            prev_level -= 1
+    def tokenize_stream(self, code):
+        buffer = source_buffer(code)
+        stream = TokenStream(buffer)
+        append = stream.append
+        for kind, start, end in self.lex(buffer, stream.errors):
+            append(kind, start, end)
+        return stream
 
-        return tokens
+    def tokenize_lazy(self, code, lookahead=8):
+        # Tokens are produced on demand as the parser asks for them
+        buffer = source_buffer(code)
+        errors = []
+        return TokenWindow(self.lex(buffer, errors), buffer, lookahead, errors)
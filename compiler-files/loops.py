@@ -0,0 +1,321 @@
+from ir import Const, Instruction, BasicBlock, dominators, dominates
+from constants import COMPARE, wrap
+from deadcode import has_side_effects, liveness
+
+# Loop optimizations over the IR: loop-invariant code motion, strength
+# reduction of induction variables and full unrolling of short counted loops.
+#
+# Loops are natural loops found from the back edges of the dominator tree. Code
+# moved out of a loop goes into a preheader, a block inserted in front of the
+# header that every entry into the loop passes through.
+
+# Operations that only compute their result from their operands
+PURE_OPERATIONS = frozenset(('copy', 'neg', 'add', 'sub', 'mul', 'div', 'mod', '<', '>', '<=', '>=', '==', '!='))
+# Longest loop loop-unroll will unroll, in iterations and in instructions
+UNROLL_TRIP_LIMIT = 8
+UNROLL_SIZE_LIMIT = 64
+
+
+class Loop:
+    def __init__(self, header):
+        self.header = header
+        self.blocks = {header}
+        self.preheader = None
+        self.parent = None  # The innermost loop around this one
+
+    def exits(self):
+        # (block in the loop, block outside it) for every edge leaving the loop
+        return [(block, successor) for block in self.blocks for successor in block.successors()
+                if successor not in self.blocks]
+
+
+def find_loops(function, idom):
+    # Natural loops, innermost first; back edges to the same header share a loop
+    predecessors = function.predecessors()
+    loops = {}
+    for block in function.reverse_postorder():
+        for successor in block.successors():
+            if successor in idom and dominates(successor, block, idom):
+                loop = loops.setdefault(successor, Loop(successor))
+                pending = [block]
+                while pending:
+                    member = pending.pop()
+                    if member not in loop.blocks:
+                        loop.blocks.add(member)
+                        # Unreachable blocks that jump into the loop are not part of it
+                        pending.extend(predecessor for predecessor in predecessors[member] if predecessor in idom)
+    ordered = sorted(loops.values(), key=lambda loop: len(loop.blocks))
+    # The first loop met that holds another loop's header is the smallest around it
+    for loop in ordered:
+        for block in loop.blocks:
+            inner = loops.get(block)
+            if inner is not None and inner is not loop and inner.parent is None:
+                inner.parent = loop
+    return ordered
+
+
+def ensure_preheader(function, loop, idom, predecessors):
+    # Insert a block in front of the header that takes over every edge into
+    # the loop from outside, keeping the enclosing loops, idom and
+    # predecessors up to date
+    if loop.preheader is not None:
+        return loop.preheader
+    function.block_counter += 1
+    preheader = BasicBlock(f"B{function.block_counter}")
+    preheader.terminator = Instruction('jump', targets=(loop.header,))
+    entries = [block for block in dict.fromkeys(predecessors[loop.header]) if block not in loop.blocks]
+    for block in entries:
+        block.terminator.targets = tuple(preheader if target is loop.header else target
+                                         for target in block.terminator.targets)
+    predecessors[preheader] = entries
+    predecessors[loop.header] = [block for block in predecessors[loop.header] if block in loop.blocks] + [preheader]
+    function.blocks.insert(function.blocks.index(loop.header), preheader)
+    outer = loop.parent
+    while outer is not None:
+        outer.blocks.add(preheader)
+        outer = outer.parent
+    idom[preheader] = idom[loop.header]
+    idom[loop.header] = preheader
+    loop.preheader = preheader
+    return preheader
+
+
+def dominator_tree_ranges(idom):
+    # Block -> (first, last) numbers of its subtree in a walk of the dominator
+    # tree, so first dominates second when first's range holds second's
+    children = {}
+    root = None
+    for block, parent in idom.items():
+        if parent is block:
+            root = block
+        else:
+            children.setdefault(parent, []).append(block)
+    ranges = {}
+    counter = 0
+    stack = [(root, False)]
+    while stack:
+        block, done = stack.pop()
+        if done:
+            ranges[block] = (ranges[block], counter)
+            continue
+        counter += 1
+        ranges[block] = counter
+        stack.append((block, True))
+        stack.extend((child, False) for child in children.get(block, ()))
+    return ranges
+
+
+def definitions(loop):
+    # Value -> the instructions in the loop that write it
+    written = {}
+    for block in loop.blocks:
+        for instruction in block.instructions:
+            if instruction.dest is not None:
+                written.setdefault(instruction.dest, []).append(instruction)
+    return written
+
+
+def hoist_loop_invariants(module):
+    # Move computations whose operands do not change inside a loop into its
+    # preheader. An instruction moves when it is pure and cannot trap, it is
+    # the only write to its result in the loop, the loop never reads the old
+    # value of the result, and the result is either dead where the loop exits
+    # or computed on every path to those exits. Inner loops go first, so code
+    # can move out of several loops in turn.
+    #
+    # Dominators, liveness and the block order are worked out once for each
+    # function, and each loop is walked once in reverse postorder: an operand
+    # written in the loop is then always seen before its readers, since one
+    # read first would make it live into the header and so not movable.
+    for function in module.all_functions():
+        idom = dominators(function)
+        loops = find_loops(function, idom)
+        if not loops:
+            continue
+        live_in, _live_out = liveness(function)
+        predecessors = function.predecessors()
+        position = {block: index for index, block in enumerate(function.reverse_postorder())}
+        ranges = dominator_tree_ranges(idom)
+        for loop in loops:
+            written = definitions(loop)
+            exits = [(ranges[exiting][0], target) for exiting, target in loop.exits()]
+            header_live = live_in.get(loop.header, ())
+            hoisted = set()
+            for block in sorted(loop.blocks, key=position.get):
+                # Exits this block does not dominate, where a moved result must be dead
+                first, last = ranges[block]
+                undominated = [target for exiting, target in exits if not first <= exiting <= last]
+                for instruction in block.instructions:
+                    if not is_invariant(instruction, written, hoisted):
+                        continue
+                    dest = instruction.dest
+                    if dest in header_live or any(dest in live_in.get(target, ()) for target in undominated):
+                        continue
+                    hoisted.add(instruction)
+            if hoisted:
+                preheader = ensure_preheader(function, loop, idom, predecessors)
+                # Moved code stays in the order it ran in, ahead of the header
+                position[preheader] = position[loop.header] - 0.5
+                # A preheader dominates what its header does, and no exit is a preheader
+                ranges[preheader] = ranges[loop.header]
+                # For the exit checks of enclosing loops a new preheader has the
+                # same live values as its header
+                live_in.setdefault(preheader, header_live)
+                for block in sorted(loop.blocks, key=position.get):
+                    kept = []
+                    for instruction in block.instructions:
+                        (preheader.instructions if instruction in hoisted else kept).append(instruction)
+                    block.instructions = kept
+
+
+def is_invariant(instruction, written, hoisted):
+    if instruction.op not in PURE_OPERATIONS or has_side_effects(instruction):
+        return False
+    if len(written.get(instruction.dest, ())) != 1:
+        return False
+    for arg in instruction.args:
+        if isinstance(arg, Const) or arg is None:
+            continue
+        definitions = written.get(arg)
+        if definitions and not (len(definitions) == 1 and definitions[0] in hoisted):
+            return False
+    return True
+
+
+def induction_step(instruction, value):
+    # The constant a basic induction variable changes by, if instruction is
+    # value = value +/- constant
+    if instruction.op == 'add':
+        left, right = instruction.args
+        if left is value and isinstance(right, Const):
+            return right.value
+        if right is value and isinstance(left, Const):
+            return left.value
+    elif instruction.op == 'sub':
+        left, right = instruction.args
+        if left is value and isinstance(right, Const):
+            return -right.value
+    return None
+
+
+def reduce_strength(module):
+    # Replace t = i * k, where i is a basic induction variable (changed only
+    # by i = i + c in the loop) and k is a constant, with a new variable s that
+    # starts at i * k in the preheader and grows by c * k wherever i changes
+    for function in module.all_functions():
+        idom = dominators(function)
+        loops = find_loops(function, idom)
+        predecessors = function.predecessors()
+        for loop in loops:
+            written = definitions(loop)
+            steps = {}
+            for value, writes in written.items():
+                if len(writes) == 1:
+                    step = induction_step(writes[0], value)
+                    if step is not None:
+                        steps[value] = (writes[0], step)
+            reduced = {}  # (induction variable, factor) -> s
+            for block in loop.blocks:
+                # The increments go into the blocks being walked, so walk a copy
+                for instruction in list(block.instructions):
+                    if instruction.op != 'mul' or len(written.get(instruction.dest, ())) != 1:
+                        continue
+                    left, right = instruction.args
+                    if left in steps and isinstance(right, Const):
+                        variable, factor = left, right.value
+                    elif right in steps and isinstance(left, Const):
+                        variable, factor = right, left.value
+                    else:
+                        continue
+                    if instruction.dest is variable:
+                        continue
+                    key = (variable, factor)
+                    if key not in reduced:
+                        scaled = function.new_temp()
+                        update, step = steps[variable]
+                        ensure_preheader(function, loop, idom, predecessors).instructions.append(
+                            Instruction('mul', scaled, [variable, Const(factor)]))
+                        increment = Instruction('add', scaled, [scaled, Const(wrap(step * factor))])
+                        for owner in loop.blocks:
+                            if update in owner.instructions:
+                                owner.instructions.insert(owner.instructions.index(update) + 1, increment)
+                        reduced[key] = scaled
+                    block.instructions[block.instructions.index(instruction)] = Instruction('copy', instruction.dest, [reduced[key]])
+
+
+def copy_instruction(instruction):
+    return Instruction(instruction.op, instruction.dest, instruction.args, instruction.name, instruction.targets)
+
+
+def trip_count(start, step, compare, bound, counter_on_left):
+    # Iterations of a loop whose counter starts at start and changes by step,
+    # or None if it runs longer than the unroll limit
+    value = start
+    for trips in range(UNROLL_TRIP_LIMIT + 1):
+        left, right = (value, bound) if counter_on_left else (bound, value)
+        if not COMPARE[compare](left, right):
+            return trips
+        value = wrap(value + step)
+    return None
+
+
+def initial_value(block, variable):
+    # The constant the last write to variable in block stores, if it is one
+    for instruction in reversed(block.instructions):
+        if instruction.dest is variable:
+            if instruction.op == 'copy' and isinstance(instruction.args[0], Const):
+                return instruction.args[0].value
+            return None
+    return None
+
+
+def unroll_loops(module):
+    # Fully unroll loops of one header and one body block whose counter starts
+    # at a constant, moves by a constant step and is compared with a constant,
+    # when they run at most UNROLL_TRIP_LIMIT times and the unrolled code stays
+    # within UNROLL_SIZE_LIMIT instructions
+    for function in module.all_functions():
+        idom = dominators(function)
+        predecessors = function.predecessors()
+        for loop in find_loops(function, idom):
+            header = loop.header
+            if len(loop.blocks) != 2 or header.terminator.op != 'branch':
+                continue
+            body = next(block for block in loop.blocks if block is not header)
+            if_true, if_false = header.terminator.targets
+            if if_true is not body or if_false in loop.blocks:
+                continue
+            if body.terminator.op != 'jump' or predecessors[body] != [header]:
+                continue
+            outside = [block for block in predecessors[header] if block is not body]
+            if len(outside) != 1 or outside[0].terminator.op != 'jump':
+                continue
+
+            left, right = header.terminator.args
+            counter_on_left = isinstance(right, Const)
+            counter, bound = (left, right) if counter_on_left else (right, left)
+            if not isinstance(bound, Const) or isinstance(counter, Const) or counter is None:
+                continue
+            writes = definitions(loop).get(counter, [])
+            if len(writes) != 1 or writes[0] not in body.instructions:
+                continue
+            step = induction_step(writes[0], counter)
+            start = initial_value(outside[0], counter)
+            if step is None or start is None:
+                continue
+            trips = trip_count(start, step, header.terminator.name, bound.value, counter_on_left)
+            if trips is None:
+                continue
+            size = (trips + 1) * len(header.instructions) + trips * len(body.instructions)
+            if size > UNROLL_SIZE_LIMIT:
+                continue
+
+            unrolled = []
+            for _iteration in range(trips):
+                unrolled.extend(copy_instruction(instruction) for instruction in header.instructions)
+                unrolled.extend(copy_instruction(instruction) for instruction in body.instructions)
+            unrolled.extend(header.instructions)
+            header.instructions = unrolled
+            header.terminator = Instruction('jump', targets=(if_false,))
+            function.blocks.remove(body)
+            predecessors = function.predecessors()
@@ -1,39 +1,243 @@
-from lexer import LexicalAnalyzer 
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from lexer import LexicalAnalyzer, map_source
 from syntax import Parser
 from generator import CodeGenerator
+from tracing import Tracer, PHASES
+from cache import CompilationCache
+from driver import compile_source
+from batch import run_batch
+from passes import default_pass_manager
+from peephole import PeepholeOptimizer
+from bytecode import compile_program
+from vm import VirtualMachine
+from closures import compile_closures
+from native import NativeGenerator, build_executable
+from stats import CompileStats, profile_call
+from resolver import resolve_names
+from emitter import AssemblyWriter, write_assembly
 
-def main():
-    file_path = '../test-files/basicTestOne.txt'  # Replace with your file path
-    with open(file_path, 'r') as file:
-        code = file.read()
-
-    # Instantiate the lexical analyzer
-    analyzer = LexicalAnalyzer()
-    # Tokenize the provided code
-    tokens = analyzer.tokenize(code)
-
-    # Print the list of tokens
-    print("Tokens:")
-    for token in tokens:
-        print(token)
-
-    # Instantiate the parser with the list of tokens
-    parser = Parser(tokens)
-    
-    # Parse the tokens to create an AST
-    ast, success = parser.parse()
-    print(ast)
-    #print (success)
-    print()
-
-    if success:
-        generator = CodeGenerator()
-    
+DEFAULT_SOURCE = '../test-files/basicTestOne.txt'
+# How --run executes a program that compiled: with Python, on the bytecode VM,
+# as compiled closures, or as an x86-64 executable
+RUNNERS = ('exec', 'vm', 'closure', 'native')
+
+def build_native(ast, passes, output_path):
+    generator = NativeGenerator(passes=passes)
+    try:
         generator.generate_assembly(ast)
-        generator.print_assembly()
-        exec(code)
+        return build_executable(generator.assembly_code, output_path)
+    except ValueError as error:
+        sys.exit(f"Native backend: {error}")
+
+def close_output(file, keep=True):
+    # A file that did not get a whole program is removed, not left empty or
+    # half written
+    if file is not None:
+        file.close()
+        if not keep:
+            os.remove(file.name)
+
+def run_program(code, ast, args, passes):
+    if args.native:
+        build_native(ast, passes, args.native)
+    if args.dump_bytecode:
+        for line in compile_program(ast).disassemble():
+            print(line)
+        print()
+    if args.run == 'vm':
+        VirtualMachine().run(compile_program(ast))
+    elif args.run == 'closure':
+        compile_closures(ast)()
+    elif args.run == 'native':
+        with tempfile.TemporaryDirectory() as directory:
+            executable = build_native(ast, passes, os.path.join(directory, 'program'))
+            sys.stdout.flush()
+            subprocess.run([executable])
+    else:
+        exec(str(code, 'utf-8'))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compile source files to assembly")
+    arg_parser.add_argument('paths', nargs='*', default=[DEFAULT_SOURCE],
+                            help="files, directories or glob patterns; more than one file is compiled as a batch")
+    arg_parser.add_argument('--jobs', '-j', type=int,
+                            help="worker processes for batch compilation (default: one per CPU)")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="parse while lexing through a bounded lookahead window instead of building the full token list")
+    arg_parser.add_argument('--trace', default='',
+                            help=f"comma-separated phases to trace ({', '.join(PHASES)}, or 'all')")
+    arg_parser.add_argument('--quiet', action='store_true',
+                            help="only print the generated assembly and errors, no token or AST dumps")
+    arg_parser.add_argument('--cache-dir',
+                            help="reuse tokens, AST and assembly from this directory when the source is unchanged")
+    arg_parser.add_argument('--passes',
+                            help="comma-separated optimization passes to run, in this order (default: all, in the standard order)")
+    arg_parser.add_argument('--disable-pass', action='append', default=[], metavar='PASS',
+                            help="skip an optimization pass; may be given more than once")
+    arg_parser.add_argument('--enable-pass', action='append', default=[], metavar='PASS',
+                            help="run an optional pass such as loop-unroll; may be given more than once")
+    arg_parser.add_argument('--time-passes', action='store_true',
+                            help="print the time spent in each optimization pass to stderr")
+    arg_parser.add_argument('--disable-peephole', action='append', default=[], metavar='RULE',
+                            help="skip a peephole rule, or 'all' of them; may be given more than once")
+    arg_parser.add_argument('--peephole-stats', action='store_true',
+                            help="print how often each peephole rule fired to stderr")
+    arg_parser.add_argument('--dump-ir', action='store_true',
+                            help="print the intermediate representation after the optimization passes")
+    arg_parser.add_argument('--dump-bytecode', action='store_true',
+                            help="print the bytecode the VM runs")
+    arg_parser.add_argument('--run', choices=RUNNERS, default='exec',
+                            help="how to run the program after compiling it: exec runs the source with Python, vm runs it on the bytecode VM, closure runs it as compiled closures, native builds and runs an x86-64 executable (default: exec)")
+    arg_parser.add_argument('--stats', metavar='FILE',
+                            help="write compile statistics as JSON to FILE, or to stderr for '-': time per phase, token and node counts, instructions and register pressure per function, hottest parser methods")
+    arg_parser.add_argument('--profile', metavar='FILE',
+                            help="run the compile under cProfile and save the pstats dump to FILE")
+    arg_parser.add_argument('--output', '-o', metavar='FILE',
+                            help="write the assembly to FILE as each function is generated, instead of to stdout after the dumps")
+    arg_parser.add_argument('--flush-functions', action='store_true',
+                            help="flush the assembly output after every function, e.g. for a reader on the other end of a pipe")
+    arg_parser.add_argument('--native', metavar='OUTPUT',
+                            help="also build an x86-64 Linux executable at OUTPUT with the native backend, using as and ld")
+    args = arg_parser.parse_args()
+
+    phases = PHASES if args.trace == 'all' else [phase for phase in args.trace.split(',') if phase]
+    try:
+        tracer = Tracer(phases)
+    except ValueError as error:
+        arg_parser.error(str(error))
+
+    try:
+        passes = default_pass_manager(tracer)
+        if args.passes is not None:
+            passes.select([name for name in args.passes.split(',') if name])
+        for names in args.enable_pass:
+            for name in names.split(','):
+                passes.enable(name)
+        for names in args.disable_pass:
+            for name in names.split(','):
+                passes.disable(name)
+        peephole_disabled = [name for names in args.disable_peephole for name in names.split(',')]
+        peephole = PeepholeOptimizer(peephole_disabled)
+    except ValueError as error:
+        arg_parser.error(str(error))
+
+    batch = args.jobs is not None or len(args.paths) > 1 or not os.path.isfile(args.paths[0])
+    if (args.stats or args.profile) and (batch or args.stream):
+        arg_parser.error("--stats and --profile work on a single file compiled without --stream")
+    if args.output and batch:
+        arg_parser.error("--output works on a single file; batch assembly goes to stdout")
+
+    if batch:
+        # Batch mode: assembly goes to stdout in input order, diagnostics and
+        # throughput to stderr
+        failed = run_batch(args.paths, args.jobs, cache_dir=args.cache_dir, pipeline=passes.pipeline(),
+                           peephole_disabled=tuple(peephole_disabled))
+        sys.exit(1 if failed else 0)
+
+    # The lexer reads the mapped file directly; only exec needs it as text
+    code = map_source(args.paths[0])
+    # Assembly is streamed into --output while it is generated. Without it the
+    # stream mode writes straight to stdout, since everything else it prints
+    # comes first, and the default mode prints it after the dumps.
+    if args.stream:
+        # Instantiate the lexical analyzer.
+        # Tokens are pulled by the parser as it needs them, so there is no list to print
+        tokens = LexicalAnalyzer(tracer=tracer).tokenize_lazy(code)
+
+        # Instantiate the parser and parse the tokens to create an AST
+        parser = Parser(tokens, tracer)
+        ast, success = parser.parse()
+        if not args.quiet:
+            print(ast)
+            print()
+        name_errors = resolve_names(ast) if success else []
+
+        if name_errors:
+            print("Name Errors:")
+            for error in name_errors:
+                print(str(error))
+        elif success:
+            generator = CodeGenerator(tracer, passes, peephole)
+            generator.lower_program(ast)
+            if generator.errors:
+                print("Compile Errors:")
+                for error in generator.errors:
+                    print(str(error))
+                return
+            if args.dump_ir:
+                print(generator.module)
+                print()
+            # Only a program that compiles gets an output file
+            output_file = open(args.output, 'wb') if args.output else None
+            generator.output = AssemblyWriter(output_file or sys.stdout, args.flush_functions)
+            emitted = False
+            try:
+                generator.emit_module(generator.module)
+                generator.output.flush()
+                emitted = True
+            finally:
+                close_output(output_file, keep=emitted)
+            if args.time_passes:
+                passes.report()
+            if args.peephole_stats:
+                peephole.report()
+            run_program(code, ast, args, passes)
+        else:
+            parser.print_errors()
+        return
+
+    cache = CompilationCache(args.cache_dir) if args.cache_dir else None
+    # Tokenize into a compact TokenStream, parse and generate code, or load all
+    # three from the cache
+    stats = CompileStats() if args.stats else None
+    output_file = open(args.output, 'wb') if args.output else None
+    output = AssemblyWriter(output_file, args.flush_functions) if output_file else None
+    result = None
+    try:
+        if args.profile:
+            result = profile_call(args.profile, compile_source, code, tracer=tracer, cache=cache, passes=passes,
+                                  peephole=peephole, stats=stats, output=output)
+        else:
+            result = compile_source(code, tracer=tracer, cache=cache, passes=passes, peephole=peephole, stats=stats,
+                                    output=output)
+        if output is not None:
+            output.flush()
+    finally:
+        close_output(output_file, keep=result is not None and result.success)
+    if stats is not None:
+        stats.profile_parser(result.tokens)
+        stats.write(args.stats)
+
+    if not args.quiet:
+        # Print the list of tokens
+        print("Tokens:")
+        for token in result.tokens:
+            print(token)
+        print(result.ast)
+        #print (success)
+        print()
+
+    if result.success:
+        if args.dump_ir:
+            if result.cached:
+                print("IR not available: the result came from the cache")
+            else:
+                print(result.ir)
+            print()
+        if output is None:
+            write_assembly(result.assembly, sys.stdout)
+        if args.time_passes:
+            passes.report()
+        if args.peephole_stats:
+            peephole.report()
+        run_program(code, result.ast, args, passes)
     else:
-        parser.print_errors()
+        result.print_errors()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,430 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from tracing import NO_TRACE
+from ir import Lowering, Const, unrepresentable_values
+from passes import default_pass_manager
+from generator import JUMPS, INVERSE_JUMPS
+from emitter import write_assembly
+from asm import quoted_ascii
+from resolver import SLOT_SIZE
+
+# x86-64 backend: GNU as text (Intel syntax) for Linux, assembled and linked
+# into a static executable with no libc.
+#
+# Code comes from the IR after the optimization passes. Every variable and
+# temporary of a routine has a 4-byte slot in its stack frame at [rbp-k];
+# instructions load their operands into eax, ecx and edx, compute and store the
+# result back. Functions follow the System V calling convention: the first six
+# arguments arrive in edi, esi, edx, ecx, r8d and r9d, the rest on the stack,
+# and the result is returned in eax. Globals live in the data section and string
+# literals in rodata.
+#
+# Values are 32-bit integers as everywhere in the IR, so booleans print as 1
+# and 0, and / does not compile since it gives a float. Strings, floats and
+# lists can be assigned but not computed with or printed, except for string
+# literals given to print.
+#
+# print goes to a small runtime at the end of the file that collects output in
+# a buffer and writes it out with one system call when it fills up and at exit.
+
+ARGUMENT_REGISTERS = ('edi', 'esi', 'edx', 'ecx', 'r8d', 'r9d')
+# Instruction for each IR arithmetic operation that works in place on eax
+ARITHMETIC_INSTRUCTIONS = {'add': 'add', 'sub': 'sub', 'mul': 'imul'}
+SET_INSTRUCTIONS = {'<': 'setl', '>': 'setg', '<=': 'setle', '>=': 'setge', '==': 'sete', '!=': 'setne'}
+# Bytes of output the runtime collects before writing them
+OUTPUT_BUFFER_SIZE = 65536
+ASSEMBLER = 'as'
+LINKER = 'ld'
+
+RUNTIME = f"""
+# rt_write(rdi = text, rsi = length): append to the output buffer
+rt_write:
+    mov rcx, QWORD PTR [rip + rt_used]
+1:
+    test rsi, rsi
+    jz 3f
+    cmp rcx, {OUTPUT_BUFFER_SIZE}
+    jb 2f
+    mov QWORD PTR [rip + rt_used], rcx
+    push rdi
+    push rsi
+    call rt_flush
+    pop rsi
+    pop rdi
+    xor ecx, ecx
+2:
+    mov al, BYTE PTR [rdi]
+    lea rdx, [rip + rt_buffer]
+    mov BYTE PTR [rdx + rcx], al
+    inc rcx
+    inc rdi
+    dec rsi
+    jmp 1b
+3:
+    mov QWORD PTR [rip + rt_used], rcx
+    ret
+
+# rt_flush(): write out the buffer
+rt_flush:
+    mov rdx, QWORD PTR [rip + rt_used]
+    lea rsi, [rip + rt_buffer]
+1:
+    test rdx, rdx
+    jz 2f
+    mov edi, 1
+    mov eax, 1
+    syscall
+    test rax, rax
+    jle 2f
+    add rsi, rax
+    sub rdx, rax
+    jmp 1b
+2:
+    mov QWORD PTR [rip + rt_used], 0
+    ret
+
+# rt_print_int(edi = value, rsi = text after it, edx = its length)
+rt_print_int:
+    push rbp
+    mov rbp, rsp
+    sub rsp, 48
+    mov QWORD PTR [rbp-8], rsi
+    mov QWORD PTR [rbp-16], rdx
+    movsxd rax, edi
+    mov r9, rax
+    lea r8, [rbp-16]
+    test rax, rax
+    jns 1f
+    neg rax
+1:
+    mov ecx, 10
+2:
+    xor edx, edx
+    div rcx
+    add dl, 48
+    dec r8
+    mov BYTE PTR [r8], dl
+    test rax, rax
+    jnz 2b
+    test r9, r9
+    jns 3f
+    dec r8
+    mov BYTE PTR [r8], 45
+3:
+    mov rdi, r8
+    lea rsi, [rbp-16]
+    sub rsi, r8
+    call rt_write
+    mov rdi, QWORD PTR [rbp-8]
+    mov rsi, QWORD PTR [rbp-16]
+    call rt_write
+    leave
+    ret
+
+_start:
+    call program_main
+    call rt_flush
+    mov eax, 60
+    xor edi, edi
+    syscall
+"""
+
+
+def function_label(name):
+    # Source names are prefixed so they cannot clash with registers or the runtime
+    return f"fn_{name}"
+
+
+def slot_operand(slot):
+    return f"DWORD PTR [rbp-{SLOT_SIZE * slot}]"
+
+
+def global_label(name):
+    return f"var_{name}"
+
+
+class NativeGenerator:
+    def __init__(self, tracer=NO_TRACE, passes=None):
+        self.trace = tracer
+        self.passes = passes if passes is not None else default_pass_manager(tracer)
+        self.lowering = Lowering(tracer)
+        self.assembly_code = []  # Lines of GNU as text
+        self.module = None
+        self.strings = {}  # Text -> its label in rodata
+        self.global_names = set()
+        self.function_names = set()
+        self.unrepresentable = set()
+        self.routine_counter = 0
+        self.slots = {}  # IR value -> its frame slot
+        self.slot_count = 0
+        self.argument_slots = []
+        self.routine_name = None
+        self.code = []
+        self.in_eax = None  # The value eax is known to hold, if any
+
+    def generate_assembly(self, node):
+        if self.trace.codegen:
+            self.trace.emit('codegen', 'visit', node)
+        self.module = self.lowering.lower_program(node)
+        if self.lowering.errors:
+            raise ValueError(str(self.lowering.errors[0]))
+        self.passes.run(self.module)
+        self.emit_module(self.module)
+
+    def emit_module(self, module):
+        self.strings = {}
+        self.global_names = set()
+        self.unrepresentable = unrepresentable_values(module)
+        # A later definition of the same name replaces an earlier one, as in Python
+        latest = {function.name: function for function in module.functions}
+        self.function_names = set(latest)
+
+        code = ['.intel_syntax noprefix', '.globl _start', '.text']
+        for function in latest.values():
+            code.extend(self.emit_function(function, function_label(function.name)))
+        if module.toplevel is not None:
+            code.extend(self.emit_function(module.toplevel, 'program_main'))
+        else:
+            code.extend(['program_main:', '    ret'])
+        code.extend(RUNTIME.strip('\n').split('\n'))
+
+        code.append('.data')
+        code.append('rt_used: .quad 0')
+        for name in sorted(self.global_names):
+            code.append(f"{global_label(name)}: .long 0")
+        code.append('.section .rodata')
+        for text, label in self.strings.items():
+            code.append(f"{label}: .ascii {quoted_ascii(text)}")
+        code.append('.bss')
+        code.append(f"rt_buffer: .zero {OUTPUT_BUFFER_SIZE}")
+        self.assembly_code = code
+
+    def emit_function(self, function, label):
+        self.routine_counter += 1
+        self.routine_name = function.name or '<toplevel>'
+        self.slots = {}
+        self.slot_count = 0
+        self.code = []
+        # Parameters and locals live in the frame slots the resolver gave them,
+        # parameters first; temporaries and copies of globals come after
+        scope = function.scope
+        if scope is not None and scope.function is not None:
+            self.slot_count = scope.slot_count
+            for name, variable in function.variables.items():
+                symbol = scope.symbols.get(name)
+                if symbol is not None:
+                    self.slots[variable] = slot_operand(symbol.slot)
+            self.argument_slots = [slot_operand(index + 1) for index in range(len(function.parameters))]
+        else:
+            self.argument_slots = [self.new_slot() for _ in function.parameters[:len(ARGUMENT_REGISTERS)]]
+        block_labels = {block: f".L{self.routine_counter}_{block.label}" for block in function.blocks}
+        exit_label = f".L{self.routine_counter}_return"
+
+        for index, block in enumerate(function.blocks):
+            following = function.blocks[index + 1] if index + 1 < len(function.blocks) else None
+            self.code.append(f"{block_labels[block]}:")
+            self.in_eax = None
+            for instruction in block.instructions:
+                self.emit_instruction(instruction)
+
+            terminator = block.terminator
+            if terminator.op == 'return':
+                if terminator.args:
+                    self.load('eax', self.checked(terminator.args[0], 'return'))
+                if following is not None:
+                    self.code.append(f"jmp {exit_label}")
+            elif terminator.op == 'jump':
+                if terminator.targets[0] is not following:
+                    self.code.append(f"jmp {block_labels[terminator.targets[0]]}")
+            else:
+                if_true, if_false = terminator.targets
+                self.compare(terminator.args)
+                if if_true is following:
+                    self.code.append(f"{INVERSE_JUMPS[terminator.name]} {block_labels[if_false]}")
+                else:
+                    self.code.append(f"{JUMPS[terminator.name]} {block_labels[if_true]}")
+                    if if_false is not following:
+                        self.code.append(f"jmp {block_labels[if_false]}")
+
+        # The frame keeps rsp 16-byte aligned at calls
+        frame_size = (SLOT_SIZE * self.slot_count + 15) // 16 * 16
+        prologue = [f"{label}:", "push rbp", "mov rbp, rsp"]
+        if frame_size:
+            prologue.append(f"sub rsp, {frame_size}")
+        for register, slot in zip(ARGUMENT_REGISTERS, self.argument_slots):
+            prologue.append(f"mov {slot}, {register}")
+        epilogue = [f"{exit_label}:", "leave", "ret"]
+        return [line if line.endswith(':') else f"    {line}" for line in prologue + self.code + epilogue]
+
+    def new_slot(self):
+        self.slot_count += 1
+        return slot_operand(self.slot_count)
+
+    def slot(self, value):
+        if value not in self.slots:
+            self.slots[value] = self.new_slot()
+        return self.slots[value]
+
+    def checked(self, value, use):
+        if value is None or value in self.unrepresentable:
+            raise ValueError(f"{self.routine_name}: a string, float or list value reaches {use}, "
+                             "which the native backend cannot compile")
+        return value
+
+    def operand(self, value):
+        # An immediate for a constant, otherwise the value's frame slot
+        if isinstance(value, Const):
+            return str(value.value)
+        return self.slot(value)
+
+    def load(self, register, value):
+        if register == 'eax':
+            if self.in_eax is value and not isinstance(value, Const):
+                return
+            self.in_eax = value
+        if isinstance(value, Const) and value.value == 0:
+            self.code.append(f"xor {register}, {register}")
+        else:
+            self.code.append(f"mov {register}, {self.operand(value)}")
+
+    def store(self, dest):
+        self.code.append(f"mov {self.slot(dest)}, eax")
+        self.in_eax = dest
+
+    def compare(self, args):
+        left, right = (self.checked(arg, 'a comparison') for arg in args)
+        self.load('eax', left)
+        self.code.append(f"cmp eax, {self.operand(right)}")
+
+    def emit_instruction(self, instruction):
+        op = instruction.op
+        args = instruction.args
+        if op == 'copy':
+            if args[0] is None or args[0] in self.unrepresentable:
+                return  # Never read as a number; see unrepresentable_values()
+            self.load('eax', args[0])
+            self.store(instruction.dest)
+        elif op in ARITHMETIC_INSTRUCTIONS:
+            left, right = (self.checked(arg, 'arithmetic') for arg in args)
+            self.load('eax', left)
+            right = self.operand(right)
+            if op == 'mul' and isinstance(args[1], Const):
+                self.code.append(f"imul eax, eax, {right}")
+            else:
+                self.code.append(f"{ARITHMETIC_INSTRUCTIONS[op]} eax, {right}")
+            self.store(instruction.dest)
+        elif op in ('div', 'mod'):
+            left, right = (self.checked(arg, 'arithmetic') for arg in args)
+            self.load('ecx', right)
+            self.load('eax', left)
+            self.code.append("cdq")
+            self.code.append("idiv ecx")
+            # Round down instead of toward zero: see CodeGenerator.emit_instruction
+            self.code.append("test edx, edx")
+            self.code.append("jz 1f")
+            if op == 'div':
+                self.code.append("xor edx, ecx")
+                self.code.append("jns 1f")
+                self.code.append("dec eax")
+                self.code.append("1:")
+            else:
+                self.code.append("mov eax, edx")
+                self.code.append("xor eax, ecx")
+                self.code.append("jns 1f")
+                self.code.append("add edx, ecx")
+                self.code.append("1:")
+                self.code.append("mov eax, edx")
+            self.store(instruction.dest)
+        elif op == 'neg':
+            self.load('eax', self.checked(args[0], 'arithmetic'))
+            self.code.append("neg eax")
+            self.store(instruction.dest)
+        elif op in SET_INSTRUCTIONS:
+            self.compare(args)
+            self.code.append(f"{SET_INSTRUCTIONS[op]} al")
+            self.code.append("movzx eax, al")
+            self.store(instruction.dest)
+        elif op == 'call':
+            self.emit_call(instruction)
+        elif op == 'print':
+            self.load('edi', self.checked(args[0], 'print'))
+            self.emit_text_arguments(instruction.name, 'rsi', 'edx')
+            self.code.append("call rt_print_int")
+            self.in_eax = None
+        elif op == 'print_text':
+            self.emit_text_arguments(instruction.name, 'rdi', 'esi')
+            self.code.append("call rt_write")
+            self.in_eax = None
+        elif op == 'load':
+            if instruction.dest in self.unrepresentable:
+                return
+            self.global_names.add(instruction.name)
+            self.code.append(f"mov eax, DWORD PTR [rip + {global_label(instruction.name)}]")
+            self.store(instruction.dest)
+        elif op == 'store':
+            if args[0] is None or args[0] in self.unrepresentable:
+                return
+            self.global_names.add(instruction.name)
+            self.load('eax', args[0])
+            self.code.append(f"mov DWORD PTR [rip + {global_label(instruction.name)}], eax")
+        elif op == 'param':
+            if instruction.name < len(ARGUMENT_REGISTERS):
+                if self.slot(instruction.dest) == self.argument_slots[instruction.name]:
+                    return  # The prologue already stored it in its own slot
+                self.code.append(f"mov eax, {self.argument_slots[instruction.name]}")
+            else:
+                # Past the saved rbp and the return address, 8 bytes per argument
+                self.code.append(f"mov eax, DWORD PTR [rbp+{16 + 8 * (instruction.name - len(ARGUMENT_REGISTERS))}]")
+            self.in_eax = None
+            self.store(instruction.dest)
+        else:
+            raise ValueError(f"{self.routine_name}: {op} is not supported by the native backend")
+
+    def emit_text_arguments(self, text, address_register, length_register):
+        label = self.strings.setdefault(text, f".Lstr{len(self.strings) + 1}")
+        self.code.append(f"lea {address_register}, [rip + {label}]")
+        self.code.append(f"mov {length_register}, {len(text.encode('utf-8'))}")
+
+    def emit_call(self, instruction):
+        if instruction.name not in self.function_names:
+            raise ValueError(f"{self.routine_name}: call to undefined function {instruction.name!r}")
+        arguments = [self.checked(arg, 'a call') for arg in instruction.args]
+        on_stack = arguments[len(ARGUMENT_REGISTERS):]
+        padding = 8 if len(on_stack) % 2 else 0
+        if padding:
+            self.code.append("sub rsp, 8")
+        for argument in reversed(on_stack):
+            self.load('eax', argument)
+            self.code.append("push rax")
+        for register, argument in zip(ARGUMENT_REGISTERS, arguments):
+            self.load(register, argument)
+        self.code.append(f"call {function_label(instruction.name)}")
+        if on_stack:
+            self.code.append(f"add rsp, {8 * len(on_stack) + padding}")
+        self.in_eax = None
+        self.store(instruction.dest)
+
+    def print_assembly(self, sink=None):
+        write_assembly(self.assembly_code, sink or sys.stdout)
+
+
+def build_executable(assembly_code, output_path):
+    # Assemble and link with the system's binutils
+    for tool in (ASSEMBLER, LINKER):
+        if shutil.which(tool) is None:
+            raise ValueError(f"{tool} not found; the native backend needs GNU binutils")
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'program.s')
+        objects = os.path.join(directory, 'program.o')
+        with open(source, 'w') as file:
+            file.write('\n'.join(assembly_code) + '\n')
+        for command in ([ASSEMBLER, '--64', source, '-o', objects],
+                        [LINKER, '-static', objects, '-o', output_path]):
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise ValueError(f"{command[0]} failed:\n{completed.stderr.strip()}")
+    return output_path
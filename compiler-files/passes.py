@@ -0,0 +1,158 @@
+import sys
+import time
+
+from tracing import NO_TRACE
+from constants import fold_constants, propagate_constants, propagate_copies
+from deadcode import eliminate_dead_code, remove_unreachable_functions
+from loops import hoist_loop_invariants, reduce_strength, unroll_loops
+
+# Optimization passes over the IR and the manager that runs them.
+#
+# A pass is a function pass(module) that rewrites an IRModule in place. Passes
+# are registered under a name and run in registration order; the command line
+# can pick a different order, switch passes off and ask for per-pass timings.
+
+
+class PassManager:
+    def __init__(self, tracer=NO_TRACE):
+        self.trace = tracer
+        self.passes = []  # (name, function) in the order they run
+        self.disabled = set()
+        self.timings = {}  # Name -> total seconds spent in the pass
+        self.run_counts = {}
+
+    def names(self):
+        return [name for name, _function in self.passes]
+
+    def position(self, name):
+        for index, (registered, _function) in enumerate(self.passes):
+            if registered == name:
+                return index
+        raise ValueError(f"Unknown pass: {name!r} (expected one of {', '.join(self.names())})")
+
+    def register(self, name, function, before=None, after=None):
+        if name in self.names():
+            raise ValueError(f"Pass {name!r} is already registered")
+        if before is not None:
+            index = self.position(before)
+        elif after is not None:
+            index = self.position(after) + 1
+        else:
+            index = len(self.passes)
+        self.passes.insert(index, (name, function))
+
+    def enable(self, name):
+        self.position(name)
+        self.disabled.discard(name)
+
+    def disable(self, name):
+        self.position(name)
+        self.disabled.add(name)
+
+    def select(self, names):
+        # Run exactly these passes, in this order; the others are disabled
+        selected = [self.passes[self.position(name)] for name in names]
+        self.passes = selected + [entry for entry in self.passes if entry[0] not in names]
+        self.disabled = set(self.names()) - set(names)
+
+    def pipeline(self):
+        # Names of the passes that will run, in order
+        return tuple(name for name in self.names() if name not in self.disabled)
+
+    def run(self, module):
+        for name, function in self.passes:
+            if name in self.disabled:
+                continue
+            if self.trace.codegen:
+                self.trace.emit('codegen', 'pass', name)
+            start = time.perf_counter()
+            function(module)
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            self.run_counts[name] = self.run_counts.get(name, 0) + 1
+
+    def report(self, stream=None):
+        stream = stream or sys.stderr
+        total = sum(self.timings.values())
+        print("Pass timings:", file=stream)
+        for name in self.names():
+            if name in self.disabled:
+                print(f"  {name:<20} disabled", file=stream)
+            else:
+                elapsed = self.timings.get(name, 0.0)
+                share = elapsed / total if total else 0.0
+                print(f"  {name:<20} {elapsed * 1000:9.3f} ms {share:6.1%}  ({self.run_counts.get(name, 0)} runs)", file=stream)
+        print(f"  {'total':<20} {total * 1000:9.3f} ms", file=stream)
+
+
+def simplify_cfg(module):
+    # Drop blocks nothing can reach, send jumps to empty forwarding blocks
+    # straight to where those blocks go, and merge a block into the only block
+    # that jumps to it
+    for function in module.all_functions():
+        entry = function.blocks[0]
+
+        def forward(block):
+            seen = set()
+            while not block.instructions and block.terminator.op == 'jump' and block not in seen and block is not entry:
+                seen.add(block)
+                block = block.terminator.targets[0]
+            return block
+
+        for block in function.blocks:
+            block.terminator.targets = tuple(forward(target) for target in block.terminator.targets)
+
+        reachable = set()
+        pending = [entry]
+        while pending:
+            block = pending.pop()
+            if block not in reachable:
+                reachable.add(block)
+                pending.extend(block.successors())
+        function.blocks = [block for block in function.blocks if block in reachable]
+
+        predecessors = function.predecessors()
+        merged = set()
+        for block in function.blocks:
+            if block in merged:
+                continue
+            while block.terminator.op == 'jump':
+                target = block.terminator.targets[0]
+                if target is entry or target is block or len(predecessors[target]) != 1:
+                    break
+                block.instructions.extend(target.instructions)
+                block.terminator = target.terminator
+                merged.add(target)
+                for successor in target.successors():
+                    predecessors[successor] = [block if predecessor is target else predecessor
+                                               for predecessor in predecessors[successor]]
+        function.blocks = [block for block in function.blocks if block not in merged]
+
+
+# Passes run by default, in order
+DEFAULT_PASSES = (
+    ('constant-fold', fold_constants),
+    ('loop-unroll', unroll_loops),
+    ('constant-propagation', propagate_constants),
+    ('licm', hoist_loop_invariants),
+    ('strength-reduction', reduce_strength),
+    ('copy-propagation', propagate_copies),
+    ('dead-code', eliminate_dead_code),
+    ('simplify-cfg', simplify_cfg),
+    ('dead-functions', remove_unreachable_functions),
+)
+# Registered passes that only run when asked for
+OPTIONAL_PASSES = ('loop-unroll',)
+
+
+def default_pass_manager(tracer=NO_TRACE, pipeline=None):
+    # The default passes, or only the ones in pipeline and in that order.
+    # Optional passes are registered but disabled.
+    passes = PassManager(tracer)
+    for name, function in DEFAULT_PASSES:
+        passes.register(name, function)
+        if name in OPTIONAL_PASSES:
+            passes.disable(name)
+    if pipeline is not None:
+        passes.select(pipeline)
+    return passes
@@ -0,0 +1,241 @@
+import sys
+
+from asm import Instruction, Label, is_register, is_memory, is_immediate, is_jump
+
+# Peephole optimization over a routine's structured instructions, after
+# register allocation.
+#
+# Each rule looks at the instructions starting at one position and either
+# declines or returns how many of them it replaces and with what. The optimizer
+# slides over the routine trying the rules at every position and sweeps again
+# until a sweep changes nothing. Every rule counts its hits.
+
+# Instructions that set the flags without reading them
+FLAG_WRITERS = frozenset(('cmp', 'test', 'add', 'sub', 'and', 'or', 'xor', 'imul', 'neg', 'inc', 'dec', 'idiv', 'shl', 'shr', 'sar'))
+# How far zero-register looks for the next instruction that sets the flags
+FLAGS_LOOKAHEAD = 32
+
+
+class SweepContext:
+    # Facts about the whole routine, gathered once per sweep
+    def __init__(self, code):
+        self.referenced = set()
+        self.destinations = {}  # Label -> where a jump to it ends up
+        for index, item in enumerate(code):
+            if is_jump(item):
+                self.referenced.add(item.operands[0])
+            elif isinstance(item, Label):
+                following = index + 1
+                while following < len(code) and isinstance(code[following], Label):
+                    following += 1
+                if following < len(code) and isinstance(code[following], Instruction) and code[following].mnemonic == 'jmp':
+                    self.destinations[item.name] = code[following].operands[0]
+
+    def destination(self, label):
+        seen = {label}
+        while label in self.destinations and self.destinations[label] not in seen:
+            label = self.destinations[label]
+            seen.add(label)
+        return label
+
+
+def is_mov(item):
+    return isinstance(item, Instruction) and item.mnemonic == 'mov'
+
+
+def self_move(code, index, context):
+    # mov r, r
+    item = code[index]
+    if is_mov(item) and item.operands[0] == item.operands[1]:
+        return 1, []
+    return None
+
+
+def redundant_load(code, index, context):
+    # mov [m], r / mov r2, [m]  ->  mov [m], r / mov r2, r
+    if index + 1 >= len(code):
+        return None
+    store, load = code[index], code[index + 1]
+    if (is_mov(store) and is_mov(load) and is_memory(store.operands[0])
+            and load.operands[1] == store.operands[0] and not is_memory(load.operands[0])):
+        if load.operands[0] == store.operands[1]:
+            return 2, [store]
+        return 2, [store, Instruction('mov', [load.operands[0], store.operands[1]])]
+    return None
+
+
+def redundant_store(code, index, context):
+    # mov r, [m] / mov [m], r  ->  mov r, [m]
+    # mov [m], a / mov [m], b  ->  mov [m], b
+    if index + 1 >= len(code):
+        return None
+    first, second = code[index], code[index + 1]
+    if not (is_mov(first) and is_mov(second)):
+        return None
+    if (first.operands == second.operands[::-1] and is_memory(first.operands[1]) and is_register(first.operands[0])
+            and first.operands[0] not in first.operands[1]):
+        return 2, [first]
+    if is_memory(first.operands[0]) and first.operands[0] == second.operands[0]:
+        return 2, [second]
+    return None
+
+
+def jump_to_next(code, index, context):
+    # A jump to a label that directly follows it
+    item = code[index]
+    if not is_jump(item):
+        return None
+    following = index + 1
+    while following < len(code) and isinstance(code[following], Label):
+        if code[following].name == item.operands[0]:
+            return 1, []
+        following += 1
+    return None
+
+
+def jump_chain(code, index, context):
+    # A jump to a label whose first instruction is another jmp goes straight
+    # to where that jmp goes
+    item = code[index]
+    if not is_jump(item):
+        return None
+    destination = context.destination(item.operands[0])
+    if destination == item.operands[0]:
+        return None
+    return 1, [Instruction(item.mnemonic, [destination])]
+
+
+def unreachable_code(code, index, context):
+    # Instructions between an unconditional jump or ret and the next label
+    item = code[index]
+    if not (isinstance(item, Instruction) and item.mnemonic in ('jmp', 'ret')):
+        return None
+    following = index + 1
+    while following < len(code) and isinstance(code[following], Instruction):
+        following += 1
+    if following == index + 1:
+        return None
+    return following - index, [item]
+
+
+def unused_label(code, index, context):
+    item = code[index]
+    if isinstance(item, Label) and item.name not in context.referenced:
+        return 1, []
+    return None
+
+
+def flags_dead_after(code, index):
+    # Whether nothing reads the flags before something sets them again,
+    # following the fall-through path. Jumps and anything not understood count
+    # as reading them.
+    for item in code[index + 1:index + 1 + FLAGS_LOOKAHEAD]:
+        if isinstance(item, Label):
+            continue
+        if item.mnemonic in FLAG_WRITERS or item.mnemonic in ('call', 'ret'):
+            return True
+        if is_jump(item) or item.mnemonic not in ('mov', 'push', 'pop', 'cdq', 'lea'):
+            return False
+    return index + 1 + FLAGS_LOOKAHEAD >= len(code)
+
+
+def zero_register(code, index, context):
+    # mov r, 0  ->  xor r, r, which is shorter but clobbers the flags
+    item = code[index]
+    if is_mov(item) and is_register(item.operands[0]) and item.operands[1] == '0' and flags_dead_after(code, index):
+        register = item.operands[0]
+        return 1, [Instruction('xor', [register, register])]
+    return None
+
+
+def merge_stack_adjustments(code, index, context):
+    # add esp, a / add esp, b  ->  add esp, a+b
+    # add esp, 4 / push x      ->  mov DWORD PTR [esp], x
+    if index + 1 >= len(code):
+        return None
+    first, second = code[index], code[index + 1]
+    if not (isinstance(first, Instruction) and first.mnemonic == 'add' and first.operands[0] == 'esp'
+            and is_immediate(first.operands[1]) and isinstance(second, Instruction)):
+        return None
+    amount = int(first.operands[1])
+    if second.mnemonic == 'add' and second.operands[0] == 'esp' and is_immediate(second.operands[1]):
+        return 2, [Instruction('add', ['esp', str(amount + int(second.operands[1]))])]
+    if second.mnemonic == 'push' and amount >= 4 and not is_memory(second.operands[0]) and second.operands[0] != 'esp':
+        store = Instruction('mov', ['DWORD PTR [esp]', second.operands[0]])
+        if amount == 4:
+            return 2, [store]
+        return 2, [Instruction('add', ['esp', str(amount - 4)]), store]
+    return None
+
+
+# Rules in the order they are tried at each position
+PEEPHOLE_RULES = (
+    ('self-move', self_move),
+    ('redundant-load', redundant_load),
+    ('redundant-store', redundant_store),
+    ('jump-to-next', jump_to_next),
+    ('jump-chain', jump_chain),
+    ('unreachable-code', unreachable_code),
+    ('unused-label', unused_label),
+    ('zero-register', zero_register),
+    ('merge-stack-adjustments', merge_stack_adjustments),
+)
+
+
+class PeepholeOptimizer:
+    def __init__(self, disabled=()):
+        self.rules = list(PEEPHOLE_RULES)
+        self.disabled = set()
+        self.hits = {name: 0 for name, _rule in self.rules}
+        for name in disabled:
+            self.disable(name)
+
+    def names(self):
+        return [name for name, _rule in self.rules]
+
+    def disable(self, name):
+        if name == 'all':
+            self.disabled.update(self.names())
+        elif name in self.hits:
+            self.disabled.add(name)
+        else:
+            raise ValueError(f"Unknown peephole rule: {name!r} (expected one of {', '.join(self.names())}, or 'all')")
+
+    def enable(self, name):
+        self.disabled.discard(name)
+
+    def enabled_rules(self):
+        return tuple(name for name in self.names() if name not in self.disabled)
+
+    def optimize(self, code):
+        rules = [(name, rule) for name, rule in self.rules if name not in self.disabled]
+        if not rules:
+            return code
+        changed = True
+        while changed:
+            changed = False
+            context = SweepContext(code)
+            output = []
+            index = 0
+            while index < len(code):
+                for name, rule in rules:
+                    match = rule(code, index, context)
+                    if match is not None:
+                        count, replacement = match
+                        self.hits[name] += 1
+                        output.extend(replacement)
+                        index += count
+                        changed = True
+                        break
+                else:
+                    output.append(code[index])
+                    index += 1
+            code = output
+        return code
+
+    def report(self, stream=None):
+        stream = stream or sys.stderr
+        print("Peephole rule hits:", file=stream)
+        for name in self.names():
+            status = "disabled" if name in self.disabled else self.hits[name]
+            print(f"  {name:<24} {status}", file=stream)
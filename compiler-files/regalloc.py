@@ -0,0 +1,356 @@
+from bisect import bisect_right
+import re
+
+# Linear-scan register allocation over the generator's output.
+#
+# The generator writes each routine with an unlimited supply of virtual
+# registers (%1, %2, ...). allocate_registers() computes liveness over the
+# routine's control flow graph, turns it into one live interval per virtual
+# register and assigns physical registers by linear scan, spilling the interval
+# that ends last when it runs out. Because intervals come from liveness, a value
+# used around a loop stays live over the whole loop.
+#
+# eax and edx are never allocated. Division, return values and spill reloads
+# use them as scratch. A call clobbers ecx, so values that are live across a
+# call only get one of the callee-saved registers.
+
+ALLOCATABLE = ('ecx', 'ebx', 'esi', 'edi')
+CALLEE_SAVED = ('ebx', 'esi', 'edi')
+SCRATCH = ('eax', 'edx')
+
+VIRTUAL_REGISTER = re.compile(r'%\d+')
+EMPTY = frozenset()
+
+# What each instruction does with its operands: 'def' writes, 'use' reads,
+# 'update' reads and writes. Memory operands only ever read the registers in
+# their address.
+OPERAND_ROLES = {
+    'mov': ('def', 'use'),
+    'add': ('update', 'use'),
+    'sub': ('update', 'use'),
+    'imul': ('update', 'use'),
+    'and': ('update', 'use'),
+    'or': ('update', 'use'),
+    'xor': ('update', 'use'),
+    'cmp': ('use', 'use'),
+    'test': ('use', 'use'),
+    'neg': ('update',),
+    'not': ('update',),
+    'inc': ('update',),
+    'dec': ('update',),
+    'push': ('use',),
+    'pop': ('def',),
+    'idiv': ('use',),
+}
+
+
+class Allocation:
+    def __init__(self, code, registers, spill_slots, pressure=0):
+        self.code = code
+        self.registers = registers  # Physical registers the routine uses
+        self.spill_slots = spill_slots  # Number of 4-byte stack slots below ebp
+        self.pressure = pressure  # Most virtual registers live at the same point
+
+    def frame_size(self):
+        return 4 * self.spill_slots
+
+    def saved_registers(self):
+        return [register for register in CALLEE_SAVED if register in self.registers]
+
+
+def split_instruction(line):
+    mnemonic, _, rest = line.partition(' ')
+    return mnemonic, rest.split(', ') if rest else []
+
+
+def is_memory(operand):
+    return '[' in operand
+
+
+def is_jump(mnemonic):
+    return mnemonic.startswith('j')
+
+
+class RoutineInfo:
+    # Per-instruction def/use sets, basic blocks and liveness for one routine.
+    # Liveness is kept per block only; per-instruction sets are rebuilt by
+    # walking a block backwards from its live-out set when they are needed.
+    def __init__(self, code):
+        self.code = code
+        count = len(code)
+        labels = {line[:-1]: index for index, line in enumerate(code) if line.endswith(':')}
+        self.uses = [EMPTY] * count
+        self.defs = [EMPTY] * count
+        self.moves = [False] * count  # Register moves, which liveness may drop
+        self.calls = []
+        self.removed = set()
+        # Basic blocks: a label or the instruction after a jump starts one
+        leaders = {0} if count else set()
+        targets = {}
+        for index, line in enumerate(code):
+            if line.endswith(':'):
+                leaders.add(index)
+                continue
+            mnemonic, operands = split_instruction(line)
+            roles = OPERAND_ROLES.get(mnemonic, ())
+            uses = set()
+            defs = set()
+            for position, operand in enumerate(operands):
+                registers = VIRTUAL_REGISTER.findall(operand)
+                if not registers:
+                    continue
+                role = roles[position] if position < len(roles) and not is_memory(operand) else 'use'
+                if role != 'def':
+                    uses.update(registers)
+                if role != 'use':
+                    defs.update(registers)
+            self.uses[index] = uses
+            self.defs[index] = defs
+            self.moves[index] = mnemonic == 'mov' and bool(defs)
+            if mnemonic == 'call':
+                self.calls.append(index)
+            if mnemonic == 'ret' or is_jump(mnemonic):
+                leaders.add(index + 1)
+                if mnemonic != 'ret':
+                    targets[index] = labels[operands[0]]
+        self.starts = sorted(leader for leader in leaders if leader < count)
+        block_of = {start: block for block, start in enumerate(self.starts)}
+        self.ends = self.starts[1:] + [count] if self.starts else []
+        self.successors = []
+        for block, end in enumerate(self.ends):
+            last = end - 1
+            mnemonic = split_instruction(code[last])[0] if not code[last].endswith(':') else ''
+            following = (block + 1,) if end < count and mnemonic not in ('ret', 'jmp') else ()
+            jump = (block_of[targets[last]],) if last in targets else ()
+            self.successors.append(jump + following)
+        self.live_in, self.live_out = self.liveness()
+
+    def walk(self, block, live_out):
+        # Walk a block backwards from its live-out set, yielding each
+        # instruction with the set live after it; the set is updated in place
+        # as the walk goes on. A move into a register that is not live is dead
+        # and reads nothing, so its sources do not become live on its account.
+        live = set(live_out)
+        for index in range(self.ends[block] - 1, self.starts[block] - 1, -1):
+            yield index, live
+            defs = self.defs[index]
+            if self.moves[index] and not defs & live:
+                continue
+            live -= defs
+            live |= self.uses[index]
+        yield None, live
+
+    def block_live_in(self, block, live_out):
+        for _index, live in self.walk(block, live_out):
+            pass
+        return live
+
+    def liveness(self):
+        # Worklist over blocks, so each block is revisited only when the
+        # live-in set of one of its successors has grown
+        count = len(self.starts)
+        live_in = [set() for _ in range(count)]
+        live_out = [set() for _ in range(count)]
+        predecessors = [[] for _ in range(count)]
+        for block, successors in enumerate(self.successors):
+            for successor in successors:
+                predecessors[successor].append(block)
+        worklist = list(range(count))
+        queued = [True] * count
+        while worklist:
+            block = worklist.pop()
+            queued[block] = False
+            out = set()
+            for successor in self.successors[block]:
+                out |= live_in[successor]
+            live_out[block] = out
+            incoming = self.block_live_in(block, out)
+            if incoming != live_in[block]:
+                live_in[block] = incoming
+                for predecessor in predecessors[block]:
+                    if not queued[predecessor]:
+                        queued[predecessor] = True
+                        worklist.append(predecessor)
+        return live_in, live_out
+
+    def remove_dead_moves(self):
+        # Drop moves into a virtual register nobody reads afterwards, so that
+        # an unused entry load or comparison result does not take up a
+        # register. Liveness already treats them as dead, chains of them
+        # included, so one sweep finds them all and the block sets stay valid.
+        for block in range(len(self.starts)):
+            for index, live in self.walk(block, self.live_out[block]):
+                if index is not None and self.moves[index] and not self.defs[index] & live:
+                    self.removed.add(index)
+                    self.uses[index] = EMPTY
+                    self.defs[index] = EMPTY
+                    self.moves[index] = False
+
+    def remaining_code(self):
+        return [line for index, line in enumerate(self.code) if index not in self.removed]
+
+    def intervals(self):
+        # A register is live at an instruction when it is live before it or
+        # the instruction writes it. Within a block that can only start at the
+        # block's first instruction or a write and end at its last
+        # instruction or a read, so those are the only places to look.
+        places = []  # (index, registers) in code order
+        for block, start in enumerate(self.starts):
+            places.append((start, self.live_in[block]))
+            for index in range(start, self.ends[block]):
+                if self.uses[index]:
+                    places.append((index, self.uses[index]))
+                if self.defs[index]:
+                    places.append((index, self.defs[index]))
+            places.append((self.ends[block] - 1, self.live_out[block]))
+        # Later places overwrite earlier ones, so the last update wins
+        first = {}
+        for index, registers in reversed(places):
+            first.update(dict.fromkeys(registers, index))
+        last = {}
+        for index, registers in places:
+            last.update(dict.fromkeys(registers, index))
+        return {register: [index, last[register]] for register, index in first.items()}
+
+    def live_across_calls(self):
+        crossing = set()
+        calls = set(self.calls)
+        for block in sorted({bisect_right(self.starts, index) - 1 for index in calls}):
+            for index, live in self.walk(block, self.live_out[block]):
+                if index in calls:
+                    crossing |= live
+        return crossing
+
+
+def copy_hints(code):
+    # For mov %a, %b give both the same register when their intervals allow it
+    hints = {}
+    for line in code:
+        if line.startswith('mov '):
+            _mnemonic, operands = split_instruction(line)
+            if len(operands) == 2 and VIRTUAL_REGISTER.fullmatch(operands[0]) and VIRTUAL_REGISTER.fullmatch(operands[1]):
+                hints.setdefault(operands[0], operands[1])
+                hints.setdefault(operands[1], operands[0])
+    return hints
+
+
+def linear_scan(intervals, crossing, hints):
+    assignment = {}
+    slots = {}
+    active = []  # (end, register name, virtual register)
+    spilled_active = []  # (end, slot)
+    free_slots = []
+    slot_count = 0
+    free = list(ALLOCATABLE)
+    pressure = 0
+
+    order = sorted(intervals, key=lambda register: (intervals[register][0], int(register[1:])))
+    for virtual in order:
+        start, end = intervals[virtual]
+        # An interval ending where this one starts can hand over its register:
+        # an instruction reads its operands before writing its result
+        for entry in [entry for entry in active if entry[0] <= start]:
+            active.remove(entry)
+            free.append(entry[1])
+        for entry in [entry for entry in spilled_active if entry[0] <= start]:
+            spilled_active.remove(entry)
+            free_slots.append(entry[1])
+
+        allowed = CALLEE_SAVED if virtual in crossing else ALLOCATABLE
+        candidates = [register for register in allowed if register in free]
+        register = None
+        if candidates:
+            hinted = assignment.get(hints.get(virtual))
+            register = hinted if hinted in candidates else candidates[0]
+            free.remove(register)
+        else:
+            # Spill whichever of this interval and the active ones it could
+            # take a register from ends last
+            victims = [entry for entry in active if entry[1] in allowed]
+            victim = max(victims, key=lambda entry: entry[0]) if victims else None
+            if victim is not None and victim[0] > end:
+                active.remove(victim)
+                register = victim[1]
+                del assignment[victim[2]]
+                spill = victim
+            else:
+                spill = (end, None, virtual)
+            if free_slots and spill[2] == virtual:
+                slot = free_slots.pop()
+            else:
+                # A victim was live before the freed slots were, so it gets a new one
+                slot_count += 1
+                slot = slot_count
+            slots[spill[2]] = slot
+            spilled_active.append((spill[0], slot))
+
+        if register is not None:
+            assignment[virtual] = register
+            active.append((end, register, virtual))
+        pressure = max(pressure, len(active) + len(spilled_active))
+    return assignment, slots, slot_count, pressure
+
+
+def slot_operand(slot):
+    return f"DWORD PTR [ebp-{4 * slot}]"
+
+
+def rewrite(code, assignment, slots):
+    def location(virtual):
+        if virtual in assignment:
+            return assignment[virtual]
+        return slot_operand(slots[virtual])
+
+    output = []
+    for line in code:
+        if line.endswith(':') or not VIRTUAL_REGISTER.search(line):
+            output.append(line)
+            continue
+        mnemonic, operands = split_instruction(line)
+        scratch = [register for register in SCRATCH if register not in line]
+        before = []
+        after = []
+        rewritten = []
+        for operand in operands:
+            if is_memory(operand):
+                # Registers inside an address must be real registers
+                def address_register(match):
+                    virtual = match.group()
+                    if virtual in assignment:
+                        return assignment[virtual]
+                    register = scratch.pop(0)
+                    before.append(f"mov {register}, {slot_operand(slots[virtual])}")
+                    return register
+                operand = VIRTUAL_REGISTER.sub(address_register, operand)
+            elif VIRTUAL_REGISTER.fullmatch(operand):
+                operand = location(operand)
+            rewritten.append(operand)
+
+        if len(rewritten) == 2 and is_memory(rewritten[0]) and is_memory(rewritten[1]):
+            # x86 allows one memory operand; load the source into a scratch register
+            register = scratch.pop(0)
+            before.append(f"mov {register}, {rewritten[1]}")
+            rewritten[1] = register
+        if mnemonic == 'imul' and is_memory(rewritten[0]):
+            # imul only writes to a register
+            register = scratch.pop(0)
+            before.append(f"mov {register}, {rewritten[0]}")
+            after.append(f"mov {rewritten[0]}, {register}")
+            rewritten[0] = register
+        if mnemonic == 'mov' and rewritten[0] == rewritten[1]:
+            continue
+
+        output.extend(before)
+        output.append(f"{mnemonic} {', '.join(rewritten)}")
+        output.extend(after)
+    return output
+
+
+def allocate_registers(code):
+    info = RoutineInfo(code)
+    info.remove_dead_moves()
+    code = info.remaining_code()
+    assignment, slots, slot_count, pressure = linear_scan(info.intervals(), info.live_across_calls(), copy_hints(code))
+    code = rewrite(code, assignment, slots)
+    registers = set(assignment.values())
+    return Allocation(code, registers, slot_count, pressure)
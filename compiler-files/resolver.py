@@ -0,0 +1,184 @@
+from syntax import *
+
+# Name resolution between parsing and lowering.
+#
+# The Resolver builds a Scope for the module and one inside it for each
+# function, binds every name to a Symbol and points each IdentifierNode at its
+# symbol, so later stages never look a name up again. Scoping follows Python:
+# a parameter is bound by the call, any other name a function assigns anywhere
+# in its body is one of its locals, and every other name it reads is a global,
+# which the top-level code has to assign somewhere. Names that resolve to
+# nothing, and calls to functions that are never defined, are reported as
+# errors before any code is generated.
+#
+# Parameters and locals get consecutive frame slots, parameters first, so a
+# backend can keep them at fixed offsets below the frame pointer.
+
+GLOBAL = 'global'
+PARAMETER = 'parameter'
+LOCAL = 'local'
+
+# Bytes in one frame slot
+SLOT_SIZE = 4
+
+
+class Symbol:
+    __slots__ = ('name', 'kind', 'slot')
+
+    def __init__(self, name, kind, slot=None):
+        self.name = name
+        self.kind = kind
+        self.slot = slot  # Frame slot from 1 for parameters and locals; None for globals
+
+    def __repr__(self):
+        return f"Symbol({self.name!r}, {self.kind}, slot={self.slot})"
+
+
+class Scope:
+    def __init__(self, function=None, parent=None):
+        self.function = function  # FunctionDefNode, or None for the module
+        self.parent = parent
+        self.symbols = {}  # Name -> Symbol, in the order they were bound
+        self.globals_read = []  # Globals a function reads, in first-use order
+        self.slot_count = 0
+
+    def define(self, name, kind):
+        symbol = self.symbols.get(name)
+        if symbol is None:
+            slot = None
+            if kind != GLOBAL:
+                self.slot_count += 1
+                slot = self.slot_count
+            symbol = self.symbols[name] = Symbol(name, kind, slot)
+        return symbol
+
+    def lookup(self, name):
+        scope = self
+        while scope is not None:
+            symbol = scope.symbols.get(name)
+            if symbol is not None:
+                return symbol
+            scope = scope.parent
+        return None
+
+    def names(self, kind):
+        return [name for name, symbol in self.symbols.items() if symbol.kind == kind]
+
+
+class AssignedNames(NodeVisitor):
+    # Names a routine assigns to. Inside a function these are its locals.
+    def __init__(self):
+        self.names = {}  # Name -> None, in first-assignment order
+
+    def visit_AssignmentNode(self, node):
+        self.add(node.identifier.name)
+
+    def visit_AugmentedAssignmentNode(self, node):
+        self.add(node.identifier.name)
+
+    def visit_ForNode(self, node):
+        self.add(node.variable.name)
+        for statement in node.block:
+            self.visit(statement)
+
+    def visit_FunctionDefNode(self, node):
+        pass  # A nested function has its own locals
+
+    def visit_BinaryOpNode(self, node):
+        pass  # Expressions never assign
+
+    def add(self, name):
+        self.names[name] = None
+
+
+class Resolver(NodeVisitor):
+    # With report_undefined off, as for incremental fragments that only see
+    # part of the program, unknown names are taken to be globals defined
+    # elsewhere and nothing is reported. A fragment resolved with
+    # known_globals and known_functions, the names the rest of the program
+    # binds, reports only the names that are bound nowhere.
+    def __init__(self, report_undefined=True, known_globals=(), known_functions=()):
+        self.report_undefined = report_undefined
+        self.errors = []
+        self.module = None
+        self.scope = None
+        self.known_functions = set(known_functions)
+        self.function_names = set()
+        # Name -> Symbol for globals assigned outside the code being resolved
+        self.external = {name: Symbol(name, GLOBAL) for name in known_globals}
+        self.reported = set()
+
+    def resolve(self, program):
+        program.scope = self.resolve_items(program.functions, program.statements)
+        return program.scope
+
+    def resolve_items(self, functions, statements):
+        # Bind every scope before resolving any reads, since a function may
+        # read a global the top-level code only assigns after the definition
+        self.module = Scope()
+        self.function_names = {function.name for function in functions} | self.known_functions
+        self.bind(self.module, statements, GLOBAL)
+        for function in functions:
+            scope = Scope(function, self.module)
+            for name in function.parameters:
+                if name in scope.symbols:
+                    self.error(f"Duplicate parameter {name!r} in function {function.name!r}", function.line)
+                scope.define(name, PARAMETER)
+            self.bind(scope, function.body, LOCAL)
+            function.scope = scope
+
+        self.resolve_block(self.module, statements)
+        for function in functions:
+            self.resolve_block(function.scope, function.body)
+        return self.module
+
+    def bind(self, scope, statements, kind):
+        assigned = AssignedNames()
+        for statement in statements:
+            if statement is not None:
+                assigned.visit(statement)
+        for name in assigned.names:
+            scope.define(name, kind)
+
+    def resolve_block(self, scope, statements):
+        self.scope = scope
+        for statement in statements:
+            if statement is not None:
+                self.visit(statement)
+
+    def error(self, message, line):
+        self.errors.append(Error(message, line))
+
+    def visit_IdentifierNode(self, node):
+        symbol = self.scope.lookup(node.name)
+        if symbol is None:
+            symbol = self.external.get(node.name)
+            if symbol is None:
+                symbol = self.external[node.name] = Symbol(node.name, GLOBAL)
+                if self.report_undefined:
+                    self.error(f"Undefined name {node.name!r}", node.line)
+        if symbol.kind == GLOBAL and self.scope.function is not None and node.name not in self.scope.globals_read:
+            self.scope.globals_read.append(node.name)
+        node.symbol = symbol
+
+    def visit_BinaryOpNode(self, node):
+        # Iterative down the left operands, which long expressions chain through
+        while isinstance(node, BinaryOpNode):
+            self.visit(node.right)
+            node = node.left
+        self.visit(node)
+
+    def visit_FunctionCallNode(self, node):
+        name = node.function_name
+        if self.report_undefined and name not in self.function_names and name not in self.reported:
+            self.reported.add(name)
+            self.error(f"Call to undefined function {name!r}", node.line)
+        for argument in node.arguments:
+            self.visit(argument)
+
+
+def resolve_names(program):
+    # Resolve a whole program; returns the errors, empty when every name is bound
+    resolver = Resolver()
+    resolver.resolve(program)
+    return sorted(resolver.errors, key=lambda error: error.line_number or 0)
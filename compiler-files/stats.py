@@ -0,0 +1,123 @@
+import cProfile
+import json
+import pstats
+import sys
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from lexer import TOKEN_TYPES
+from syntax import Parser, walk
+
+# Compile statistics for --stats, written as one JSON report: wall and CPU
+# time per phase, tokens and AST nodes by kind, instructions and register
+# pressure per routine, pass timings and the parser methods that take the most
+# time.
+#
+# Nothing is collected unless a CompileStats is passed in. The compiler only
+# checks for one once per phase and once per routine, so a compile without
+# --stats does no extra work.
+
+# Parser methods listed in the report, most time first
+HOT_METHOD_COUNT = 10
+
+NO_PHASE = nullcontext()
+
+
+class PhaseTimer:
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.wall = self.cpu = 0.0
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exception):
+        self.stats.add_phase(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu)
+        return False
+
+
+class CompileStats:
+    def __init__(self):
+        self.phases = {}  # Name -> {'wall_seconds', 'cpu_seconds'}
+        self.tokens = Counter()
+        self.nodes = Counter()
+        self.routines = []
+        self.passes = {}
+        self.hot_methods = []
+        self.cached = False
+
+    def phase(self, name):
+        return PhaseTimer(self, name)
+
+    def add_phase(self, name, wall, cpu):
+        phase = self.phases.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+        phase['wall_seconds'] += wall
+        phase['cpu_seconds'] += cpu
+
+    def count_tokens(self, tokens):
+        # tokens is a TokenStream or TokenList; both keep an array of kinds
+        for kind, count in Counter(tokens.kinds).items():
+            self.tokens[TOKEN_TYPES[kind]] += count
+
+    def count_nodes(self, ast):
+        self.nodes.update(type(node).__name__ for node in walk(ast))
+
+    def add_routine(self, name, instructions, virtual_registers, pressure):
+        self.routines.append({'name': name, 'instructions': instructions,
+                              'virtual_registers': virtual_registers, 'register_pressure': pressure})
+
+    def add_pass_timings(self, passes):
+        for name, seconds in passes.timings.items():
+            self.passes[name] = self.passes.get(name, 0.0) + seconds
+
+    def profile_parser(self, tokens):
+        # Parse once more under cProfile, so the timed parse is not slowed
+        # down, and keep the Parser methods with the most time of their own
+        profiler = cProfile.Profile()
+        profiler.runcall(Parser(tokens).parse)
+        methods = []
+        for (filename, line, name), (_primitive, calls, own, total, _callers) in pstats.Stats(profiler).stats.items():
+            if getattr(Parser, name, None) is not None and filename.endswith('syntax.py'):
+                methods.append({'method': name, 'line': line, 'calls': calls,
+                                'own_seconds': own, 'total_seconds': total})
+        methods.sort(key=lambda method: method['own_seconds'], reverse=True)
+        self.hot_methods = methods[:HOT_METHOD_COUNT]
+
+    def report(self):
+        return {
+            'cached': self.cached,
+            'phases': self.phases,
+            'tokens': {'total': sum(self.tokens.values()), 'by_kind': dict(self.tokens.most_common())},
+            'nodes': {'total': sum(self.nodes.values()), 'by_kind': dict(self.nodes.most_common())},
+            'routines': self.routines,
+            'peak_register_pressure': max((routine['register_pressure'] for routine in self.routines), default=0),
+            'passes': self.passes,
+            'hot_parser_methods': self.hot_methods,
+        }
+
+    def write(self, path):
+        # '-' writes to stderr, since stdout carries the assembly
+        text = json.dumps(self.report(), indent=2)
+        if path == '-':
+            print(text, file=sys.stderr)
+        else:
+            with open(path, 'w') as file:
+                file.write(text + '\n')
+
+
+def phase(stats, name):
+    # Times the with-block as a phase of stats, or does nothing without stats
+    return stats.phase(name) if stats is not None else NO_PHASE
+
+
+def profile_call(path, function, *args, **kwargs):
+    # Call function under cProfile and save the pstats dump to path
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        profiler.dump_stats(path)
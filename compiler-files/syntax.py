@@ -1,7 +1,49 @@
-class ProgramNode:
-    def __init__(self, functions, statements):
+from lexer import *
+from tracing import NO_TRACE
+
+# Token kind groups the parser tests against
+IGNORABLE_KINDS = frozenset((T_NEWLINE, T_WHITESPACE, T_COMMENT))
+ASSIGN_KINDS = frozenset((T_ASSIGN, T_PLUS_ASSIGN, T_MINUS_ASSIGN, T_TIMES_ASSIGN, T_DIVIDE_ASSIGN))
+AUGMENTED_ASSIGN_KINDS = frozenset((T_PLUS_ASSIGN, T_MINUS_ASSIGN, T_TIMES_ASSIGN, T_DIVIDE_ASSIGN))
+RETURN_END_KINDS = frozenset((T_NEWLINE, T_COMMENT, T_DEDENT))
+
+# Binding powers for the Pratt expression parser: kind -> (left, right).
+# Higher binds tighter; a right power below the left one makes the operator
+# right-associative.
+INFIX_BINDING_POWERS = {
+    T_EQ: (10, 11), T_NEQ: (10, 11), T_LT: (10, 11), T_GT: (10, 11), T_LTE: (10, 11), T_GTE: (10, 11),
+    T_PLUS: (20, 21), T_MINUS: (20, 21),
+    T_MULT: (30, 31), T_DIV: (30, 31), T_MOD: (30, 31),
+    T_EXP: (50, 49),
+}
+PREFIX_BINDING_POWER = 40  # Unary minus: binds tighter than '*' but looser than '**'
+MAX_EXPRESSION_DEPTH = 200
+
+
+class Node:
+    # Common base for every AST node. Each subclass gets a small integer `kind`
+    # (its index in Node.node_classes) that visitors use to index their
+    # dispatch tables, and lists its child attributes in `_fields`.
+    __slots__ = ('line', 'col')
+    _fields = ()
+    node_classes = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.kind = len(Node.node_classes)
+        Node.node_classes.append(cls)
+
+
+class ProgramNode(Node):
+    __slots__ = ('functions', 'statements', 'scope')
+    _fields = ('functions', 'statements')
+
+    def __init__(self, functions, statements, line=None, col=None):
         self.functions = functions  # List of function definitions
         self.statements = statements  # List of top-level statements
+        self.scope = None  # Module scope, set by the resolver
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         # Start with a header
@@ -29,168 +71,361 @@ class Error:
         return f"Line {self.line_number}: {self.message}"
 
 
-class FunctionDefNode:
-    def __init__(self, name, parameters, body):
+class FunctionDefNode(Node):
+    __slots__ = ('name', 'parameters', 'body', 'scope')
+    _fields = ('body',)
+
+    def __init__(self, name, parameters, body, line=None, col=None):
         self.name = name
         self.parameters = parameters
         self.body = body
+        self.scope = None  # Scope of the parameters and locals, set by the resolver
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"FunctionDefNode(name={repr(self.name)}, parameters={repr(self.parameters)}, body={repr(self.body)})"
     
-class ReturnNode:
-    def __init__(self, value=None):
+class ReturnNode(Node):
+    __slots__ = ('value',)
+    _fields = ('value',)
+
+    def __init__(self, value=None, line=None, col=None):
         self.value = value 
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"ReturnNode(value={self.value})"
 
-class FunctionCallNode:
-    def __init__(self, function_name, arguments):
+class FunctionCallNode(Node):
+    __slots__ = ('function_name', 'arguments')
+    _fields = ('arguments',)
+
+    def __init__(self, function_name, arguments, line=None, col=None):
         self.function_name = function_name
         self.arguments = arguments
+        self.line = line
+        self.col = col
     def __repr__(self):
         return f"FunctionCallNode(function_name={self.function_name}, arguments={self.arguments})"
 
 
-class PrintNode:
-    def __init__(self, parameters):
+class PrintNode(Node):
+    __slots__ = ('parameters',)
+    _fields = ('parameters',)
+
+    def __init__(self, parameters, line=None, col=None):
         self.parameters = parameters
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"PrintNode(expression={repr(self.parameters)})"
 
 
-class AssignmentNode:
-    def __init__(self, identifier, expression):
+class AssignmentNode(Node):
+    __slots__ = ('identifier', 'expression')
+    _fields = ('identifier', 'expression')
+
+    def __init__(self, identifier, expression, line=None, col=None):
         self.identifier = identifier
         self.expression = expression
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"AssignmentNode(identifier={repr(self.identifier)}, expression={repr(self.expression)})"
     
-class AugmentedAssignmentNode:
-    def __init__(self, identifier, operator, expression):
+class AugmentedAssignmentNode(Node):
+    __slots__ = ('identifier', 'operator', 'expression')
+    _fields = ('identifier', 'expression')
+
+    def __init__(self, identifier, operator, expression, line=None, col=None):
         self.identifier = identifier
         self.operator = operator
         self.expression = expression
+        self.line = line
+        self.col = col
     
     def __repr__(self):
         return f"AssignmentNode(identifier={repr(self.identifier)}, operator={repr(self.operator)} expression={repr(self.expression)})"
     
-class ListNode:
-    def __init__(self, elements):
+class ListNode(Node):
+    __slots__ = ('elements',)
+    _fields = ('elements',)
+
+    def __init__(self, elements, line=None, col=None):
         self.elements = elements
+        self.line = line
+        self.col = col
     
     def __repr__(self):
         return f"ListNode({self.elements})"
 
 
-class IfNode:
-    def __init__(self, condition, block, elif_condition=None, elif_block=None, else_block=None):
+class IfNode(Node):
+    __slots__ = ('condition', 'block', 'elif_condition', 'elif_block', 'else_block')
+    _fields = ('condition', 'block', 'elif_condition', 'elif_block', 'else_block')
+
+    def __init__(self, condition, block, elif_condition=None, elif_block=None, else_block=None, line=None, col=None):
         self.condition = condition
         self.block = block
         self.elif_condition = elif_condition
         self.elif_block = elif_block
         self.else_block = else_block
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return (f"IfNode(condition={repr(self.condition)}, block={repr(self.block)}, "
                 f"elif_condition={repr(self.elif_condition)}, elif_block={repr(self.elif_block)}, "
                 f"else_block={repr(self.else_block)})")
 
-class ForNode:
-    def __init__(self, variable, collection, block):
+class ForNode(Node):
+    __slots__ = ('variable', 'collection', 'block')
+    _fields = ('variable', 'collection', 'block')
+
+    def __init__(self, variable, collection, block, line=None, col=None):
         self.variable = variable  
         self.collection = collection 
         self.block = block 
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"ForNode(variable={repr(self.variable)}, collection={repr(self.collection)}, block={repr(self.block)})"
 
-class RangeNode:
-    def __init__(self, start, stop, step):
+class RangeNode(Node):
+    __slots__ = ('start', 'stop', 'step')
+    _fields = ('start', 'stop', 'step')
+
+    def __init__(self, start, stop, step, line=None, col=None):
         self.start = start
         self.stop = stop
         self.step = step
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"RangeNode(start={self.start}, stop={self.stop}, step={self.step})"
 
 
-class WhileNode:
-    def __init__(self, condition, block):
+class WhileNode(Node):
+    __slots__ = ('condition', 'block')
+    _fields = ('condition', 'block')
+
+    def __init__(self, condition, block, line=None, col=None):
         self.condition = condition
         self.block = block
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"WhileNode(condition={repr(self.condition)}, block={repr(self.block)})"
 
 
-class BinaryOpNode:
-    def __init__(self, left, operator, right):
+class BinaryOpNode(Node):
+    __slots__ = ('left', 'operator', 'right')
+    _fields = ('left', 'right')
+
+    def __init__(self, left, operator, right, line=None, col=None):
         self.left = left
         self.operator = operator
         self.right = right
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"BinaryOpNode(left={repr(self.left)}, operator={repr(self.operator)}, right={repr(self.right)})"
 
 
-class NumberNode:
-    def __init__(self, value):
+class UnaryOpNode(Node):
+    __slots__ = ('operator', 'operand')
+    _fields = ('operand',)
+
+    def __init__(self, operator, operand, line=None, col=None):
+        self.operator = operator
+        self.operand = operand
+        self.line = line
+        self.col = col
+
+    def __repr__(self):
+        return f"UnaryOpNode(operator={repr(self.operator)}, operand={repr(self.operand)})"
+
+
+class NumberNode(Node):
+    __slots__ = ('value',)
+
+    def __init__(self, value, line=None, col=None):
         self.value = value
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"NumberNode(value={repr(self.value)})"
     
-class FloatNode:
-    def __init__(self, value):
+class FloatNode(Node):
+    __slots__ = ('value',)
+
+    def __init__(self, value, line=None, col=None):
         self.value = value
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"FloatNode(value={repr(self.value)})"
 
-class StringNode:
-    def __init__(self, value):
+class StringNode(Node):
+    __slots__ = ('value',)
+
+    def __init__(self, value, line=None, col=None):
         self.value = value 
+        self.line = line
+        self.col = col
     
     def __repr__(self):
         return f"StringNode({self.value})"
     
-class FStringNode:
-    def __init__(self, parts):
+class FStringNode(Node):
+    __slots__ = ('parts',)
+
+    def __init__(self, parts, line=None, col=None):
         self.parts = parts  
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"FStringNode(parts={repr(self.parts)})"
 
     
-class BooleanNode:
-    def __init__(self, value):
+class BooleanNode(Node):
+    __slots__ = ('value',)
+
+    def __init__(self, value, line=None, col=None):
         self.value = value  
+        self.line = line
+        self.col = col
     
     def __repr__(self):
         return f"BooleanNode({self.value})"
 
 
-class IdentifierNode:
-    def __init__(self, name):
+class IdentifierNode(Node):
+    __slots__ = ('name', 'symbol')
+
+    def __init__(self, name, line=None, col=None):
         self.name = name
+        self.symbol = None  # Symbol the name resolves to, set by the resolver
+        self.line = line
+        self.col = col
 
     def __repr__(self):
         return f"IdentifierNode(name={repr(self.name)})"
 
 
+# Node built by Parser.parse_literal for each literal token kind
+LITERAL_NODES = {T_NUMBER: NumberNode, T_FLOAT: FloatNode, T_STRING: StringNode}
+
+
+def walk(node):
+    # Every node of the tree under node, node included, without recursing
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        yield node
+        for field in node._fields:
+            value = getattr(node, field)
+            if isinstance(value, list):
+                pending.extend(item for item in value if isinstance(item, Node))
+            elif isinstance(value, Node):
+                pending.append(value)
+
+
+# Visitor dispatch tables, built once per visitor class: node kind -> function
+dispatch_tables = {}
+
+def build_dispatch_table(visitor_class):
+    table = dispatch_tables.get(visitor_class)
+    if table is None or len(table) != len(Node.node_classes):
+        table = [getattr(visitor_class, 'visit_' + node_class.__name__, visitor_class.generic_visit)
+                 for node_class in Node.node_classes]
+        dispatch_tables[visitor_class] = table
+    return table
+
+
+class NodeVisitor:
+    # Subclasses define visit_<ClassName> methods; anything without one falls
+    # back to generic_visit, which visits the children listed in _fields.
+    def __new__(cls, *args, **kwargs):
+        self = super().__new__(cls)
+        self.dispatch_table = build_dispatch_table(cls)
+        return self
+
+    def visit(self, node):
+        return self.dispatch_table[node.kind](self, node)
+
+    def generic_visit(self, node):
+        for field in node._fields:
+            value = getattr(node, field)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, Node):
+                        self.visit(item)
+            elif isinstance(value, Node):
+                self.visit(value)
+
+
+class NodeTransformer(NodeVisitor):
+    # visit_* methods return the replacement node. Inside a list, returning None
+    # removes the node and returning a list splices its contents in place.
+    def generic_visit(self, node):
+        for field in node._fields:
+            value = getattr(node, field)
+            if isinstance(value, list):
+                new_values = []
+                for item in value:
+                    if isinstance(item, Node):
+                        item = self.visit(item)
+                        if item is None:
+                            continue
+                        if isinstance(item, list):
+                            new_values.extend(item)
+                            continue
+                    new_values.append(item)
+                value[:] = new_values
+            elif isinstance(value, Node):
+                setattr(node, field, self.visit(value))
+        return node
+
+
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, tracer=NO_TRACE):
+        # Accepts a TokenStream, a TokenWindow over the lexer or a plain list of (type, value, line) tuples
+        if isinstance(tokens, (list, tuple)):
+            tokens = TokenList(tokens)
         self.tokens = tokens
+        self.trace = tracer
         self.pos = 0
         self.errors = []
         self.success = True
+        self.depth = 0
+
+        # Expression handlers keyed by the kind of the token that starts them
+        self.prefix_handlers = {
+            T_IDENTIFIER: self.parse_name,
+            T_NUMBER: self.parse_literal,
+            T_FLOAT: self.parse_literal,
+            T_STRING: self.parse_literal,
+            T_TRUE: self.parse_boolean,
+            T_FALSE: self.parse_boolean,
+            T_LPAREN: self.parse_group,
+            T_LBRACK: self.parse_list,
+            T_MINUS: self.parse_unary,
+        }
 
     def add_error(self, message):
-        line_number = self.current_token()[2] if self.current_token() else "Unknown"
+        line_number = self.tokens.line(self.pos) if self.current_kind() is not None else "Unknown"
         self.errors.append(Error(message, line_number))
         self.success = False
 
@@ -203,21 +438,37 @@ class Parser:
             print("No syntax errors found.")
 
     def current_token(self):
-        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+        return self.tokens.token(self.pos)
+
+    def current_kind(self):
+        return self.tokens.kind(self.pos)
+
+    def current_value(self):
+        if self.current_kind() is None:
+            return None  # End of input
+        return self.tokens.value(self.pos)
+
+    def location(self):
+        # (line, col) of the current token, stamped onto the node that starts there
+        if self.current_kind() is None:
+            return None, None
+        return self.tokens.line(self.pos), self.tokens.column(self.pos)
 
     def skip_ignorable_tokens(self):
-        while self.current_token() and self.current_token()[0] in {'NEWLINE', 'WHITESPACE', 'COMMENT'}:
+        while self.tokens.kind(self.pos) in IGNORABLE_KINDS:
             self.pos += 1
 
-    def eat(self, token_type):
+    def eat(self, kind):
         self.skip_ignorable_tokens()
-        if self.current_token() and self.current_token()[0] == token_type:
-            print(f"DEBUG: Consuming token: {self.current_token()}")
+        current = self.current_kind()
+        if current == kind:
+            if self.trace.parse:
+                self.trace.emit('parse', 'token', self.current_token())
             self.pos += 1
-        elif self.current_token() is None:
-            self.add_error(f"Expected {token_type}, got {self.current_token()}")
+        elif current is None:
+            self.add_error(f"Expected {TOKEN_TYPES[kind]}, got {self.current_token()}")
         else:
-            self.add_error(f"Expected {token_type}, got {self.current_token()[0]}")
+            self.add_error(f"Expected {TOKEN_TYPES[kind]}, got {TOKEN_TYPES[current]}")
 
 
     def parse(self):
@@ -225,84 +476,91 @@ class Parser:
         functions = []
         statements = []
 
-        while self.current_token() is not None:
+        while self.current_kind() is not None:
             self.skip_ignorable_tokens()
-            if self.current_token()[0] == "DEF":
-                is_main = self.current_token()[1] == "main"
+            if self.current_kind() == T_DEF:
+                is_main = self.peek_kind() == T_MAIN
                 functions.append(self.parse_function_def(is_main))
             else:
                 statements.append(self.parse_statement())
             self.skip_ignorable_tokens()
 
+        if self.tokens.errors:
+            # Indentation errors from the lexer come before anything they caused
+            self.errors[:0] = [Error(message, line) for line, message in self.tokens.errors]
+            self.success = False
         return ProgramNode(functions, statements), self.success
 
 
     def parse_function_def(self, main = False): # Add parameter to check if function is 'main' or not
-        self.eat('DEF')
-        if not main and self.current_token()[0] != 'IDENTIFIER':
+        line, col = self.location()
+        self.eat(T_DEF)
+        if not main and self.current_kind() != T_IDENTIFIER:
             self.add_error("Expected function name after 'def'")
-        func_name = 'main' if main else self.current_token()[1]
-        print(f"DEBUG: Function name: {func_name}")
-        self.eat('MAIN' if main else 'IDENTIFIER') # Eat main if main
-        if self.current_token()[0] != 'LPAREN':
+        func_name = 'main' if main else self.current_value()
+        self.eat(T_MAIN if main else T_IDENTIFIER) # Eat main if main
+        if self.current_kind() != T_LPAREN:
             self.add_error("Expected '(' after function name")
-        self.eat('LPAREN')
+        self.eat(T_LPAREN)
         parameters = self.parse_parameters()
-        if self.current_token()[0] != 'RPAREN':
+        if self.current_kind() != T_RPAREN:
             self.add_error("Expected ')' after function parameters")
-        self.eat('RPAREN')
-        if self.current_token()[0] != 'COLON':
+        self.eat(T_RPAREN)
+        if self.current_kind() != T_COLON:
             self.add_error("Expected ':' after function declaration")
-        self.eat('COLON')
+        self.eat(T_COLON)
         body = self.parse_block(in_function = True)
-        node = FunctionDefNode(func_name, parameters, body)
-        print(f"DEBUG: FunctionDefNode created: {node}")
+        node = FunctionDefNode(func_name, parameters, body, line, col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
         return node
     
     def parse_function_call(self):
-        token = self.current_token()
-        if token[0] != 'IDENTIFIER':
-            self.add_error(f"Expected function name, found {token}")
+        line, col = self.location()
+        if self.current_kind() != T_IDENTIFIER:
+            self.add_error(f"Expected function name, found {self.current_token()}")
 
-        function_name = token[1]  # Save the function name
-        self.eat('IDENTIFIER')  # Consume the identifier
+        function_name = self.current_value()  # Save the function name
+        self.eat(T_IDENTIFIER)  # Consume the identifier
 
         # Ensure the next token is an opening parenthesis
-        if self.current_token()[0] != 'LPAREN':
+        if self.current_kind() != T_LPAREN:
             self.add_error(f"Expected '(' after function name, found {self.current_token()}")
 
-        self.eat('LPAREN')  # Consume '('
+        self.eat(T_LPAREN)  # Consume '('
         arguments = []
 
         # Parse arguments if present
-        if self.current_token()[0] != 'RPAREN':  # Not an empty argument list
+        if self.current_kind() != T_RPAREN:  # Not an empty argument list
             while True:
                 arguments.append(self.parse_expression())  # Parse an argument expression
-                if self.current_token()[0] == 'COMMA':  # Handle comma-separated arguments
-                    self.eat('COMMA')
+                if self.current_kind() == T_COMMA:  # Handle comma-separated arguments
+                    self.eat(T_COMMA)
                 else:
                     break
 
         # Ensure the closing parenthesis is present
-        if self.current_token()[0] != 'RPAREN':
+        if self.current_kind() != T_RPAREN:
             self.add_error(f"Expected ')' after arguments, found {self.current_token()}")
 
-        self.eat('RPAREN')  # Consume ')'
+        self.eat(T_RPAREN)  # Consume ')'
 
         # Create and return the function call node
-        node = FunctionCallNode(function_name=function_name, arguments=arguments)
-        print(f"DEBUG: FunctionCallNode created: {node}")
+        node = FunctionCallNode(function_name=function_name, arguments=arguments, line=line, col=col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
         return node
 
     
     def parse_return(self):
+        line, col = self.location()
         # Ensure the current token is 'RETURN'
-        if self.current_token()[0] != 'RETURN':
+        if self.current_kind() != T_RETURN:
             self.add_error("Expected 'RETURN'")
 
-        self.eat('RETURN')  # Consume the 'RETURN' token
+        self.eat(T_RETURN)  # Consume the 'RETURN' token
 
-        if self.current_token() and self.current_token()[0] not in {'SEMICOLON', 'NEWLINE'}:
+        if self.current_kind() is not None and self.current_kind() not in RETURN_END_KINDS:
             # Parse the expression being returned
             return_value = self.parse_expression()
         else:
@@ -310,353 +568,378 @@ class Parser:
             return_value = None
 
         # Create a ReturnNode
-        node = ReturnNode(value=return_value)
-        print(f"DEBUG: ReturnNode created: {node}")
+        node = ReturnNode(value=return_value, line=line, col=col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
         return node
 
 
     def parse_parameters(self):
         params = []
-        while self.current_token() and self.current_token()[0] == 'IDENTIFIER':
-            params.append(self.current_token()[1])
-            self.eat('IDENTIFIER')
-            if self.current_token()[0] not in ['COMMA', 'RPAREN']:
+        while self.current_kind() == T_IDENTIFIER:
+            params.append(self.current_value())
+            self.eat(T_IDENTIFIER)
+            if self.current_kind() not in (T_COMMA, T_RPAREN):
                 self.add_error("Expected ',' or ')' after parameter")
-            if self.current_token() and self.current_token()[0] == 'COMMA':
-                self.eat('COMMA')
-                if self.current_token()[0] == 'RPAREN':
+            if self.current_kind() == T_COMMA:
+                self.eat(T_COMMA)
+                if self.current_kind() == T_RPAREN:
                     self.add_error("Expected parameter after ','")
-        print(f"DEBUG: Parsed parameters: {params}")
         return params
     
     def parse_parameter(self):
         expression = self.parse_expression()
-        print(f"DEBUG: Parsed expression: {expression}")
         return expression
     
 
     def parse_block(self, in_function=False):
         statements = []
         
-        self.eat('INDENT') 
-        print("in block")
+        self.eat(T_INDENT) 
+        if self.trace.parse:
+            self.trace.emit('parse', 'enter_block')
 
-        while self.current_token() and self.current_token()[0] != 'DEDENT':
+        while self.current_kind() is not None and self.current_kind() != T_DEDENT:
             self.skip_ignorable_tokens()
 
             if self.current_token() is None:
                 break
-            elif self.current_token() and self.current_token()[0] == 'RETURN':
+            elif self.current_kind() == T_RETURN:
                 if in_function:
                     statements.append(self.parse_return())
                 else:
                     self.add_error("Return statement found outside of a function")
-            elif self.current_token()[0] in ['ELIF', 'ELSE']:
+                    self.pos += 1
+            elif self.current_kind() in (T_ELIF, T_ELSE):
                 self.add_error("Unexpected 'elif' or 'else' without matching 'if'")
-            elif self.current_token() and self.current_token()[0] in ['ELIF', 'ELSE']:
+                self.pos += 1
+            elif self.current_kind() in (T_ELIF, T_ELSE):
                 return statements
 
-            elif self.current_token() and self.current_token()[0] != 'DEDENT':
-                print(f"DEBUG: Parsing statement at token: {self.current_token()}")
-                statements.append(self.parse_statement())
+            elif self.current_kind() != T_DEDENT:
+                statements.append(self.parse_statement(in_function))
 
         if self.current_token() is not None:
-            self.eat('DEDENT')
-            print("Ate Dedent")
+            self.eat(T_DEDENT)
 
-        print(f"DEBUG: Parsed block: {statements}")
-        print("out of block")
+        if self.trace.parse:
+            self.trace.emit('parse', 'exit_block', statements)
         return statements
 
 
-    def parse_statement(self):
+    def parse_statement(self, in_function=False):
+        # in_function allows return, in any block nested in a function body
         self.skip_ignorable_tokens()
-        token_type = self.current_token()[0]
+        kind = self.current_kind()
 
-        print(f"DEBUG: Parsing statement of type: {token_type}")
-        if token_type == 'PRINT':
+        if self.trace.parse:
+            self.trace.emit('parse', 'statement', TOKEN_TYPES[kind])
+        if kind == T_PRINT:
             return self.parse_print()
-        elif token_type == 'IF':
-            return self.parse_if()
-        elif token_type == 'FOR':  
-            return self.parse_for()
-        elif token_type == 'WHILE':
-            return self.parse_while()
-        elif token_type == 'IDENTIFIER':
+        elif kind == T_IF:
+            return self.parse_if(in_function)
+        elif kind == T_FOR:  
+            return self.parse_for(in_function)
+        elif kind == T_WHILE:
+            return self.parse_while(in_function)
+        elif kind == T_IDENTIFIER:
             return self.parse_assignment()
-        elif token_type == 'INDENT':
-            self.eat('INDENT')
+        elif kind == T_INDENT:
+            self.eat(T_INDENT)
         else:
-            self.add_error(f"Unexpected token: {token_type}")
+            self.add_error(f"Unexpected token: {TOKEN_TYPES[kind]}")
+            self.pos += 1  # Skip it, otherwise the caller retries the same token forever
         
         self.skip_ignorable_tokens()
 
     def parse_print(self):
-        self.eat('PRINT')
-        self.eat('LPAREN')
+        line, col = self.location()
+        self.eat(T_PRINT)
+        self.eat(T_LPAREN)
 
         parameters = []
 
         parameters.append(self.parse_parameter())
 
-        while self.current_token() and self.current_token()[0] == 'COMMA':
-            self.eat('COMMA')
+        while self.current_kind() == T_COMMA:
+            self.eat(T_COMMA)
             parameters.append(self.parse_parameter())
         
-        self.eat('RPAREN')
-        node = PrintNode(parameters)
-        print(f"DEBUG: PrintNode created: {node}")
+        self.eat(T_RPAREN)
+        node = PrintNode(parameters, line, col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
         return node
 
 
-    def parse_if(self):
-        if self.current_token()[0] not in {'IF', 'ELIF', 'ELSE'}:
+    def parse_if(self, in_function=False):
+        line, col = self.location()
+        if self.current_kind() not in (T_IF, T_ELIF, T_ELSE):
             self.add_error(f"Expected 'IF', 'ELIF', or 'ELSE' but found {self.current_token()}")
         
-        if self.current_token()[0] == 'IF':
-            self.eat('IF')
-        elif self.current_token()[0] == 'ELIF':
-            self.eat('ELIF')
+        if self.current_kind() == T_IF:
+            self.eat(T_IF)
+        elif self.current_kind() == T_ELIF:
+            self.eat(T_ELIF)
 
         condition = self.parse_expression()
-        print(f"DEBUG: If/Elif condition: {condition}")
 
-        if self.current_token()[0] != 'COLON':
+        if self.current_kind() != T_COLON:
             self.add_error("Expected ':' after if/elif condition")
-        self.eat('COLON')
+        self.eat(T_COLON)
 
-        print("hi)")
-        block = self.parse_block()
+        block = self.parse_block(in_function)
         
 
         else_block = None
         elif_condition = None
         elif_block = None
 
-        while self.current_token() and (self.current_token()[0] == 'ELIF' or self.current_token()[0] == 'ELSE'):
-            if self.current_token()[0] == 'ELIF':
-                self.eat('ELIF')
+        while self.current_kind() in (T_ELIF, T_ELSE):
+            if self.current_kind() == T_ELIF:
+                self.eat(T_ELIF)
                 elif_condition = self.parse_expression()
-                print(f"DEBUG: Elif condition: {elif_condition}")
 
-                if self.current_token()[0] != 'COLON':
+                if self.current_kind() != T_COLON:
                     self.add_error("Expected ':' after elif condition")
-                self.eat('COLON')
+                self.eat(T_COLON)
 
-                elif_block = self.parse_block()
+                elif_block = self.parse_block(in_function)
             else: 
-                self.eat('ELSE')
+                self.eat(T_ELSE)
 
-                if self.current_token()[0] != 'COLON':
+                if self.current_kind() != T_COLON:
                     self.add_error("Expected ':' after else")
-                self.eat('COLON')
-                else_block = self.parse_block()
+                self.eat(T_COLON)
+                else_block = self.parse_block(in_function)
                 break 
 
-        node = IfNode(condition, block, elif_condition, elif_block, else_block)
-        print(f"DEBUG: IfNode created: {node}")
+        node = IfNode(condition, block, elif_condition, elif_block, else_block, line, col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
         return node
 
-    def parse_for(self):
-        self.eat('FOR')
-        if self.current_token()[0] != 'IDENTIFIER':
+    def parse_for(self, in_function=False):
+        line, col = self.location()
+        self.eat(T_FOR)
+        if self.current_kind() != T_IDENTIFIER:
             self.add_error("Expected identifier after 'for'")  
-        variable = IdentifierNode(self.current_token()[1])
-        self.eat('IDENTIFIER')
-        if self.current_token()[0] != 'IN':
+        variable = IdentifierNode(self.current_value(), *self.location())
+        self.eat(T_IDENTIFIER)
+        if self.current_kind() != T_IN:
             self.add_error("Expected 'in' in for loop") 
-        self.eat('IN')  
+        self.eat(T_IN)  
 
-        if self.current_token()[0]  == 'RANGE': 
+        if self.current_kind() == T_RANGE: 
             collection = self.parse_range()
         else:   
             collection = self.parse_expression()  
-        if self.current_token()[0] != 'COLON':
+        if self.current_kind() != T_COLON:
             self.add_error("Expected ':' after for loop condition")
-        self.eat('COLON') 
+        self.eat(T_COLON) 
 
-        block = self.parse_block()  
+        block = self.parse_block(in_function)  
 
-        node = ForNode(variable, collection, block)
-        print(f"DEBUG: ForNode created: {node}")
+        node = ForNode(variable, collection, block, line, col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
         return node
 
-    def parse_while(self):
-        self.eat('WHILE')
+    def parse_while(self, in_function=False):
+        line, col = self.location()
+        self.eat(T_WHILE)
         condition = self.parse_expression()
         
-        if self.current_token()[0] != 'COLON':
+        if self.current_kind() != T_COLON:
             self.add_error("Expected ':' after while condition")
-        self.eat('COLON') 
+        self.eat(T_COLON) 
 
-        block = self.parse_block()
+        block = self.parse_block(in_function)
 
-        node = WhileNode(condition, block)
-        print(f"DEBUG: WhileNode created: {node}")
+        node = WhileNode(condition, block, line, col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
 
         return node
 
     
     def parse_range(self):
-        self.eat('RANGE')
-        self.eat('LPAREN') 
-
-        list_expr = self.parse_expression()  
-        
-        self.eat('RPAREN')  
+        line, col = self.location()
+        self.eat(T_RANGE)
+        self.eat(T_LPAREN) 
+
+        arguments = [self.parse_expression()]
+        while self.current_kind() == T_COMMA:
+            self.eat(T_COMMA)
+            arguments.append(self.parse_expression())
+        if len(arguments) > 3:
+            self.add_error(f"range() takes at most 3 arguments, got {len(arguments)}")
+        self.eat(T_RPAREN)  
+
+        # range(stop), range(start, stop) or range(start, stop, step); a
+        # missing start is 0 and a missing step is 1
+        if len(arguments) == 1:
+            start, stop, step = None, arguments[0], None
+        else:
+            start, stop, step = (arguments + [None])[:3]
+        if isinstance(step, NumberNode) and int(step.value) == 0:
+            self.add_error("range() step must not be zero")
 
-        node = ListNode(list_expr)  
-        print(f"DEBUG: ListNode created: {node}")
+        node = RangeNode(start, stop, step, line, col)  
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
         return node
     
     def parse_list(self):
-        self.eat('LBRACK') 
+        line, col = self.location()
+        self.eat(T_LBRACK) 
         
         elements = [] 
         
-        while self.current_token()[0] != 'RBRACK': 
-            print(self.current_token())
+        # A list ends on its line; stop at the end of it rather than loop on
+        # an element that could not be parsed
+        while self.current_kind() not in (T_RBRACK, T_NEWLINE, None):
+            start = self.pos
             element = self.parse_expression()  
+            if element is None or self.pos == start:
+                break
             elements.append(element) 
             
-            if self.current_token()[0] == 'COMMA': 
-                self.eat('COMMA')
-            elif self.current_token()[0] != 'RBRACK':
-                self.add_error(f"Unexpected token: {self.current_token()}")
-        
-        self.eat('RBRACK')  
+            if self.current_kind() == T_COMMA: 
+                self.eat(T_COMMA)
+            elif self.current_kind() != T_RBRACK:
+                break
         
+        if self.current_kind() == T_RBRACK:
+            self.eat(T_RBRACK)  
+        else:
+            self.add_error("Expected ']'")
 
-        node = ListNode(elements)
-        print(f"DEBUG: ListNode created: {node}")
+        node = ListNode(elements, line, col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
         return node
 
 
     def parse_assignment(self):
-        identifier = self.current_token()[1]
-        self.eat('IDENTIFIER')
+        line, col = self.location()
+        identifier = self.current_value()
+        self.eat(T_IDENTIFIER)
 
-        if self.current_token()[0] not in ['ASSIGN', 'PLUS_ASSIGN', 'MINUS_ASSIGN', 'TIMES_ASSIGN', 'DIVIDE_ASSIGN']:
+        if self.current_kind() not in ASSIGN_KINDS:
             self.add_error("Expected assignment operator")
 
         operator = None
-        if self.current_token()[0] in {'PLUS_ASSIGN', 'MINUS_ASSIGN', 'TIMES_ASSIGN', 'DIVIDE_ASSIGN'}:
-            operator = self.current_token()[0]
-            self.eat(operator)
+        if self.current_kind() in AUGMENTED_ASSIGN_KINDS:
+            operator = TOKEN_TYPES[self.current_kind()]
+            self.eat(self.current_kind())
 
         if operator is None:
-            self.eat('ASSIGN')
+            self.eat(T_ASSIGN)
 
         expression = self.parse_expression()
 
         if operator:
-            node = AugmentedAssignmentNode(IdentifierNode(identifier), operator, expression)
-            print(f"DEBUG: AugmentedAssignmentNode created: {node}")
+            node = AugmentedAssignmentNode(IdentifierNode(identifier, line, col), operator, expression, line, col)
+            if self.trace.parse:
+                self.trace.emit('parse', 'node', node)
         else:
-            node = AssignmentNode(IdentifierNode(identifier), expression)
-            print(f"DEBUG: AssignmentNode created: {node}")
+            node = AssignmentNode(IdentifierNode(identifier, line, col), expression, line, col)
+            if self.trace.parse:
+                self.trace.emit('parse', 'node', node)
     
         return node
 
-    def parse_expression(self):
-        left = self.parse_term()
-        while self.current_token() and self.current_token()[0] in {'PLUS', 'MINUS', 'GT', 'LT', 'EQ'}:
-            operator = self.current_token()[1]
-            self.eat(self.current_token()[0])
-            right = self.parse_term()
-            left = BinaryOpNode(left, operator, right)
-            print(f"DEBUG: BinaryOpNode created: {left}")
-        return left
-
-    def parse_term(self):
-        left = self.parse_factor()
-        while self.current_token() and self.current_token()[0] in {'MULT', 'DIV', 'MOD'}:
-            operator = self.current_token()[1]
-            self.eat(self.current_token()[0])
-            right = self.parse_factor()
-            left = BinaryOpNode(left, operator, right)
-            print(f"DEBUG: BinaryOpNode created: {left}")
-        return left
-
-    def parse_factor(self):
-        left = self.parse_element()
-        while self.current_token() and self.current_token()[0] in {'EXP'}:
-            operator = self.current_token()[1]
-            self.eat(self.current_token()[0])
-            right = self.parse_factor()
-            left = BinaryOpNode(left, operator, right)
-            print(f"DEBUG: BinaryOpNode created: {left}")
-        return left
-    
-    def parse_element(self):
-        if self.current_token()[0] == 'IDENTIFIER':
-            token = self.current_token()
-            
-            # Check if the next token is LPAREN, indicating a function call
-            if self.peek_next_token() and self.peek_next_token()[0] == 'LPAREN':
-                return self.parse_function_call()
-            else:
-                # Plain identifier
-                self.eat('IDENTIFIER')
-                node = IdentifierNode(token[1])
-                print(f"DEBUG: IdentifierNode created: {node}")
-                return node
-        
-        elif self.current_token()[0] == 'LBRACK':
-            print(f"DEBUG: Detected LBRACK, attempting to parse list at token: {self.current_token()}")
-            node = self.parse_list()
-            print(f"DEBUG: ListNode created: {node}")
-            return node
-
-        elif self.current_token()[0] == 'NUMBER':
-            token = self.current_token()
-            self.eat('NUMBER')
-            node = NumberNode(token[1])
-            print(f"DEBUG: NumberNode created: {node}")
-            return node
-
-        elif self.current_token()[0] == 'FLOAT':
-            token = self.current_token()
-            self.eat('FLOAT')
-            node = FloatNode(token[1])
-            print(f"DEBUG: FloatNode created: {node}")
-            return node
-
-        elif self.current_token()[0] == 'STRING': 
-            token = self.current_token()
-            self.eat('STRING')
-            node = StringNode(token[1])  
-            print(f"DEBUG: StringNode created: {node}")
-            return node
-
-        elif self.current_token()[0] == 'TRUE':  
-            token = self.current_token()
-            self.eat('TRUE')
-            node = BooleanNode(True) 
-            print(f"DEBUG: BooleanNode created: {node}")
-            return node
-
-        elif self.current_token()[0] == 'FALSE':  
-            token = self.current_token()
-            self.eat('FALSE')
-            node = BooleanNode(False)  
-            print(f"DEBUG: BooleanNode created: {node}")
-            return node
-
-        elif self.current_token()[0] == 'LPAREN':
-            self.eat('LPAREN')
-            node = self.parse_expression()  
-            self.eat('RPAREN') 
-            print(f"DEBUG: Parenthesized expression node: {node}")
-            return node
+    def parse_expression(self, min_power=0):
+        # Pratt parser: one prefix handler for the first token, then infix
+        # operators are folded in a loop for as long as they bind tighter than
+        # min_power. Operator chains never add recursion depth.
+        self.depth += 1
+        try:
+            if self.depth > MAX_EXPRESSION_DEPTH:
+                self.add_error("Expression nested too deeply")
+                # Give up on the rest of the line rather than reporting every unclosed level
+                while self.current_kind() not in (None, T_NEWLINE):
+                    self.pos += 1
+                return None
+
+            handler = self.prefix_handlers.get(self.current_kind())
+            if handler is None:
+                self.add_error("Expected ELEMENT but found " + str(self.current_token()))
+                return None
+            left = handler()
+            if left is None:
+                return None
+            # Binary nodes take the position of their leftmost operand
+            line, col = left.line, left.col
 
-        else:
-            self.add_error("Expected ELEMENT but found " + str(self.current_token()))
+            while True:
+                kind = self.current_kind()
+                powers = INFIX_BINDING_POWERS.get(kind)
+                if powers is None or powers[0] <= min_power:
+                    return left
+                operator = self.current_value()
+                self.eat(kind)
+                right = self.parse_expression(powers[1])
+                left = BinaryOpNode(left, operator, right, line, col)
+                if self.trace.parse:
+                    self.trace.emit('parse', 'node', left)
+        finally:
+            self.depth -= 1
+
+    def parse_name(self):
+        # Check if the next token is LPAREN, indicating a function call
+        if self.peek_kind() == T_LPAREN:
+            return self.parse_function_call()
+
+        # Plain identifier
+        line, col = self.location()
+        node = IdentifierNode(self.current_value(), line, col)
+        self.eat(T_IDENTIFIER)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
+        return node
+
+    def parse_literal(self):
+        line, col = self.location()
+        kind = self.current_kind()
+        value = self.current_value()
+        self.eat(kind)
+        node = LITERAL_NODES[kind](value, line, col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
+        return node
+
+    def parse_boolean(self):
+        line, col = self.location()
+        kind = self.current_kind()
+        self.eat(kind)
+        node = BooleanNode(kind == T_TRUE, line, col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
+        return node
+
+    def parse_group(self):
+        self.eat(T_LPAREN)
+        node = self.parse_expression()
+        self.eat(T_RPAREN)
+        return node
+
+    def parse_unary(self):
+        line, col = self.location()
+        operator = self.current_value()
+        self.eat(self.current_kind())
+        operand = self.parse_expression(PREFIX_BINDING_POWER)
+        node = UnaryOpNode(operator, operand, line, col)
+        if self.trace.parse:
+            self.trace.emit('parse', 'node', node)
+        return node
 
     def peek_next_token(self):
-        if self.pos + 1 < len(self.tokens):
-            return self.tokens[self.pos + 1]
-        return None
+        return self.tokens.token(self.pos + 1)
+
+    def peek_kind(self):
+        return self.tokens.kind(self.pos + 1)
 
 
 
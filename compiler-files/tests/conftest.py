@@ -0,0 +1,49 @@
+import os
+import sys
+
+# The compiler is a flat set of modules one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import contextlib
+import io
+import shutil
+import subprocess
+
+import pytest
+
+from lexer import LexicalAnalyzer
+from native import NativeGenerator, build_executable
+from resolver import resolve_names
+from syntax import Parser
+
+
+def parse_program(code):
+    ast, success = Parser(LexicalAnalyzer().tokenize_stream(code)).parse()
+    assert success
+    assert not resolve_names(ast)
+    return ast
+
+
+@pytest.fixture
+def run_exec():
+    # What Python prints for a program, as --run exec does
+    def run(code):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            exec(code, {})
+        return output.getvalue()
+    return run
+
+
+@pytest.fixture
+def run_native(tmp_path):
+    # What the program prints when built with the native backend, as --run native does
+    if shutil.which('as') is None or shutil.which('ld') is None:
+        pytest.skip("the native backend needs GNU binutils")
+
+    def run(code, passes=None):
+        generator = NativeGenerator(passes=passes)
+        generator.generate_assembly(parse_program(code))
+        executable = build_executable(generator.assembly_code, str(tmp_path / 'program'))
+        return subprocess.run([executable], capture_output=True, text=True, timeout=30, check=True).stdout
+    return run
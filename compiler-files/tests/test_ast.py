@@ -0,0 +1,68 @@
+import pickle
+
+import pytest
+
+from lexer import LexicalAnalyzer
+from syntax import *
+
+CODE = "def f(a):\n    b = a + 1\n    return b\n\nx = f(2)\nif x > 1:\n    print(x)\n"
+
+
+def parse(code):
+    ast, success = Parser(LexicalAnalyzer().tokenize_stream(code)).parse()
+    assert success
+    return ast
+
+
+def test_nodes_have_no_instance_dict():
+    for node in walk(parse(CODE)):
+        with pytest.raises(AttributeError):
+            node.__dict__
+
+
+def test_node_kinds_index_the_class_list():
+    for node_class in Node.node_classes:
+        assert Node.node_classes[node_class.kind] is node_class
+
+
+def test_visitor_dispatches_by_class_and_falls_back_to_generic_visit():
+    class Names(NodeVisitor):
+        def __init__(self):
+            self.names = []
+
+        def visit_IdentifierNode(self, node):
+            self.names.append(node.name)
+
+    visitor = Names()
+    visitor.visit(parse(CODE))
+    assert sorted(set(visitor.names)) == ['a', 'b', 'x']
+
+
+def test_transformer_can_remove_and_splice_statements():
+    class Rewrite(NodeTransformer):
+        def visit_PrintNode(self, node):
+            return None
+
+        def visit_AssignmentNode(self, node):
+            return [node, node]
+
+    ast = Rewrite().visit(parse("x = 1\nprint(x)\n"))
+    assert [type(node).__name__ for node in ast.statements] == ['AssignmentNode', 'AssignmentNode']
+
+
+def test_walk_visits_every_node_once():
+    ast = parse(CODE)
+    nodes = list(walk(ast))
+    assert len(nodes) == len(set(map(id, nodes)))
+    assert sum(isinstance(node, FunctionDefNode) for node in nodes) == 1
+    assert nodes[0] is ast
+
+
+def test_walk_handles_deep_expressions():
+    ast = parse("x = " + " + ".join(["1"] * 5000) + "\n")
+    assert sum(isinstance(node, NumberNode) for node in walk(ast)) == 5000
+
+
+def test_ast_survives_pickling():
+    ast = parse(CODE)
+    assert repr(pickle.loads(pickle.dumps(ast))) == repr(ast)
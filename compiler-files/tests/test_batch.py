@@ -0,0 +1,66 @@
+import io
+import os
+
+from batch import collect_sources, compile_batch, compile_file, run_batch
+
+GOOD = "x = 1\nwhile x < 5:\n    x = x + 1\nprint(x)\n"
+BAD = "x = = 1\n"
+
+
+def write(directory, name, text):
+    path = os.path.join(directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(text)
+    return path
+
+
+def test_collect_sources_keeps_argument_order(tmp_path):
+    root = str(tmp_path)
+    b = write(root, 'b.py', GOOD)
+    a = write(root, 'a.py', GOOD)
+    nested = write(root, 'sub/c.txt', GOOD)
+    write(root, 'notes.md', 'skip me')
+    assert collect_sources([b, root]) == [b, a, nested]
+    assert collect_sources([os.path.join(root, '*.py')]) == [a, b]
+    assert collect_sources([os.path.join(root, '**', '*.txt')]) == [nested]
+
+
+def test_compile_file_reports_errors_and_failures(tmp_path):
+    good = compile_file(write(str(tmp_path), 'good.py', GOOD))
+    assert good.success and good.assembly and good.lines == 4
+    bad = compile_file(write(str(tmp_path), 'bad.py', BAD))
+    assert not bad.success and bad.errors and bad.failure is None
+    missing = compile_file(str(tmp_path / 'missing.py'))
+    assert missing.failure.startswith('cannot read')
+
+
+def test_parallel_batch_matches_serial(tmp_path):
+    paths = [write(str(tmp_path), f'{index:02}.py', GOOD.replace('5', str(index + 2))) for index in range(12)]
+    paths.append(write(str(tmp_path), 'bad.py', BAD))
+    serial = list(compile_batch(paths, jobs=1))
+    parallel = list(compile_batch(paths, jobs=3))
+    assert [result.path for result in parallel] == paths
+    assert [(result.success, result.errors, result.assembly) for result in parallel] == \
+        [(result.success, result.errors, result.assembly) for result in serial]
+
+
+def test_batch_uses_the_cache(tmp_path):
+    path = write(str(tmp_path), 'a.py', GOOD)
+    cache_dir = str(tmp_path / 'cache')
+    assert not next(compile_batch([path], cache_dir=cache_dir)).cached
+    assert next(compile_batch([path], cache_dir=cache_dir)).cached
+
+
+def test_run_batch_prints_in_input_order(tmp_path):
+    first = write(str(tmp_path), 'first.py', GOOD)
+    bad = write(str(tmp_path), 'bad.py', BAD)
+    last = write(str(tmp_path), 'last.py', GOOD)
+    out, err = io.StringIO(), io.StringIO()
+    failed = run_batch([first, bad, last], jobs=2, out=out, err=err)
+    assert failed == 1
+    text = out.getvalue()
+    assert text.index(f'; {first}') < text.index(f'; {last}')
+    assert bad not in text
+    assert f'{bad}: ' in err.getvalue()
+    assert '3 files (1 failed)' in err.getvalue()
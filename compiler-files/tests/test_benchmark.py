@@ -0,0 +1,49 @@
+import pytest
+
+from asm import Instruction
+from benchmark import bench_phases, compare_reports, count_ir_instructions, run_suite
+from generator import CodeGenerator
+from workloads import generate_program
+
+from conftest import parse_program
+
+
+def test_codegen_counts_say_what_they_count():
+    code = generate_program('expressions', 20)
+    results = bench_phases(code, 1)['codegen']
+    generator = CodeGenerator()
+    generator.generate_assembly(parse_program(code))
+    emitted = [item for item in generator.assembly_code if isinstance(item, Instruction)]
+    assert results['unit'] == 'IR instrs'
+    assert results['items'] == count_ir_instructions(parse_program(code))
+    assert results['instructions'] == len(emitted)
+    assert results['assembly_lines'] == len(generator.assembly_code)
+    # Folding leaves far fewer instructions to emit than were lowered
+    assert results['instructions'] < results['items']
+
+
+def test_suite_reports_every_phase(capsys):
+    report = run_suite(['flat', 'nested'], 20, 0, 1)
+    assert set(report['workloads']) == {'flat', 'nested'}
+    for workload in report['workloads'].values():
+        assert set(workload['phases']) == {'lex', 'parse', 'codegen'}
+    assert 'codegen' in capsys.readouterr().out
+
+
+def phase(per_second, peak_bytes):
+    return {'per_second': per_second, 'peak_bytes': peak_bytes}
+
+
+@pytest.mark.parametrize('speed, memory, flagged', [
+    (100, 1000, False),
+    (95, 1050, False),
+    (80, 1000, True),
+    (100, 1200, True),
+])
+def test_regressions_beyond_the_threshold_are_flagged(capsys, speed, memory, flagged):
+    baseline = {'workloads': {'flat': {'phases': {'lex': phase(100, 1000)}}}}
+    report = {'workloads': {'flat': {'phases': {'lex': phase(speed, memory)}},
+                            'nested': {'phases': {'lex': phase(1, 1)}}}}
+    regressions = compare_reports(baseline, report, 0.10)
+    assert bool(regressions) == flagged
+    assert 'nested' not in capsys.readouterr().out
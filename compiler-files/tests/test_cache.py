@@ -0,0 +1,73 @@
+import os
+import shutil
+
+import cache
+from cache import CompilationCache, compiler_fingerprint, compiler_modules
+from driver import compile_source
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PACKAGE = os.path.dirname(HERE)
+CODE = "x = 1\nwhile x < 10:\n    x = x + 1\nprint(x)\n"
+
+
+def test_fingerprint_covers_every_module_that_affects_output():
+    modules = compiler_modules(PACKAGE)
+    for name in ('lexer.py', 'syntax.py', 'resolver.py', 'ir.py', 'passes.py', 'generator.py', 'regalloc.py',
+                 'peephole.py', 'emitter.py', 'driver.py', 'stats.py', 'cache.py'):
+        assert name in modules
+
+
+def test_editing_any_module_changes_the_fingerprint(tmp_path, monkeypatch):
+    for name in compiler_modules(PACKAGE):
+        shutil.copy(os.path.join(PACKAGE, name), tmp_path / name)
+    monkeypatch.setattr(cache, '__file__', str(tmp_path / 'cache.py'))
+    monkeypatch.setattr(cache, '_fingerprint', None)
+    original = compiler_fingerprint()
+    for name in ('emitter.py', 'driver.py', 'stats.py'):
+        with open(tmp_path / name, 'a') as file:
+            file.write('\n# changed\n')
+        monkeypatch.setattr(cache, '_fingerprint', None)
+        changed = compiler_fingerprint()
+        assert changed != original
+        original = changed
+
+
+def test_second_compile_is_a_hit(tmp_path):
+    store = CompilationCache(str(tmp_path))
+    first = compile_source(CODE, cache=store)
+    second = compile_source(CODE, cache=store)
+    assert (store.hits, store.misses) == (1, 1)
+    assert not first.cached and second.cached
+    assert second.assembly == first.assembly
+    assert second.success
+
+
+def test_options_are_part_of_the_key(tmp_path):
+    store = CompilationCache(str(tmp_path))
+    assert store.key(CODE, (('engine', 'regex'),)) != store.key(CODE, (('engine', 'table'),))
+    assert store.key(CODE) != store.key(CODE + '\n')
+    compile_source(CODE, engine='regex', cache=store)
+    compile_source(CODE, engine='table', cache=store)
+    assert store.misses == 2
+
+
+def test_corrupt_entry_is_dropped(tmp_path):
+    store = CompilationCache(str(tmp_path))
+    key = store.key(CODE)
+    with open(store.path(key), 'wb') as file:
+        file.write(b'not a pickle')
+    assert store.get(key) is None
+    assert not os.path.exists(store.path(key))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    store = CompilationCache(str(tmp_path), max_bytes=2500)
+    keys = [store.key(str(index)) for index in range(3)]
+    for index, key in enumerate(keys):
+        store.put(key, b'x' * 1000)
+        os.utime(store.path(key), ns=(index * 10 ** 9, index * 10 ** 9))
+    store.put(store.key('last'), b'x' * 1000)
+    assert store.get(keys[0]) is None
+    assert store.get(keys[2]) is not None
+    store.clear()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.entry')]
@@ -0,0 +1,59 @@
+import io
+
+import pytest
+
+from closures import compile_closures, contains_return
+from lexer import LexicalAnalyzer
+from syntax import Parser
+from workloads import SHAPES, generate_program
+
+from conftest import parse_program
+
+
+def run_closures(code):
+    output = io.StringIO()
+    compile_closures(parse_program(code))(output)
+    return output.getvalue()
+
+
+PROGRAMS = [
+    "x = 7\ny = x * 3 - 1\nprint(x, y, x / 2, x % 3, -x, x ** 2)\n",
+    "s = 0\ni = 0\nwhile i < 10:\n    if i % 3 == 0:\n        s = s + i\n    elif i % 3 == 1:\n        s += 2\n    else:\n        s -= 1\n    i += 1\nprint(s)\n",
+    "def fib(n):\n    r = n\n    if n >= 2:\n        r = fib(n - 1) + fib(n - 2)\n    return r\nprint(fib(15))\n",
+    "def twice(n):\n    return n * 2\ndef both(a, b):\n    return twice(a) + twice(b)\nprint(both(3, 4))\n",
+    "total = 0\nfor i in range(10, 0, -2):\n    total = total * 2 + i\nprint(total)\n",
+    "items = [3, 1, 2]\nfor n in items:\n    print(n * n, 'squared')\n",
+]
+
+
+@pytest.mark.parametrize('code', PROGRAMS)
+def test_closures_match_python(run_exec, code):
+    assert run_closures(code) == run_exec(code)
+
+
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+def test_closures_match_python_on_workloads(run_exec, shape):
+    code = generate_program(shape, 60, seed=3)
+    assert run_closures(code) == run_exec(code)
+
+
+def test_compiled_program_runs_again_to_another_stream():
+    program = compile_closures(parse_program("x = 0\nx = x + 1\nprint(x)\n"))
+    first, second = io.StringIO(), io.StringIO()
+    program(first)
+    program(second)
+    assert first.getvalue() == second.getvalue() == "1\n"
+
+
+def test_only_blocks_with_a_return_check_for_one():
+    ast = parse_program("def f(n):\n    while n > 0:\n        n = n - 1\n    return n\nx = 1\nprint(f(x))\n")
+    function = ast.functions[0]
+    assert contains_return(function.body)
+    assert not contains_return(function.body[0].block)
+    assert not contains_return(ast.statements)
+
+
+def test_calls_to_undefined_functions_are_refused():
+    ast, _success = Parser(LexicalAnalyzer().tokenize_stream("y = g(1)\n")).parse()
+    with pytest.raises(ValueError, match="undefined function 'g'"):
+        compile_closures(ast)
@@ -0,0 +1,110 @@
+import pytest
+
+from constants import evaluate, propagate_constants, wrap
+from ir import Lowering, Const, dominators, dominance_frontiers
+from passes import default_pass_manager
+from workloads import generate_program
+
+from conftest import parse_program
+
+
+def lowered(code):
+    return Lowering().lower_program(parse_program(code))
+
+
+def propagated(code):
+    module = lowered(code)
+    propagate_constants(module)
+    return module
+
+
+def printed(module):
+    # What each print in the top-level code prints, in order
+    return [instruction.args[0] for block in module.toplevel.blocks for instruction in block.instructions
+            if instruction.op == 'print']
+
+
+def values(module):
+    return [arg.value if isinstance(arg, Const) else None for arg in printed(module)]
+
+
+def test_arithmetic_wraps_like_the_machine():
+    assert wrap(0x7FFFFFFF + 1) == -0x80000000
+    assert evaluate('mul', [0x10000, 0x10000]) == 0
+    assert evaluate('neg', [-0x80000000]) == -0x80000000
+
+
+def test_division_that_would_trap_is_not_folded():
+    assert evaluate('div', [7, 0]) is None
+    assert evaluate('mod', [-0x80000000, -1]) is None
+
+
+def test_straight_line_constants():
+    assert values(propagated("x = 2\ny = x * 3 + 1\nprint(y)\nprint(y - x)\n")) == [7, 5]
+
+
+def test_branch_not_taken_does_not_spoil_a_value():
+    code = "x = 1\nif x == 2:\n    x = 5\nprint(x)\n"
+    assert values(propagated(code)) == [1]
+
+
+def test_values_that_differ_on_two_paths_are_not_constant():
+    code = "def f(n):\n    if n < 1:\n        x = 1\n    else:\n        x = 2\n    print(x)\n    return x\ny = f(0)\n"
+    module = propagated(code)
+    prints = [instruction for block in module.functions[0].blocks for instruction in block.instructions
+              if instruction.op == 'print']
+    assert not isinstance(prints[0].args[0], Const)
+
+
+def test_same_value_on_both_paths_is_constant():
+    code = "def f(n):\n    if n < 1:\n        x = 4\n    else:\n        x = 2 + 2\n    print(x)\n    return 0\ny = f(0)\n"
+    module = propagated(code)
+    prints = [instruction for block in module.functions[0].blocks for instruction in block.instructions
+              if instruction.op == 'print']
+    assert prints[0].args[0].value == 4
+
+
+def test_loop_counter_is_not_constant_but_invariants_are():
+    code = "i = 0\nk = 3\nwhile i < 10:\n    i = i + 1\n    k = k * 1\nprint(i)\nprint(k)\n"
+    assert values(propagated(code)) == [None, 3]
+
+
+def test_loop_that_never_runs_leaves_values_alone():
+    code = "i = 5\nx = 1\nwhile i < 3:\n    x = x + 1\n    i = i + 1\nprint(x)\n"
+    assert values(propagated(code)) == [1]
+
+
+def test_constant_branch_becomes_a_jump():
+    module = propagated("x = 3\nif x > 2:\n    print(1)\nelse:\n    print(2)\n")
+    assert not any(block.terminator.op == 'branch' for block in module.toplevel.blocks)
+
+
+def test_values_through_calls_are_not_constant():
+    code = "def f(n):\n    return n\nx = f(2)\nprint(x)\n"
+    assert values(propagated(code)) == [None]
+
+
+def test_phis_go_on_the_dominance_frontier():
+    module = lowered("def f(n):\n    x = 0\n    if n < 1:\n        x = 1\n    print(x)\n    return 0\ny = f(0)\n")
+    function = module.functions[0]
+    idom = dominators(function)
+    frontiers = dominance_frontiers(function, idom)
+    joins = [block for block in idom if len([p for p in function.predecessors()[block] if p in idom]) > 1]
+    assert joins
+    for join in joins:
+        assert any(join in frontier for frontier in frontiers.values())
+    assert all(block not in frontiers[block] or block in joins for block in frontiers)
+
+
+def test_deep_nesting_does_not_recurse():
+    # The dominator tree is walked without recursion
+    code = ''.join('    ' * depth + f"if x > {depth}:\n" for depth in range(60)) + '    ' * 60 + "print(x)\n"
+    module = propagated("x = 1000\n" + code)
+    assert values(module) == [1000]
+
+
+@pytest.mark.parametrize('shape, seed', [('flat', 0), ('flat', 1), ('nested', 0), ('nested', 5), ('functions', 2)])
+def test_propagation_keeps_what_the_program_prints(shape, seed, run_native):
+    code = generate_program(shape, 60, seed=seed)
+    without = [name for name in default_pass_manager().pipeline() if name != 'constant-propagation']
+    assert run_native(code) == run_native(code, default_pass_manager(pipeline=without))
@@ -0,0 +1,82 @@
+import pytest
+
+from deadcode import eliminate_dead_code, liveness, remove_unreachable_functions
+from ir import Lowering
+from passes import default_pass_manager
+from workloads import generate_program
+
+from conftest import parse_program
+
+
+def lowered(code):
+    return Lowering().lower_program(parse_program(code))
+
+
+def ops(function):
+    return [instruction.op for block in function.blocks for instruction in block.instructions]
+
+
+def eliminated(code):
+    module = lowered(code)
+    eliminate_dead_code(module)
+    return module
+
+
+def test_unused_values_and_entry_loads_go():
+    module = eliminated("def f(a, b):\n    x = a * 2\n    y = x + b\n    return a\ny = f(1, 2)\nprint(y)\n")
+    assert ops(module.functions[0]) == ['param']
+
+
+def test_side_effects_stay():
+    module = eliminated("def f(a):\n    x = a % a\n    y = g(a)\n    print(a)\n    return 0\n"
+                        "def g(a):\n    return a\ny = f(1)\n")
+    assert ops(module.functions[0]) == ['param', 'mod', 'call', 'print']
+
+
+def test_division_by_a_safe_constant_goes():
+    module = eliminated("def f(a):\n    x = a % 3\n    y = a % -1\n    return 0\ny = f(1)\n")
+    assert ops(module.functions[0]) == ['param', 'mod']
+
+
+def test_globals_stay_for_the_final_store():
+    module = eliminated("x = 1\ny = x + 1\n")
+    assert ops(module.toplevel).count('store') == 2
+    assert 'add' in ops(module.toplevel)
+
+
+def test_values_that_only_feed_themselves_go():
+    # j is updated around the loop but never read outside it
+    code = ("def f(n):\n    i = 0\n    j = 0\n    while i < n:\n        i = i + 1\n        j = j + i\n"
+            "    return i\ny = f(3)\n")
+    module = eliminated(code)
+    assert ops(module.functions[0]).count('add') == 1
+
+
+def test_unreachable_blocks_are_left_alone():
+    module = lowered("def f(n):\n    return n\n    x = n * 2\ny = f(1)\n")
+    eliminate_dead_code(module)
+    assert 'mul' in ops(module.functions[0])
+
+
+def test_liveness_follows_loops():
+    module = lowered("def f(n):\n    i = 0\n    while i < n:\n        i = i + 1\n    return i\ny = f(3)\n")
+    function = module.functions[0]
+    live_in, live_out = liveness(function)
+    names = lambda values: sorted(repr(value) for value in values)
+    header = [block for block in live_in if block.terminator.op == 'branch'][0]
+    assert names(live_in[header]) == ['i', 'n']
+    assert 'n' in names(live_out[function.blocks[0]])
+
+
+def test_unreachable_functions_go_but_entry_points_stay():
+    code = "def unused(a):\n    return a\ndef main():\n    return 0\ndef used(a):\n    return a\nx = used(1)\n"
+    module = lowered(code)
+    remove_unreachable_functions(module)
+    assert sorted(function.name for function in module.functions) == ['main', 'used']
+
+
+@pytest.mark.parametrize('shape, seed', [('flat', 3), ('nested', 1), ('nested', 4), ('functions', 0)])
+def test_elimination_keeps_what_the_program_prints(shape, seed, run_native):
+    code = generate_program(shape, 60, seed=seed)
+    without = [name for name in default_pass_manager().pipeline() if name != 'dead-code']
+    assert run_native(code) == run_native(code, default_pass_manager(pipeline=without))
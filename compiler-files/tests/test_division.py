@@ -0,0 +1,72 @@
+import pytest
+
+from constants import evaluate
+from driver import compile_source
+from generator import CodeGenerator
+from ir import Instruction, Temp, Var
+from native import NativeGenerator
+from passes import default_pass_manager
+
+from conftest import parse_program
+
+# Compiled code only has integers, so / does not compile since it gives a
+# float. The IR's div and mod round down and % takes the sign of the divisor,
+# as in Python.
+
+OPERANDS = [(7, 3), (-7, 3), (7, -3), (-7, -3), (6, 3), (-6, 3), (6, -3), (0, -5), (-1, 7), (1, -7)]
+
+
+@pytest.mark.parametrize('left, right', OPERANDS)
+def test_folding_rounds_down(left, right):
+    assert evaluate('div', [left, right]) == left // right
+    assert evaluate('mod', [left, right]) == left % right
+
+
+def program(operator):
+    # Operands come from a call so nothing is folded before the backend sees them
+    lines = ["def pick(n):", "    return n"]
+    for left, right in OPERANDS:
+        lines.append(f"print(pick({left}) {operator} pick({right}))")
+    return '\n'.join(lines) + '\n'
+
+
+def test_remainder_matches_python(run_exec, run_native):
+    code = program('%')
+    assert run_native(code) == run_exec(code)
+
+
+@pytest.mark.parametrize('code, line', [
+    ("x = 17\nprint(x / 2)\n", 2),
+    ("print(17 / 2)\n", 1),
+    ("x = 6\ny = x / 3\n", 2),
+    ("x = 17\nx /= 2\n", 2),
+    ("def half(n):\n    return n / 2\nprint(half(4))\n", 2),
+])
+def test_true_division_is_a_compile_error(code, line):
+    message = "'/' gives a float, which compiled code cannot represent"
+    result = compile_source(code)
+    assert not result.success
+    assert result.error_heading == "Compile Errors:"
+    assert [str(error) for error in result.errors] == [f"Line {line}: {message}"]
+    assert result.assembly == []
+    with pytest.raises(ValueError, match=message):
+        NativeGenerator().generate_assembly(parse_program(code))
+
+
+def test_folded_and_computed_remainder_agree(run_exec, run_native):
+    code = "a = -7\nb = 2\nprint(a % b)\nprint(-a % -b)\nx = 0 - 9\nx = x % 4\nprint(x)\n"
+    unfolded = default_pass_manager()
+    unfolded.disable('constant-fold')
+    unfolded.disable('constant-propagation')
+    expected = run_exec(code)
+    assert run_native(code) == expected
+    assert run_native(code, passes=unfolded) == expected
+
+
+@pytest.mark.parametrize('op, adjust', [('div', 'dec eax'), ('mod', 'add edx, ')])
+def test_32_bit_code_adjusts_after_idiv(op, adjust):
+    generator = CodeGenerator()
+    generator.emit_instruction(Instruction(op, Temp(1), [Var('a'), Var('b')]))
+    lines = generator.code
+    position = next(index for index, line in enumerate(lines) if line.startswith('idiv'))
+    assert any(line.startswith(adjust) for line in lines[position:position + 8])
@@ -0,0 +1,120 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from asm import Instruction, Label
+from cache import CompilationCache
+from driver import compile_source
+from emitter import AssemblyWriter, write_assembly
+
+CODE = "def twice(n):\n    return n * 2\nx = twice(4)\nprint(x)\n"
+COMPILER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CountingSink(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_items_become_lines():
+    sink = io.StringIO()
+    write_assembly([Label('main'), Instruction('mov', ['eax', '1']), 'ret'], sink)
+    assert sink.getvalue() == "main:\nmov eax, 1\nret\n"
+
+
+def test_binary_sinks_get_utf8():
+    text, binary = io.StringIO(), io.BytesIO()
+    items = [Instruction('mov', ['eax', '1']), "# café"]
+    write_assembly(items, text)
+    write_assembly(items, binary)
+    assert binary.getvalue() == text.getvalue().encode('utf-8')
+
+
+def test_lines_are_written_in_batches():
+    sink = CountingSink()
+    writer = AssemblyWriter(sink, batch_size=64)
+    for _ in range(20):
+        writer.write_function([Instruction('mov', ['eax', '1'])] * 4)
+    assert 0 < sink.writes < 20
+    writer.flush()
+    assert sink.getvalue().count(b'\n') == writer.lines == 80
+    assert writer.functions == 20
+
+
+def test_nothing_is_written_before_a_batch_fills():
+    sink = CountingSink()
+    writer = AssemblyWriter(sink)
+    writer.write_function(['ret'])
+    writer.write_lines([])
+    assert sink.writes == 0
+    writer.flush()
+    assert (sink.writes, sink.flushes, sink.getvalue()) == (1, 1, b"ret\n")
+
+
+def test_flush_functions_flushes_every_routine():
+    sink = CountingSink()
+    writer = AssemblyWriter(sink, flush_functions=True)
+    writer.write_function(['ret'])
+    writer.write_function(['ret'])
+    assert sink.flushes == 2 and sink.getvalue() == b"ret\nret\n"
+
+
+def test_streamed_assembly_matches_the_kept_assembly(tmp_path):
+    kept = compile_source(CODE)
+    sink = io.BytesIO()
+    writer = AssemblyWriter(sink)
+    streamed = compile_source(CODE, output=writer)
+    writer.flush()
+    assert streamed.assembly is None
+    expected = '\n'.join(map(str, kept.assembly)) + '\n'
+    assert sink.getvalue().decode('utf-8') == expected
+
+    # A cache hit writes the cached assembly the same way
+    store = CompilationCache(str(tmp_path))
+    compile_source(CODE, cache=store)
+    sink = io.BytesIO()
+    writer = AssemblyWriter(sink)
+    assert compile_source(CODE, cache=store, output=writer).cached
+    writer.flush()
+    assert sink.getvalue().decode('utf-8') == expected
+
+
+def compile_to_file(tmp_path, code, *options):
+    source = tmp_path / 'program.py'
+    source.write_text(code)
+    path = tmp_path / 'program.s'
+    completed = subprocess.run([sys.executable, os.path.join(COMPILER, 'main.py'), str(source), '--quiet',
+                                '-o', str(path), *options], cwd=COMPILER, capture_output=True, text=True,
+                               check=True, timeout=60)
+    return path, completed.stdout
+
+
+@pytest.mark.parametrize('options', [(), ('--stream',)])
+def test_output_option_writes_the_file(tmp_path, options):
+    path, _ = compile_to_file(tmp_path, CODE, '--flush-functions', *options)
+    expected = '\n'.join(map(str, compile_source(CODE).assembly)) + '\n'
+    assert path.read_text() == expected
+
+
+@pytest.mark.parametrize('options', [(), ('--stream',)])
+@pytest.mark.parametrize('code, heading', [
+    ("x = = 1\n", "Syntax Errors:"),
+    ("print(y)\n", "Name Errors:"),
+    ("x = 2.5\nprint(x)\n", "Compile Errors:"),
+])
+def test_failed_compiles_leave_no_output_file(tmp_path, options, code, heading):
+    path, stdout = compile_to_file(tmp_path, code, *options)
+    assert heading in stdout
+    assert not path.exists()
@@ -0,0 +1,44 @@
+import pytest
+
+from asm import Label
+from driver import compile_source
+from generator import CodeGenerator
+from ir import Instruction, Temp
+
+
+def assembly(code):
+    result = compile_source(code)
+    assert result.success, [str(error) for error in result.errors]
+    return [str(line) for line in result.assembly]
+
+
+def test_string_prints_are_compiled():
+    lines = assembly('x = 3\nprint("x is", x)\n')
+    assert lines[:4] == ['push 5', 'push OFFSET L2', 'call print_text', 'add esp, 4']
+    assert 'call print' in lines
+    assert lines[-5:] == ['L2:', '.ascii "x is "', 'L3:', '.ascii "\\012"', '.text']
+
+
+def test_print_gets_its_end_text():
+    lines = assembly('x = 1\nprint(x, x + 1)\n')
+    assert [line for line in lines if line.startswith('.ascii')] == ['.ascii " "', '.ascii "\\012"']
+    assert lines.count('call print') == 2
+
+
+def test_strings_are_escaped():
+    lines = assembly('print("caf\u00e9 is open")\n')
+    assert '.ascii "caf\\303\\251 is open\\012"' in lines
+
+
+def test_each_routine_carries_its_own_strings():
+    result = compile_source('def show(n):\n    print("n", n)\n    return n\nprint("n", show(2))\n')
+    assert result.success
+    labels = [item.name for item in result.assembly if isinstance(item, Label)]
+    assert len(labels) == len(set(labels))
+    assert [str(line) for line in result.assembly].count('.section .rodata') == 2
+
+
+def test_unknown_ops_are_errors():
+    generator = CodeGenerator()
+    with pytest.raises(ValueError, match="unknown IR op 'bogus'"):
+        generator.emit_instruction(Instruction('bogus', Temp(1)))
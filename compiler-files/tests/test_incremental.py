@@ -0,0 +1,143 @@
+import random
+
+import pytest
+
+from incremental import IncrementalCompiler, TextEdit
+from workloads import generate_program
+
+SOURCE = '''def add(a, b):
+    return a + b
+
+x = 1
+if x < 2:
+    print(add(x, 3))
+else:
+    print(0)
+fruits = ["apple", "banana", "cherry"]
+for i in range(3):
+    print(i)
+'''
+
+
+def edit_at(source, old, new):
+    start = source.index(old)
+    return TextEdit(start, start + len(old), new)
+
+
+def snapshot(result):
+    return [(item.start, item.end, item.first_line, item.text) for item in result.items]
+
+
+def check(result, fresh):
+    # An edited result has to describe its source exactly as a fresh compile does
+    assert ''.join(item.text for item in result.items) == result.source
+    for item in result.items:
+        assert result.source[item.start:item.end] == item.text
+    assert [(item.start, item.first_line) for item in result.items] == \
+        [(item.start, item.first_line) for item in fresh.items]
+    assert repr(result.program) == repr(fresh.program)
+    assert [str(error) for error in result.errors()] == [str(error) for error in fresh.errors()]
+    assert result.success == fresh.success
+
+
+def test_compile_splits_top_level_items():
+    result = IncrementalCompiler().compile(SOURCE)
+    assert result.success
+    assert [item.first_line for item in result.items] == [1, 4, 5, 9, 10]
+    assert result.items[0].is_function()
+
+
+def test_edit_matches_a_fresh_compile():
+    compiler = IncrementalCompiler()
+    previous = compiler.compile(SOURCE)
+    edit = edit_at(SOURCE, 'x = 1\n', 'x = 1\ny = 2\nz = 3\n')
+    result = compiler.apply_edit(previous, edit)
+    check(result, IncrementalCompiler().compile(result.source))
+
+
+def test_edit_reuses_untouched_items():
+    compiler = IncrementalCompiler()
+    previous = compiler.compile(SOURCE)
+    result = compiler.apply_edit(previous, edit_at(SOURCE, 'x = 1', 'x = 5'))
+    assert result.reused == len(previous.items) - 1
+    # Items after the edit share their AST and code with the previous result
+    assert result.items[-1].nodes is previous.items[-1].nodes
+    assert result.items[-1].assembly is previous.items[-1].assembly
+    assert result.items[0] is previous.items[0]
+
+
+def test_edit_leaves_the_previous_result_untouched():
+    compiler = IncrementalCompiler()
+    previous = compiler.compile(SOURCE)
+    before = snapshot(previous)
+    compiler.apply_edit(previous, edit_at(SOURCE, 'x = 1\n', 'x = 1\n\n\n# moved\n'))
+    assert snapshot(previous) == before
+
+
+def test_rollback_to_a_previous_result():
+    # An editor can undo by editing on from an older result
+    compiler = IncrementalCompiler()
+    original = compiler.compile(SOURCE)
+    broken = compiler.apply_edit(original, edit_at(SOURCE, 'x = 1\n', 'x = \n'))
+    assert not broken.success
+    restored = compiler.apply_edit(original, edit_at(SOURCE, 'print(0)', 'print(1)'))
+    check(restored, IncrementalCompiler().compile(restored.source))
+    undone = compiler.apply_edit(broken, edit_at(broken.source, 'x = \n', 'x = 1\n'))
+    assert undone.source == SOURCE
+    check(undone, IncrementalCompiler().compile(SOURCE))
+
+
+def test_edit_inside_a_list_finishes():
+    compiler = IncrementalCompiler()
+    previous = compiler.compile(SOURCE)
+    start = SOURCE.index('"banana"')
+    result = compiler.apply_edit(previous, TextEdit(start, start + len('"banana"'), 'x = 1\n'))
+    assert not result.success
+    check(result, IncrementalCompiler().compile(result.source))
+
+
+def test_compile_reports_undefined_names():
+    result = IncrementalCompiler().compile("x = 1\nprint(zz)\ndef f(a):\n    return a + y\nprint(g(x))\n")
+    assert not result.success
+    assert [str(error) for error in result.errors()] == [
+        "Line 2: Undefined name 'zz'", "Line 4: Undefined name 'y'", "Line 5: Call to undefined function 'g'"]
+
+
+def test_names_bound_in_other_items_resolve():
+    result = IncrementalCompiler().compile("def f(a):\n    return a + y\ny = 2\nprint(f(y))\n")
+    assert result.success
+    assert result.errors() == []
+
+
+def test_edit_reports_and_clears_undefined_names():
+    compiler = IncrementalCompiler()
+    previous = compiler.compile(SOURCE)
+    broken = compiler.apply_edit(previous, edit_at(SOURCE, 'print(i)', 'print(j)'))
+    assert not broken.success
+    assert [str(error) for error in broken.errors()] == ["Line 11: Undefined name 'j'"]
+    # Binding the name in another item fixes the untouched one
+    fixed = compiler.apply_edit(broken, edit_at(broken.source, 'x = 1\n', 'x = 1\nj = 0\n'))
+    assert fixed.success
+    check(fixed, IncrementalCompiler().compile(fixed.source))
+
+
+PIECES = ['x = 1\n', '\n', '    ', 'if x < 2:\n', 'else:\n', 'def f(a):\n', 'return a\n',
+          'print(x)\n', '[1, ', ']', '(', ')', '# note\n', 'elif x:\n', '"s"', '']
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_random_edits_match_a_fresh_compile(seed):
+    rng = random.Random(seed)
+    compiler = IncrementalCompiler()
+    result = compiler.compile(SOURCE if seed % 2 else generate_program('nested', 40, seed=seed))
+    for _ in range(25):
+        source = result.source
+        start = rng.randint(0, len(source))
+        end = min(len(source), start + rng.randint(0, 12))
+        text = ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 2)))
+        before = snapshot(result)
+        edited = compiler.apply_edit(result, TextEdit(start, end, text))
+        assert snapshot(result) == before
+        assert edited.source == source[:start] + text + source[end:]
+        check(edited, IncrementalCompiler().compile(edited.source))
+        result = edited
@@ -0,0 +1,105 @@
+import os
+import random
+
+import pytest
+
+from lexer import LexicalAnalyzer, UNINDENT_MISMATCH
+from syntax import Parser
+from workloads import generate_program, SHAPES
+
+
+def kinds(code, engine='regex'):
+    return [kind for kind, _value, _line in LexicalAnalyzer(engine).tokenize(code)
+            if kind not in ('NEWLINE', 'COMMENT')]
+
+
+def test_indent_and_dedent_around_a_block():
+    assert kinds("if x:\n    y = 1\nz = 2\n") == [
+        'IF', 'IDENTIFIER', 'COLON', 'INDENT', 'IDENTIFIER', 'ASSIGN', 'NUMBER', 'DEDENT',
+        'IDENTIFIER', 'ASSIGN', 'NUMBER']
+
+
+def test_one_dedent_per_closed_level():
+    code = "if a:\n    if b:\n        if c:\n            x = 1\ny = 2\n"
+    tokens = kinds(code)
+    assert tokens.count('INDENT') == 3
+    assert tokens[tokens.index('DEDENT'):tokens.index('DEDENT') + 3] == ['DEDENT'] * 3
+
+
+def test_open_blocks_close_at_end_of_input():
+    assert kinds("while x:\n    if y:\n        z = 1")[-2:] == ['DEDENT', 'DEDENT']
+
+
+def test_blank_and_comment_lines_keep_the_level():
+    code = "if x:\n    y = 1\n\n# comment\n    z = 2\n"
+    assert kinds(code).count('INDENT') == 1
+    assert kinds(code).count('DEDENT') == 1
+
+
+def test_tabs_count_as_eight_columns():
+    assert kinds("if x:\n\ty = 1\n        z = 2\n").count('INDENT') == 1
+
+
+def test_unindent_to_an_unknown_column_is_an_error():
+    code = "if x:\n        y = 1\n    z = 2\n"
+    stream = LexicalAnalyzer().tokenize_stream(code)
+    assert stream.errors == [(3, UNINDENT_MISMATCH)]
+    # The line stays in the enclosing block instead of opening a new one
+    assert [stream.token(index)[0] for index in range(len(stream))].count('INDENT') == 1
+    with pytest.raises(IndentationError):
+        list(LexicalAnalyzer().tokenize(code))
+
+
+def test_unindent_error_reaches_the_parser():
+    code = "if x:\n        y = 1\n    z = 2\n"
+    for tokens in (LexicalAnalyzer().tokenize_stream(code), LexicalAnalyzer().tokenize_lazy(code)):
+        parser = Parser(tokens)
+        _ast, success = parser.parse()
+        assert not success
+        assert str(parser.errors[0]) == f"Line 3: {UNINDENT_MISMATCH}"
+
+
+# Engines
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLES = [os.path.join(HERE, '..', 'test.py')] + [
+    os.path.join(HERE, '..', '..', 'test-files', name) for name in ('basicTestOne.txt', 'loopTest.txt')]
+ALPHABET = 'abcdefxyz_019 \t\n\'"f#+-*/%=!<>()[]:,.'
+
+
+def both_engines(code):
+    return [list(LexicalAnalyzer(engine).tokenize(code)) for engine in ('regex', 'table')]
+
+
+@pytest.mark.parametrize('path', SAMPLES)
+def test_engines_agree_on_the_samples(path):
+    with open(path) as file:
+        regex, table = both_engines(file.read())
+    assert regex == table
+
+
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+def test_engines_agree_on_generated_programs(shape):
+    regex, table = both_engines(generate_program(shape, 200, seed=1))
+    assert regex == table
+
+
+def test_engines_agree_on_random_text():
+    generator = random.Random(0)
+    for _ in range(300):
+        code = ''.join(generator.choice(ALPHABET) for _ in range(generator.randint(0, 60)))
+        try:
+            regex, table = both_engines(code)
+        except IndentationError:
+            continue
+        assert regex == table, code
+
+
+def test_keywords_need_word_boundaries():
+    tokens = list(LexicalAnalyzer('table').tokenize("iffy = 1\nfor_ = 2\n"))
+    assert [token[:2] for token in tokens if token[0] == 'IDENTIFIER'] == [('IDENTIFIER', 'iffy'), ('IDENTIFIER', 'for_')]
+
+
+def test_unknown_engine_is_rejected():
+    with pytest.raises(ValueError):
+        LexicalAnalyzer('glr')
@@ -0,0 +1,62 @@
+import pytest
+
+from lexer import LexicalAnalyzer, LineIndex, map_source, T_NEWLINE, T_STRING, T_INDENT
+from tracing import Tracer
+
+CODE = "def f(n):\n    x = 'a'\n    return n\n\ny = f(1)\nprint(y)\n"
+
+
+def test_line_index_finds_lines_and_columns():
+    lines = LineIndex(b"ab\ncd\n\nef")
+    assert [lines.line(offset) for offset in (0, 2, 3, 6, 7, 8)] == [1, 1, 2, 3, 4, 4]
+    assert lines.position(4) == (2, 2)
+    assert lines.line_count() == 4
+    assert LineIndex(b"ab\n").line_count() == 1
+    assert LineIndex(b"").line_count() == 0
+
+
+@pytest.mark.parametrize('engine', ['regex', 'table'])
+def test_lex_yields_spans_only(engine):
+    tokens = list(LexicalAnalyzer(engine).lex(CODE.encode()))
+    assert all(len(token) == 3 for token in tokens)
+    assert sum(1 for kind, _start, _end in tokens if kind == T_NEWLINE) == CODE.count('\n')
+
+
+@pytest.mark.parametrize('engine', ['regex', 'table'])
+def test_every_token_view_agrees_on_lines(engine):
+    # A string that runs over a line break, which counting newline tokens would miss
+    code = "x = 'a\nb'\ny = 1\nif y:\n    print(y)\n"
+    analyzer = LexicalAnalyzer(engine)
+    stream = analyzer.tokenize_stream(code)
+    window = analyzer.tokenize_lazy(code, lookahead=2)
+    tuples = list(analyzer.tokenize(code))
+    for index in range(len(stream)):
+        assert (window.line(index), window.column(index)) == (stream.line(index), stream.column(index))
+        assert window.token(index) == stream.token(index) == tuples[index]
+    assert stream.line(next(index for index in range(len(stream)) if stream.kind(index) == T_STRING)) == 1
+    assert stream.line(next(index for index in range(len(stream)) if stream.kind(index) == T_INDENT)) == 5
+
+
+def test_indentation_errors_report_their_line():
+    code = "if x:\n        y = 1\n    z = 2\n"
+    errors = []
+    list(LexicalAnalyzer().lex(code.encode(), errors))
+    assert [line for line, _message in errors] == [3]
+    with pytest.raises(IndentationError, match='Line 3'):
+        list(LexicalAnalyzer().lex(code.encode()))
+
+
+def test_traced_indents_carry_their_line(capsys):
+    list(LexicalAnalyzer('table', Tracer(['lex'])).lex(CODE.encode()))
+    out = capsys.readouterr().out
+    assert 'Line 2: indent level 0 -> 1' in out and 'Line 5: indent level 1 -> 0' in out
+
+
+def test_mapped_file_lexes_like_text(tmp_path):
+    path = tmp_path / 'program.py'
+    path.write_text(CODE)
+    mapped = map_source(str(path))
+    assert list(LexicalAnalyzer().tokenize_stream(mapped)) == list(LexicalAnalyzer().tokenize_stream(CODE))
+    empty = tmp_path / 'empty.py'
+    empty.write_text('')
+    assert map_source(str(empty)) == b''
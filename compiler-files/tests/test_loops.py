@@ -0,0 +1,146 @@
+import pytest
+
+from ir import Lowering, dominates, dominators
+from loops import dominator_tree_ranges, find_loops, hoist_loop_invariants, reduce_strength
+from passes import default_pass_manager
+from workloads import generate_program
+
+from conftest import parse_program
+
+
+def lowered(code):
+    # The IR of the first function; its locals are dead once it returns,
+    # unlike globals, which are stored back at the end
+    return Lowering().lower_program(parse_program(code)).functions[0]
+
+
+def hoisted(code):
+    module = Lowering().lower_program(parse_program(code))
+    hoist_loop_invariants(module)
+    return module.functions[0]
+
+
+def loop_ops(function):
+    # Operations left inside any loop
+    loop_blocks = set()
+    for loop in find_loops(function, dominators(function)):
+        loop_blocks |= loop.blocks
+    return [instruction.op for block in loop_blocks for instruction in block.instructions]
+
+
+INVARIANT = """def f(a, b):
+    i = 0
+    s = 0
+    while i < 10:
+        t = a * b
+        s = s + t
+        i = i + 1
+    return s
+print(f(6, 7))
+"""
+
+NESTED = """def f(a, b):
+    s = 0
+    for i in range(4):
+        for j in range(5):
+            t = a * b
+            s = s + t + j
+    return s
+print(f(6, 7))
+"""
+
+
+def test_invariant_leaves_the_loop():
+    assert 'mul' not in loop_ops(hoisted(INVARIANT))
+
+
+def test_invariant_leaves_every_loop_around_it():
+    assert 'mul' not in loop_ops(hoisted(NESTED))
+
+
+def test_value_read_before_it_is_written_stays():
+    code = """def f(a):
+    t = 0
+    i = 0
+    while i < 3:
+        print(t)
+        t = a * 2
+        i = i + 1
+    return 0
+y = f(6)
+"""
+    assert 'mul' in loop_ops(hoisted(code))
+
+
+def test_value_not_written_on_every_path_to_the_exit_stays():
+    code = """def f(a):
+    t = 0
+    i = 0
+    while i < 10:
+        if i > 5:
+            t = a * 2
+        i = i + 1
+    return t
+print(f(6))
+"""
+    assert 'mul' in loop_ops(hoisted(code))
+
+
+def test_division_that_may_trap_stays():
+    code = """def f(a, c):
+    s = 0
+    i = 0
+    while i < 3:
+        if c != 0:
+            s = s + a % c
+        i = i + 1
+    return s
+print(f(6, 0))
+"""
+    assert 'mod' in loop_ops(hoisted(code))
+
+
+def test_loops_are_innermost_first_and_know_their_parent():
+    function = lowered(NESTED)
+    inner, outer = find_loops(function, dominators(function))
+    assert inner.blocks < outer.blocks
+    assert inner.parent is outer and outer.parent is None
+
+
+def test_preheaders_join_the_loops_around_them():
+    function = hoisted(NESTED)
+    idom = dominators(function)
+    inner, outer = find_loops(function, idom)
+    preheader = idom[inner.header]
+    assert preheader in outer.blocks and preheader not in inner.blocks
+    # The multiply went to the inner preheader, then on out of the outer loop
+    assert preheader.instructions == []
+    assert [instruction.op for instruction in idom[outer.header].instructions] == ['mul']
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_dominator_tree_ranges_agree_with_dominates(seed):
+    module = Lowering().lower_program(parse_program(generate_program('nested', 40, seed=seed)))
+    for function in module.all_functions():
+        idom = dominators(function)
+        ranges = dominator_tree_ranges(idom)
+        for first in idom:
+            for second in idom:
+                (start, end), (position, _end) = ranges[first], ranges[second]
+                assert (start <= position <= end) == dominates(first, second, idom)
+
+
+def test_strength_reduction_after_licm_keeps_the_loops_intact():
+    module = Lowering().lower_program(parse_program(NESTED))
+    hoist_loop_invariants(module)
+    reduce_strength(module)
+    assert 'mul' not in loop_ops(module.functions[0])
+
+
+@pytest.mark.parametrize('code', [INVARIANT, NESTED, generate_program('nested', 30, seed=2)])
+def test_native_output_is_the_same_without_licm(run_native, run_exec, code):
+    without = default_pass_manager()
+    without.disable('licm')
+    expected = run_exec(code)
+    assert run_native(code, passes=default_pass_manager()) == expected
+    assert run_native(code, passes=without) == expected
@@ -0,0 +1,119 @@
+import pytest
+
+from driver import compile_source
+from incremental import IncrementalCompiler
+from ir import Lowering
+from native import NativeGenerator
+from passes import default_pass_manager
+from syntax import ProgramNode, PrintNode, RangeNode, NumberNode
+
+from conftest import parse_program
+
+
+def lower(code):
+    lowering = Lowering()
+    module = lowering.lower_program(parse_program(code))
+    return module, lowering.errors
+
+
+def ops(module):
+    return [instruction.op for function in module.all_functions() for block in function.blocks
+            for instruction in block.instructions]
+
+
+@pytest.mark.parametrize('exponent, multiplies', [(0, 0), (1, 0), (2, 1), (3, 2), (8, 3), (13, 5)])
+def test_power_lowers_to_square_and_multiply(exponent, multiplies):
+    module, errors = lower(f"x = 3\nprint(x ** {exponent})\n")
+    assert not errors
+    assert ops(module).count('mul') == multiplies
+
+
+@pytest.mark.parametrize('code', ["x = 2\nprint(2 ** x)\n", "print(2 ** -1)\n", "x = 2\ny = 3 ** (x + 1)\n"])
+def test_power_without_a_constant_exponent_is_an_error(code):
+    result = compile_source(code)
+    assert not result.success
+    assert result.error_heading == "Compile Errors:"
+    assert "'**' needs a constant exponent" in str(result.errors[0])
+    assert result.assembly == []
+    with pytest.raises(ValueError, match="'\\*\\*' needs a constant exponent"):
+        NativeGenerator().generate_assembly(parse_program(code))
+
+
+def test_unsupported_nodes_are_errors_not_missing_code():
+    # A node the lowering has no rule for must never just vanish
+    program = ProgramNode([], [PrintNode([RangeNode(None, NumberNode('3', 1, 13), None, 1, 7)], 1, 1)])
+    lowering = Lowering()
+    lowering.lower_program(program)
+    assert [str(error) for error in lowering.errors] == ["Line 1: RangeNode is not supported by the compiler"]
+
+
+def test_errors_do_not_carry_over_between_programs():
+    lowering = Lowering()
+    lowering.lower_program(parse_program("print(2 ** -1)\n"))
+    lowering.lower_program(parse_program("print(2 ** 2)\n"))
+    assert lowering.errors == []
+
+
+def test_strings_and_lists_still_lower():
+    module, errors = lower('name = "x"\nfruits = [1, 2]\nfor fruit in fruits:\n    print(fruit)\n')
+    assert not errors
+    assert 'index' in ops(module)
+
+
+@pytest.mark.parametrize('code, use', [
+    ("x = 2.5\nprint(x)\n", 'print'),
+    ('name = "x"\nprint(name + 1)\n', 'arithmetic'),
+    ("def first(items):\n    return items\nprint(first([1, 2]))\n", 'a call'),
+    ("def pi():\n    return 3.14\nx = pi()\n", 'return'),
+])
+def test_unrepresentable_values_are_compile_errors(code, use):
+    # The 32-bit backend has no machine representation for strings, floats and
+    # lists; computing with one must fail the compile, not emit None operands
+    result = compile_source(code)
+    assert not result.success
+    assert result.error_heading == "Compile Errors:"
+    assert f"reaches {use}, which the 32-bit backend cannot compile" in str(result.errors[0])
+    assert result.assembly == []
+
+
+def test_unused_strings_floats_and_lists_compile_to_nothing():
+    result = compile_source('name = "x"\nx = 2.5\nfruits = [1, 2]\ny = 3\nprint(y)\n')
+    assert result.success
+    assembly = [str(line) for line in result.assembly]
+    assert not any('None' in line for line in assembly)
+    assert 'mov DWORD PTR [y], 3' in assembly
+
+
+def test_incremental_items_report_unrepresentable_values():
+    result = IncrementalCompiler().compile("x = 1\nprint(x)\ndef show():\n    y = 2.5\n    print(y)\n")
+    assert not result.success
+    assert "reaches print" in str(result.errors()[0])
+
+
+def test_incremental_items_report_lowering_errors():
+    result = IncrementalCompiler().compile("x = 1\nprint(x ** -2)\nprint(x)\n")
+    assert not result.success
+    assert [str(error) for error in result.errors()] == ["Line 2: '**' needs a constant exponent that is not negative"]
+    assert result.items[1].assembly == []
+
+
+POWERS = '''def cube(n):
+    return n ** 3
+
+x = 3
+print(x ** 0, x ** 1, x ** 2, x ** 5)
+print(cube(x), cube(-2), (-3) ** 3, -3 ** 2)
+y = 7
+y = y ** 2 + 1
+print(y)
+print(2 ** 10 ** 1)
+'''
+
+
+def test_power_matches_python(run_exec, run_native):
+    assert run_native(POWERS) == run_exec(POWERS)
+
+
+def test_power_matches_python_without_passes(run_exec, run_native):
+    # Without folding the multiplies themselves have to be right
+    assert run_native(POWERS, default_pass_manager(pipeline=[])) == run_exec(POWERS)
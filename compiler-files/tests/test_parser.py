@@ -0,0 +1,135 @@
+import os
+import random
+
+import pytest
+
+from lexer import LexicalAnalyzer
+from syntax import Parser
+from workloads import generate_program, SHAPES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLES = [os.path.join(HERE, '..', 'test.py')] + [
+    os.path.join(HERE, '..', '..', 'test-files', name) for name in ('basicTestOne.txt', 'loopTest.txt')]
+
+
+def parse(code):
+    parser = Parser(LexicalAnalyzer().tokenize_stream(code))
+    ast, success = parser.parse()
+    return ast, success, parser
+
+
+# Lazy token window
+
+def sources():
+    for path in SAMPLES:
+        with open(path) as file:
+            yield file.read()
+    for shape in sorted(SHAPES):
+        yield generate_program(shape, 150, seed=2)
+
+
+@pytest.mark.parametrize('code', list(sources()))
+def test_lazy_parse_matches_full_parse(code):
+    full, full_success, _parser = parse(code)
+    lazy_parser = Parser(LexicalAnalyzer().tokenize_lazy(code))
+    lazy, lazy_success = lazy_parser.parse()
+    assert lazy_success == full_success
+    assert repr(lazy) == repr(full)
+
+
+def test_window_keeps_only_the_last_tokens():
+    window = LexicalAnalyzer().tokenize_lazy("x = 1\n" * 50, lookahead=4)
+    for index in range(40):
+        window.kind(index)
+    assert len(window.window) <= 4
+    with pytest.raises(IndexError):
+        window.kind(0)
+
+
+def test_window_reports_the_end_of_input():
+    window = LexicalAnalyzer().tokenize_lazy("x = 1\n")
+    assert window.token(0) == ('IDENTIFIER', 'x', 1)
+    assert window.kind(100) is None
+    assert window.token(100) is None
+
+
+# Expressions
+
+def shape(node):
+    # Fully parenthesised form of an expression tree
+    name = type(node).__name__
+    if name == 'BinaryOpNode':
+        return f"({shape(node.left)} {node.operator} {shape(node.right)})"
+    if name == 'UnaryOpNode':
+        return f"({node.operator}{shape(node.operand)})"
+    if name == 'ListNode':
+        return '[' + ', '.join(shape(element) for element in node.elements) + ']'
+    return str(node.value) if hasattr(node, 'value') else node.name
+
+
+def expression(code):
+    ast, success, parser = parse(f"x = {code}\n")
+    assert success, [str(error) for error in parser.errors]
+    return shape(ast.statements[0].expression)
+
+
+@pytest.mark.parametrize('code, expected', [
+    ('1 + 2 * 3 - 4', '((1 + (2 * 3)) - 4)'),
+    ('1 - 2 - 3', '((1 - 2) - 3)'),
+    ('2 ** 3 ** 2', '(2 ** (3 ** 2))'),
+    ('-2 ** 2', '(-(2 ** 2))'),
+    ('-2 * 3', '((-2) * 3)'),
+    ('(1 + 2) * 3', '((1 + 2) * 3)'),
+    ('1 < 2 + 3', '(1 < (2 + 3))'),
+    ('a % b * c', '((a % b) * c)'),
+    ('[1, 2 + 3, y]', '[1, (2 + 3), y]'),
+    ('[]', '[]'),
+])
+def test_operator_precedence(code, expected):
+    assert expression(code) == expected
+
+
+def test_long_operator_chain_does_not_recurse():
+    ast, success, _parser = parse('x = ' + ' + '.join(['1'] * 5000) + '\n')
+    assert success
+    node, depth = ast.statements[0].expression, 0
+    while type(node).__name__ == 'BinaryOpNode':
+        node, depth = node.left, depth + 1
+    assert depth == 4999
+
+
+def test_deep_nesting_is_reported():
+    _ast, success, parser = parse('x = ' + '(' * 300 + '1' + ')' * 300 + '\n')
+    assert not success
+    assert 'Expression nested too deeply' in str(parser.errors[0])
+
+
+# Malformed input must be reported, never loop or crash
+
+@pytest.mark.parametrize('code', ['x = [1, 2', 'x = [1, 2\n', 'x = [1, 2\nprint(x)\n', 'x = [1 2]\n', 'if [', 'print([)\n'])
+def test_unterminated_list_is_reported(code):
+    for tokens in (LexicalAnalyzer().tokenize_stream(code), LexicalAnalyzer().tokenize_lazy(code)):
+        parser = Parser(tokens)
+        _ast, success = parser.parse()
+        assert not success
+        assert any("Expected ']'" in str(error) for error in parser.errors)
+
+
+def test_def_at_end_of_input_is_reported():
+    for tokens in (LexicalAnalyzer().tokenize_stream('def '), LexicalAnalyzer().tokenize_lazy('def ')):
+        parser = Parser(tokens)
+        _ast, success = parser.parse()
+        assert not success
+        assert "Expected function name after 'def'" in str(parser.errors[0])
+
+
+FRAGMENTS = ['x', '=', '1', '(', ')', '[', ']', ',', ':', '\n', '    ', 'if ', 'while ', 'for ', ' in ',
+             'range', 'def ', 'print', 'return ', '+', '*', '**', '<', 'else', '"s"', '+=', 'main']
+
+
+def test_random_fragments_always_finish():
+    for seed in range(300):
+        rng = random.Random(seed)
+        code = ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 25)))
+        for tokens in (LexicalAnalyzer().tokenize_stream(code), LexicalAnalyzer().tokenize_lazy(code)):
+            Parser(tokens).parse()
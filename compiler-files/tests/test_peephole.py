@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+from asm import Instruction, Label, parse_lines
+from driver import compile_source
+from peephole import PeepholeOptimizer
+
+
+def optimize(lines, disabled=()):
+    optimizer = PeepholeOptimizer(disabled)
+    return [str(item) for item in optimizer.optimize(parse_lines(lines))], optimizer
+
+
+@pytest.mark.parametrize('rule, before, after', [
+    ('self-move', ['mov ecx, ecx', 'ret'], ['ret']),
+    ('redundant-load', ['mov DWORD PTR [x], ecx', 'mov ebx, DWORD PTR [x]'],
+     ['mov DWORD PTR [x], ecx', 'mov ebx, ecx']),
+    ('redundant-load', ['mov DWORD PTR [x], ecx', 'mov ecx, DWORD PTR [x]'], ['mov DWORD PTR [x], ecx']),
+    ('redundant-store', ['mov ecx, DWORD PTR [x]', 'mov DWORD PTR [x], ecx'], ['mov ecx, DWORD PTR [x]']),
+    ('redundant-store', ['mov DWORD PTR [x], 1', 'mov DWORD PTR [x], 2'], ['mov DWORD PTR [x], 2']),
+    ('jump-to-next', ['jmp L1', 'L1:', 'ret'], ['L1:', 'ret']),
+    ('jump-chain', ['jl L1', 'ret', 'L1:', 'jmp L2', 'L2:', 'ret'], ['jl L2', 'ret', 'L1:', 'jmp L2', 'L2:', 'ret']),
+    ('unreachable-code', ['jmp L1', 'mov ecx, 1', 'L1:', 'ret'], ['jmp L1', 'L1:', 'ret']),
+    ('unused-label', ['L7:', 'ret'], ['ret']),
+    ('zero-register', ['mov ecx, 0', 'cmp ebx, 1', 'ret'], ['xor ecx, ecx', 'cmp ebx, 1', 'ret']),
+    ('merge-stack-adjustments', ['add esp, 4', 'add esp, 8'], ['add esp, 12']),
+    ('merge-stack-adjustments', ['add esp, 4', 'push ecx'], ['mov DWORD PTR [esp], ecx']),
+    ('merge-stack-adjustments', ['add esp, 8', 'push 3'], ['add esp, 4', 'mov DWORD PTR [esp], 3']),
+])
+def test_each_rule_on_its_own(rule, before, after):
+    others = [name for name in PeepholeOptimizer().names() if name != rule]
+    code, optimizer = optimize(before, others)
+    assert code == after
+    assert optimizer.hits[rule] >= 1
+
+
+@pytest.mark.parametrize('before', [
+    ['mov DWORD PTR [x], ecx', 'mov DWORD PTR [y], ebx'],
+    ['mov ecx, DWORD PTR [ecx]', 'mov DWORD PTR [ecx], ecx'],
+    ['mov ecx, 0', 'jl L1', 'L1:', 'ret'],
+    ['add esp, 4', 'push DWORD PTR [x]'],
+    ['jl L1', 'mov ecx, 1', 'L1:', 'ret'],
+])
+def test_rules_leave_code_they_cannot_prove_alone(before):
+    assert optimize(before, ['unused-label', 'jump-to-next'])[0] == before
+
+
+def test_sweeps_until_nothing_changes():
+    # Removing the jump makes the label unused, which needs a second sweep
+    code, optimizer = optimize(['jmp L1', 'mov ecx, 2', 'L1:', 'mov eax, eax', 'ret'])
+    assert code == ['ret']
+    assert optimizer.hits['unused-label'] == 1
+
+
+def test_disabling_rules():
+    optimizer = PeepholeOptimizer(['self-move'])
+    assert 'self-move' not in optimizer.enabled_rules()
+    assert optimizer.optimize(parse_lines(['mov ecx, ecx'])) == [Instruction('mov', ['ecx', 'ecx'])]
+    optimizer.enable('self-move')
+    assert optimizer.optimize(parse_lines(['mov ecx, ecx'])) == []
+    assert PeepholeOptimizer(['all']).enabled_rules() == ()
+    with pytest.raises(ValueError, match='Unknown peephole rule'):
+        PeepholeOptimizer(['no-such-rule'])
+
+
+def test_report_lists_every_rule():
+    _code, optimizer = optimize(['mov ecx, ecx', 'ret'], ['zero-register'])
+    stream = io.StringIO()
+    optimizer.report(stream)
+    text = stream.getvalue()
+    assert 'self-move' in text and 'disabled' in text
+
+
+def test_structured_assembly_round_trips():
+    lines = ['L1:', 'mov DWORD PTR [ebp-4], ecx', 'cdq', 'ret']
+    items = parse_lines(lines)
+    assert isinstance(items[0], Label) and items[0] == Label('L1')
+    assert [str(item) for item in items] == lines
+
+
+def test_generated_code_goes_through_the_peephole():
+    code = "x = 0\nwhile x < 10:\n    x = x + 1\nprint(x)\n"
+    with_rules = [str(item) for item in compile_source(code).assembly]
+    without = [str(item) for item in compile_source(code, peephole=PeepholeOptimizer(['all'])).assembly]
+    assert 'xor ebx, ebx' in with_rules and 'mov ebx, 0' in without
+    assert len(with_rules) <= len(without)
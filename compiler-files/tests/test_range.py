@@ -0,0 +1,64 @@
+import pytest
+
+from ir import Lowering
+from lexer import LexicalAnalyzer
+from syntax import ForNode, Parser, RangeNode
+
+from conftest import parse_program
+
+
+def parse_errors(code):
+    parser = Parser(LexicalAnalyzer().tokenize_stream(code))
+    parser.parse()
+    return [str(error) for error in parser.errors]
+
+
+def loop_range(code):
+    loop = parse_program(code).statements[0]
+    assert isinstance(loop, ForNode) and isinstance(loop.collection, RangeNode)
+    return loop.collection
+
+
+def number(node):
+    return None if node is None else int(node.value)
+
+
+@pytest.mark.parametrize('arguments, bounds', [
+    ('5', (None, 5, None)),
+    ('2, 5', (2, 5, None)),
+    ('2, 9, 3', (2, 9, 3)),
+])
+def test_range_arguments(arguments, bounds):
+    node = loop_range(f"for i in range({arguments}):\n    print(i)\n")
+    assert (number(node.start), number(node.stop), number(node.step)) == bounds
+
+
+@pytest.mark.parametrize('arguments, message', [
+    ('1, 2, 3, 4', 'at most 3 arguments'),
+    ('0, 5, 0', 'step must not be zero'),
+])
+def test_bad_ranges_are_errors(arguments, message):
+    errors = parse_errors(f"for i in range({arguments}):\n    print(i)\n")
+    assert any(message in error for error in errors)
+
+
+def test_range_loop_needs_no_array():
+    module = Lowering().lower_program(parse_program("s = 0\nfor i in range(2, 10, 2):\n    s = s + i\nprint(s)\n"))
+    ops = {instruction.op for block in module.toplevel.blocks for instruction in block.instructions}
+    assert not ops & {'len', 'index', 'list'}
+
+
+@pytest.mark.parametrize('code', [
+    "for i in range(5):\n    print(i)\n",
+    "for i in range(3, 8):\n    print(i)\n",
+    "for i in range(10, 0, -3):\n    print(i)\n",
+    "for i in range(5, 5):\n    print(i)\nprint(99)\n",
+    "for i in range(0, 10, 4):\n    print(i)\nprint(i)\n",
+    # Bounds are evaluated once, and assigning the variable does not change the iteration
+    "n = 3\nfor i in range(n):\n    n = n + 1\n    i = i * 10\n    print(i)\nprint(n)\n",
+    # A step only known at run time counts either way
+    "def f(step):\n    s = 0\n    for i in range(0, 6 * step, step):\n        s = s * 10 + i\n    return s\nprint(f(1))\nprint(f(-1))\nprint(f(2))\n",
+    "s = 0\nfor i in range(4):\n    for j in range(i, 4):\n        s = s + i * j\nprint(s)\n",
+])
+def test_range_loops_match_python(run_exec, run_native, code):
+    assert run_native(code) == run_exec(code)
@@ -0,0 +1,138 @@
+import os
+
+import pytest
+
+import generator
+from driver import compile_source
+from regalloc import (ALLOCATABLE, CALLEE_SAVED, VIRTUAL_REGISTER, RoutineInfo, allocate_registers, is_jump,
+                      linear_scan, split_instruction)
+from workloads import generate_program, SHAPES
+
+
+def routines(code):
+    # Virtual-register code the generator hands to the allocator
+    seen = []
+    allocate = generator.allocate_registers
+    generator.allocate_registers = lambda routine: seen.append(list(routine)) or allocate(routine)
+    try:
+        assert compile_source(code).success
+    finally:
+        generator.allocate_registers = allocate
+    return seen
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLES = [os.path.join(HERE, '..', 'test.py')] + [
+    os.path.join(HERE, '..', '..', 'test-files', name) for name in ('basicTestOne.txt', 'loopTest.txt')]
+
+
+def programs():
+    for path in SAMPLES:
+        with open(path) as file:
+            yield os.path.basename(path), file.read()
+    for shape in sorted(SHAPES):
+        yield shape, generate_program(shape, 60, seed=3)
+
+
+def reference_intervals(code):
+    # Straightforward per-instruction liveness, recomputed after every round
+    # of dead move removal, as a check on the block-level version
+    info = RoutineInfo(code)
+    count = len(code)
+    labels = {line[:-1]: index for index, line in enumerate(code) if line.endswith(':')}
+    successors = []
+    for index, line in enumerate(code):
+        mnemonic = '' if line.endswith(':') else split_instruction(line)[0]
+        following = (index + 1,) if index + 1 < count else ()
+        if mnemonic == 'ret':
+            successors.append(())
+        elif mnemonic == 'jmp':
+            successors.append((labels[split_instruction(line)[1][0]],))
+        elif is_jump(mnemonic):
+            successors.append((labels[split_instruction(line)[1][0]],) + following)
+        else:
+            successors.append(following)
+    uses = [set(registers) for registers in info.uses]
+    defs = [set(registers) for registers in info.defs]
+    while True:
+        live_in = [set() for _ in range(count)]
+        live_out = [set() for _ in range(count)]
+        changed = True
+        while changed:
+            changed = False
+            for index in range(count - 1, -1, -1):
+                out = set().union(*(live_in[successor] for successor in successors[index]))
+                incoming = uses[index] | (out - defs[index])
+                if incoming != live_in[index] or out != live_out[index]:
+                    live_in[index], live_out[index] = incoming, out
+                    changed = True
+        dead = [index for index in range(count) if code[index].startswith('mov ') and defs[index]
+                and not defs[index] & live_out[index]]
+        if not dead:
+            break
+        for index in dead:
+            uses[index], defs[index] = set(), set()
+    intervals = {}
+    for index in range(count):
+        for register in live_in[index] | defs[index]:
+            intervals.setdefault(register, [index, index])[1] = index
+    return intervals
+
+
+@pytest.mark.parametrize('shape, code', list(programs()))
+def test_intervals_match_per_instruction_liveness(shape, code):
+    for routine in routines(code):
+        info = RoutineInfo(routine)
+        info.remove_dead_moves()
+        assert info.intervals() == reference_intervals(routine)
+
+
+@pytest.mark.parametrize('shape, code', list(programs()))
+def test_overlapping_intervals_never_share_a_register(shape, code):
+    for routine in routines(code):
+        info = RoutineInfo(routine)
+        info.remove_dead_moves()
+        intervals = info.intervals()
+        crossing = info.live_across_calls()
+        assignment, slots, _count, _pressure = linear_scan(intervals, crossing, {})
+        assert set(assignment) | set(slots) == set(intervals)
+        for register in crossing & set(assignment):
+            assert assignment[register] in CALLEE_SAVED
+        names = sorted(assignment)
+        for position, first in enumerate(names):
+            for second in names[position + 1:]:
+                if assignment[first] != assignment[second]:
+                    continue
+                (start_a, end_a), (start_b, end_b) = intervals[first], intervals[second]
+                # Sharing is only allowed when one ends where the other starts
+                assert end_a <= start_b or end_b <= start_a
+
+
+def test_dead_move_chains_are_removed():
+    code = ['mov %1, 5', 'mov %2, %1', 'mov %3, %2', 'mov %4, 7', 'mov eax, %4', 'ret']
+    allocation = allocate_registers(code)
+    assert allocation.code == ['mov ecx, 7', 'mov eax, ecx', 'ret']
+
+
+def test_dead_moves_in_a_loop_are_removed():
+    code = ['mov %1, 0', 'mov %2, 0', 'top:', 'mov %3, %2', 'add %1, 1', 'cmp %1, 10', 'jl top',
+            'mov eax, %1', 'ret']
+    allocation = allocate_registers(code)
+    assert not any(VIRTUAL_REGISTER.search(line) for line in allocation.code)
+    assert len(allocation.code) == len(code) - 2
+
+
+def test_values_live_across_a_call_use_callee_saved_registers():
+    code = ['mov %1, 5', 'call f', 'mov eax, %1', 'ret']
+    allocation = allocate_registers(code)
+    assert allocation.registers <= set(CALLEE_SAVED)
+
+
+def test_pressure_beyond_the_registers_spills():
+    count = len(ALLOCATABLE) + 2
+    code = [f'mov %{index}, {index}' for index in range(1, count + 1)]
+    code += [f'add %1, %{index}' for index in range(2, count + 1)] + ['mov eax, %1', 'ret']
+    allocation = allocate_registers(code)
+    assert allocation.spill_slots >= 2
+    assert allocation.pressure == count
+    assert not any(VIRTUAL_REGISTER.search(line) for line in allocation.code)
@@ -0,0 +1,112 @@
+import io
+
+import pytest
+
+from closures import compile_closures
+from lexer import LexicalAnalyzer
+from resolver import AssignedNames, resolve_names, GLOBAL, LOCAL, PARAMETER
+from syntax import Parser, ReturnNode
+from vm import VirtualMachine, load_program
+
+from conftest import parse_program
+
+
+def parsed(code):
+    parser = Parser(LexicalAnalyzer().tokenize_stream(code))
+    ast, _success = parser.parse()
+    return ast, [str(error) for error in parser.errors]
+
+
+def errors(code):
+    ast, syntax_errors = parsed(code)
+    assert not syntax_errors
+    return [str(error) for error in resolve_names(ast)]
+
+
+def test_scopes_follow_python():
+    ast = parse_program("def f(a, b):\n    c = a + g\n    return c * b\ng = 2\nx = f(1, 2)\nprint(x)\n")
+    scope = ast.functions[0].scope
+    assert scope.names(PARAMETER) == ['a', 'b']
+    assert scope.names(LOCAL) == ['c']
+    assert scope.globals_read == ['g']
+    assert [scope.symbols[name].slot for name in ('a', 'b', 'c')] == [1, 2, 3]
+    assert ast.scope.names(GLOBAL) == ['g', 'x']
+
+
+@pytest.mark.parametrize('code, message', [
+    ("print(y)\n", "Undefined name 'y'"),
+    ("x = g(1)\n", "Call to undefined function 'g'"),
+    ("def f(a, a):\n    return a\nx = f(1, 2)\n", "Duplicate parameter 'a'"),
+    ("def f(n):\n    return m\nx = f(1)\n", "Undefined name 'm'"),
+])
+def test_unbound_names_are_errors(code, message):
+    assert any(message in error for error in errors(code))
+
+
+def test_assigned_names_keep_first_assignment_order():
+    ast = parse_program("b = 1\na = 2\nb = 3\nfor c in range(2):\n    a += c\n    d = c\n")
+    assigned = AssignedNames()
+    for statement in ast.statements:
+        assigned.visit(statement)
+    assert list(assigned.names) == ['b', 'a', 'c', 'd']
+
+
+def test_many_locals_bind_in_order():
+    count = 3000
+    body = ''.join(f"    v{index} = {index}\n" for index in range(count))
+    ast = parse_program(f"def f():\n{body}    return v0\nx = f()\n")
+    scope = ast.functions[0].scope
+    assert scope.names(LOCAL) == [f"v{index}" for index in range(count)]
+    assert scope.slot_count == count
+
+
+RECURSIVE = """def fact(n):
+    if n < 2:
+        return 1
+    return n * fact(n - 1)
+def fib(n):
+    if n < 2:
+        return n
+    else:
+        return fib(n - 1) + fib(n - 2)
+def find(k):
+    for i in range(100):
+        if i * 3 > k:
+            return i
+    return -1
+def gcd(a, b):
+    while b != 0:
+        if a % b == 0:
+            return b
+        t = a % b
+        a = b
+        b = t
+    return a
+print(fact(10))
+print(fib(20))
+print(find(40))
+print(find(1000))
+print(gcd(84, 36))
+"""
+
+
+def test_return_inside_nested_blocks_parses():
+    ast, syntax_errors = parsed("def g(n):\n    if n < 1:\n        return 0\n    return g(n - 1)\nprint(g(3))\n")
+    assert not syntax_errors
+    assert isinstance(ast.functions[0].body[0].block[0], ReturnNode)
+
+
+def test_return_outside_a_function_is_still_an_error():
+    _ast, syntax_errors = parsed("x = 1\nif x > 0:\n    return x\nwhile x > 5:\n    return 1\n")
+    assert sum('Return statement found outside of a function' in error for error in syntax_errors) == 2
+
+
+def test_recursion_runs_natively(run_exec, run_native):
+    assert run_native(RECURSIVE) == run_exec(RECURSIVE)
+
+
+def test_recursion_runs_in_process(run_exec):
+    vm, closures = io.StringIO(), io.StringIO()
+    VirtualMachine(vm).run(load_program(parse_program(RECURSIVE)))
+    compile_closures(parse_program(RECURSIVE))(closures)
+    assert vm.getvalue() == closures.getvalue() == run_exec(RECURSIVE)
@@ -0,0 +1,111 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+
+from cache import CompilationCache
+from driver import compile_source
+from stats import CompileStats, phase, profile_call, NO_PHASE, HOT_METHOD_COUNT
+
+CODE = """def square(n):
+    return n * n
+total = 0
+for i in range(5):
+    total = total + square(i)
+print(total)
+"""
+COMPILER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def compiled_stats(code=CODE, cache=None):
+    stats = CompileStats()
+    result = compile_source(code, stats=stats, cache=cache)
+    return stats, result
+
+
+def test_every_phase_is_timed():
+    stats, _result = compiled_stats()
+    assert set(stats.phases) == {'lex', 'parse', 'resolve', 'codegen'}
+    for timing in stats.phases.values():
+        assert timing['wall_seconds'] >= 0 and timing['cpu_seconds'] >= 0
+
+
+def test_tokens_and_nodes_are_counted_by_kind():
+    stats, result = compiled_stats()
+    report = stats.report()
+    assert report['tokens']['total'] == len(result.tokens.kinds)
+    assert report['tokens']['by_kind']['IDENTIFIER'] > 0
+    assert report['nodes']['by_kind']['FunctionDefNode'] == 1
+    assert report['nodes']['by_kind']['ForNode'] == 1
+
+
+def test_each_routine_reports_its_size_and_pressure():
+    stats, _result = compiled_stats()
+    report = stats.report()
+    names = [routine['name'] for routine in report['routines']]
+    assert names == ['square', '<toplevel>']
+    assert all(routine['instructions'] > 0 for routine in report['routines'])
+    assert report['peak_register_pressure'] == max(routine['register_pressure'] for routine in report['routines'])
+    assert 'licm' in report['passes']
+
+
+def test_cached_compiles_say_so(tmp_path):
+    store = CompilationCache(str(tmp_path))
+    compile_source(CODE, cache=store)
+    stats, result = compiled_stats(cache=store)
+    assert result.cached and stats.report()['cached']
+
+
+def test_hot_parser_methods_come_from_the_parser():
+    stats, result = compiled_stats()
+    stats.profile_parser(result.tokens)
+    methods = stats.report()['hot_parser_methods']
+    assert 0 < len(methods) <= HOT_METHOD_COUNT
+    assert any(method['method'] == 'parse' for method in methods)
+    own = [method['own_seconds'] for method in methods]
+    assert own == sorted(own, reverse=True)
+
+
+def test_report_is_written_as_json(tmp_path, capsys):
+    stats, _result = compiled_stats()
+    path = tmp_path / 'stats.json'
+    stats.write(str(path))
+    stats.write('-')
+    assert json.loads(path.read_text()) == json.loads(capsys.readouterr().err)
+
+
+def test_phases_cost_nothing_without_stats():
+    assert phase(None, 'lex') is NO_PHASE
+    stats = CompileStats()
+    with phase(stats, 'lex'):
+        pass
+    with phase(stats, 'lex'):
+        pass
+    assert list(stats.phases) == ['lex']
+
+
+def test_profile_call_saves_a_dump(tmp_path):
+    path = str(tmp_path / 'compile.prof')
+    result = profile_call(path, compile_source, CODE)
+    assert result.success
+    assert pstats.Stats(path).total_calls > 0
+
+
+def test_stats_from_the_command_line(tmp_path):
+    source = tmp_path / 'program.py'
+    source.write_text(CODE)
+    path = tmp_path / 'stats.json'
+    subprocess.run([sys.executable, os.path.join(COMPILER, 'main.py'), str(source), '--quiet', '--stats', str(path)],
+                   cwd=COMPILER, capture_output=True, check=True, timeout=60)
+    report = json.loads(path.read_text())
+    assert report['routines'] and report['hot_parser_methods']
+
+
+def test_stats_refuse_batches(tmp_path):
+    for name in ('a.py', 'b.py'):
+        (tmp_path / name).write_text(CODE)
+    completed = subprocess.run([sys.executable, os.path.join(COMPILER, 'main.py'), str(tmp_path), '--stats', '-'],
+                               cwd=COMPILER, capture_output=True, text=True, timeout=60)
+    assert completed.returncode == 2
+    assert '--stats and --profile work on a single file' in completed.stderr
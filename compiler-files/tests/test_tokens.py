@@ -0,0 +1,52 @@
+import pickle
+
+from lexer import LexicalAnalyzer, TokenList, TOKEN_KIND, T_IDENTIFIER, T_NUMBER
+
+CODE = "x = 10\nif x > 2:\n    name = 'héllo'\n"
+
+
+def test_stream_matches_tokenize():
+    analyzer = LexicalAnalyzer()
+    stream = analyzer.tokenize_stream(CODE)
+    assert list(stream) == list(analyzer.tokenize(CODE))
+    assert len(stream) == len(list(analyzer.tokenize(CODE)))
+
+
+def test_stream_keeps_kinds_and_spans():
+    stream = LexicalAnalyzer().tokenize_stream(CODE)
+    assert stream.kind(0) == T_IDENTIFIER and stream.value(0) == 'x'
+    assert stream.kind(2) == T_NUMBER and stream.value(2) == '10'
+    assert stream.kind(len(stream)) is None
+    assert stream.token(len(stream)) is None
+
+
+def test_values_are_decoded_from_utf8_spans():
+    stream = LexicalAnalyzer().tokenize_stream(CODE)
+    strings = [stream.value(index) for index in range(len(stream)) if stream.token(index)[0] == 'STRING']
+    assert strings == ["'héllo'"]
+
+
+def test_lines_and_columns():
+    stream = LexicalAnalyzer().tokenize_stream(CODE)
+    name = next(index for index in range(len(stream)) if stream.value(index) == 'name')
+    assert stream.line(name) == 3
+    assert stream.column(name) == 5
+    assert stream.column(0) == 1
+
+
+def test_stream_survives_pickling():
+    stream = LexicalAnalyzer().tokenize_stream(CODE)
+    stream.line(0)
+    copy = pickle.loads(pickle.dumps(stream))
+    assert list(copy) == list(stream)
+    assert copy.column(4) == stream.column(4)
+
+
+def test_token_list_has_the_same_interface():
+    tuples = list(LexicalAnalyzer().tokenize(CODE))
+    tokens = TokenList(tuples)
+    assert len(tokens) == len(tuples)
+    assert tokens.kind(0) == TOKEN_KIND['IDENTIFIER']
+    assert tokens.value(2) == '10'
+    assert tokens.line(4) == 2
+    assert tokens.token(len(tuples)) is None
@@ -0,0 +1,50 @@
+import io
+
+import pytest
+
+from lexer import LexicalAnalyzer
+from syntax import Parser
+from generator import CodeGenerator
+from tracing import Tracer, NO_TRACE
+
+CODE = "x = 1\nif x > 0:\n    print(x)\n"
+
+
+def compile_with(tracer):
+    tokens = LexicalAnalyzer(tracer=tracer).tokenize_stream(CODE)
+    ast, _success = Parser(tokens, tracer).parse()
+    CodeGenerator(tracer).generate_assembly(ast)
+
+
+def test_disabled_tracer_emits_nothing(capsys):
+    compile_with(NO_TRACE)
+    assert not (NO_TRACE.lex or NO_TRACE.parse or NO_TRACE.codegen)
+    assert capsys.readouterr().out == ''
+
+
+def test_only_the_selected_phases_print():
+    stream = io.StringIO()
+    compile_with(Tracer(['parse'], stream))
+    lines = stream.getvalue().splitlines()
+    assert lines and all(line.startswith('DEBUG: ') for line in lines)
+    assert any('Consuming token' in line for line in lines)
+    assert not any('Generating code' in line for line in lines)
+
+
+def test_hooks_receive_raw_events():
+    events = []
+    tracer = Tracer()
+    hook = lambda phase, event, data: events.append((phase, event))
+    tracer.add_hook(hook, ['lex', 'codegen'])
+    assert tracer.lex and tracer.codegen and not tracer.parse
+    compile_with(tracer)
+    assert ('lex', 'indent') in events
+    assert ('codegen', 'visit') in events
+    assert all(phase != 'parse' for phase, _event in events)
+    tracer.remove_hook(hook)
+    assert not tracer.lex
+
+
+def test_unknown_phase_is_rejected():
+    with pytest.raises(ValueError):
+        Tracer(['optimize'])
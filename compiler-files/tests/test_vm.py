@@ -0,0 +1,102 @@
+import io
+import os
+
+import pytest
+
+from bytecode import compile_program, JUMP_OPCODES
+from interpreter import TreeInterpreter
+from vm import VirtualMachine, load_program, quickened_code, LOCAL_CONST_STORE, FUSED_JUMPS
+from workloads import SHAPES, generate_program
+
+from conftest import parse_program
+
+TEST_FILES = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'test-files')
+
+
+def run_vm(code):
+    output = io.StringIO()
+    VirtualMachine(output).run(load_program(parse_program(code)))
+    return output.getvalue()
+
+
+def run_tree(code):
+    output = io.StringIO()
+    TreeInterpreter(output).run(parse_program(code))
+    return output.getvalue()
+
+
+PROGRAMS = [
+    "x = 7\ny = x * 3 - 1\nprint(x, y, x / 2, x % 3, -x, x ** 2)\n",
+    "s = 0\ni = 0\nwhile i < 10:\n    if i % 3 == 0:\n        s = s + i\n    else:\n        s -= 1\n    i += 1\nprint(s)\n",
+    "def fib(n):\n    r = n\n    if n >= 2:\n        r = fib(n - 1) + fib(n - 2)\n    return r\nprint(fib(15))\n",
+    "def largest(items):\n    best = 0\n    for item in items:\n        if item > best:\n            best = item\n    return best\nprint(largest([1, 4, 3, 2]))\n",
+    "total = 0\nfor i in range(10, 0, -2):\n    total = total * 2 + i\nprint(total)\n",
+    "flag = True\nif flag == True:\n    print('yes', 1.5)\n",
+    "names = [1, 2, 3]\nfor n in names:\n    print(n * n)\n",
+]
+
+
+@pytest.mark.parametrize('code', PROGRAMS)
+def test_vm_matches_python(run_exec, code):
+    assert run_vm(code) == run_exec(code)
+
+
+@pytest.mark.parametrize('code', PROGRAMS)
+def test_tree_interpreter_matches_python(run_exec, code):
+    assert run_tree(code) == run_exec(code)
+
+
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+@pytest.mark.parametrize('seed', range(2))
+def test_vm_matches_python_on_workloads(run_exec, shape, seed):
+    code = generate_program(shape, 60, seed=seed)
+    assert run_vm(code) == run_exec(code)
+
+
+@pytest.mark.parametrize('name', ['basicTestOne.txt', 'loopTest.txt'])
+def test_vm_matches_python_on_test_files(run_exec, name):
+    with open(os.path.join(TEST_FILES, name)) as source:
+        code = source.read()
+    assert run_vm(code) == run_exec(code)
+
+
+def test_common_sequences_are_fused():
+    program = compile_program(parse_program("def f(n):\n    i = 0\n    while i < n:\n        i = i + 1\n    return i\nprint(f(5))\n"))
+    opcodes = [opcode for opcode, _operand in quickened_code(program.functions[0])]
+    assert LOCAL_CONST_STORE in opcodes
+    assert len(opcodes) < len(program.functions[0].code) // 2
+
+
+def test_jumps_land_on_quickened_instructions():
+    # A jump target is never swallowed by a fused sequence, so every quickened
+    # jump points at an instruction of its own
+    program = compile_program(parse_program(generate_program('nested', 80)))
+    for routine in program.functions + [program.main]:
+        quickened = quickened_code(routine)
+        for opcode, operand in quickened:
+            if opcode in JUMP_OPCODES:
+                assert 0 <= operand < len(quickened)
+            elif opcode in FUSED_JUMPS:
+                assert 0 <= operand[-1] < len(quickened)
+
+
+def test_calls_do_not_use_the_python_stack():
+    code = "def down(n):\n    r = 0\n    if n > 0:\n        r = down(n - 1) + 1\n    return r\nprint(down(5000))\n"
+    assert run_vm(code) == "5000\n"
+
+
+def test_runaway_recursion_is_stopped():
+    code = "def down(n):\n    return down(n + 1)\nprint(down(0))\n"
+    with pytest.raises(RecursionError):
+        run_vm(code)
+
+
+def test_wrong_argument_count_is_a_compile_error():
+    with pytest.raises(ValueError, match='takes 1 arguments'):
+        compile_program(parse_program("def f(n):\n    return n\nprint(f(1, 2))\n"))
+
+
+def test_disassembly_names_every_routine():
+    lines = compile_program(parse_program("def f(n):\n    return n + 1\nprint(f(1))\n")).disassemble()
+    text = '\n'.join(lines)
+    assert 'f' in text and 'RETURN' in text and 'CALL' in text
@@ -0,0 +1,53 @@
+import sys
+
+PHASES = ('lex', 'parse', 'codegen')
+
+# How each event is printed when tracing is switched on for its phase.
+# Hooks receive the raw (phase, event, data) instead.
+EVENT_FORMATS = {
+    'indent': lambda data: f"DEBUG: Line {data[0]}: indent level {data[1]} -> {data[2]}",
+    'token': lambda data: f"DEBUG: Consuming token: {data}",
+    'statement': lambda data: f"DEBUG: Parsing statement of type: {data}",
+    'node': lambda data: f"DEBUG: {type(data).__name__} created: {data}",
+    'enter_block': lambda data: "DEBUG: Entering block",
+    'exit_block': lambda data: f"DEBUG: Parsed block: {data}",
+    'visit': lambda data: f"DEBUG: Generating code for {type(data).__name__}",
+    'pass': lambda data: f"DEBUG: Running pass {data}",
+}
+
+class Tracer:
+    # Each phase has a plain boolean attribute (tracer.lex, tracer.parse,
+    # tracer.codegen). Call sites test it before building any event data, so a
+    # disabled phase costs one attribute check.
+    def __init__(self, phases=(), stream=None):
+        for phase in phases:
+            if phase not in PHASES:
+                raise ValueError(f"Unknown trace phase: {phase!r} (expected one of {', '.join(PHASES)})")
+        self.printing = set(phases)
+        self.hooks = []
+        self.stream = stream
+        self.refresh()
+
+    def refresh(self):
+        for phase in PHASES:
+            enabled = phase in self.printing or any(phase in phases for _hook, phases in self.hooks)
+            setattr(self, phase, enabled)
+
+    def add_hook(self, hook, phases=PHASES):
+        # hook(phase, event, data) is called for every event of the given phases
+        self.hooks.append((hook, tuple(phases)))
+        self.refresh()
+
+    def remove_hook(self, hook):
+        self.hooks = [(registered, phases) for registered, phases in self.hooks if registered is not hook]
+        self.refresh()
+
+    def emit(self, phase, event, data=None):
+        if phase in self.printing:
+            print(EVENT_FORMATS[event](data), file=self.stream or sys.stdout)
+        for hook, phases in self.hooks:
+            if phase in phases:
+                hook(phase, event, data)
+
+# Shared tracer with every phase disabled
+NO_TRACE = Tracer()
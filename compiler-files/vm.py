@@ -0,0 +1,237 @@
+import operator
+
+from bytecode import *
+
+# Stack-based virtual machine for the bytecode in bytecode.py.
+#
+# Before running, each routine is quickened: its instructions become
+# (opcode, operand) pairs in a list, constants and jump targets are resolved,
+# and common sequences are fused into superinstructions. Reading a local,
+# applying an operator with a constant and then storing, pushing or branching
+# on the result is then one dispatch instead of four. A fused sequence never
+# swallows a jump target.
+#
+# One dispatch loop runs the whole program. Calls do not recurse in Python:
+# the caller's code, position, slots and stack height go on a frame stack and
+# the callee runs in the same loop. Everything the loop touches is in a local
+# variable, and the most frequent opcodes are tested first.
+
+# Deepest call nesting before the VM gives up, like Python's recursion limit
+MAX_CALL_DEPTH = 10000
+
+BINARY_FUNCTIONS = {
+    ADD: operator.add, SUB: operator.sub, MUL: operator.mul, DIV: operator.truediv,
+    MOD: operator.mod, POW: operator.pow,
+    LT: operator.lt, GT: operator.gt, LE: operator.le, GE: operator.ge, EQ: operator.eq, NE: operator.ne,
+}
+
+# Superinstructions, numbered after the bytecode's own opcodes. The operand is
+# a tuple: the operator function, then the local slot and/or constant it
+# applies to, then the slot to store to or the jump target if any.
+SUPERINSTRUCTION_NAMES = (
+    'LOCAL_CONST', 'LOCAL_CONST_STORE', 'LOCAL_CONST_JUMP_IF_TRUE', 'LOCAL_CONST_JUMP_IF_FALSE',
+    'CONST_BINARY', 'CONST_JUMP_IF_TRUE', 'CONST_JUMP_IF_FALSE', 'LOCAL_BINARY',
+)
+(LOCAL_CONST, LOCAL_CONST_STORE, LOCAL_CONST_JUMP_IF_TRUE, LOCAL_CONST_JUMP_IF_FALSE,
+ CONST_BINARY, CONST_JUMP_IF_TRUE, CONST_JUMP_IF_FALSE, LOCAL_BINARY) = range(
+    len(OPCODE_NAMES), len(OPCODE_NAMES) + len(SUPERINSTRUCTION_NAMES))
+# Superinstructions whose operand ends in a jump target
+FUSED_JUMPS = frozenset((LOCAL_CONST_JUMP_IF_TRUE, LOCAL_CONST_JUMP_IF_FALSE, CONST_JUMP_IF_TRUE, CONST_JUMP_IF_FALSE))
+# What a fused sequence becomes, by the instruction that consumes its result
+LOCAL_CONST_ENDINGS = {STORE_LOCAL: LOCAL_CONST_STORE, JUMP_IF_TRUE: LOCAL_CONST_JUMP_IF_TRUE, JUMP_IF_FALSE: LOCAL_CONST_JUMP_IF_FALSE}
+CONST_ENDINGS = {JUMP_IF_TRUE: CONST_JUMP_IF_TRUE, JUMP_IF_FALSE: CONST_JUMP_IF_FALSE}
+
+
+def fuse(instructions, index, targets, constants):
+    # The quickened instruction starting at index and how many it replaces
+    opcode, operand = instructions[index]
+
+    def following(offset):
+        position = index + offset
+        if position < len(instructions) and position not in targets:
+            return instructions[position]
+        return None, None
+
+    if opcode == LOAD_LOCAL and following(1)[0] == LOAD_CONST and following(2)[0] in BINARY_FUNCTIONS:
+        function = BINARY_FUNCTIONS[following(2)[0]]
+        value = constants[following(1)[1]]
+        ending, argument = following(3)
+        if ending in LOCAL_CONST_ENDINGS:
+            return (LOCAL_CONST_ENDINGS[ending], (function, operand, value, argument)), 4
+        return (LOCAL_CONST, (function, operand, value)), 3
+    if opcode == LOAD_CONST and following(1)[0] in BINARY_FUNCTIONS:
+        function = BINARY_FUNCTIONS[following(1)[0]]
+        ending, argument = following(2)
+        if ending in CONST_ENDINGS:
+            return (CONST_ENDINGS[ending], (function, constants[operand], argument)), 3
+        return (CONST_BINARY, (function, constants[operand])), 2
+    if opcode == LOAD_LOCAL and following(1)[0] in BINARY_FUNCTIONS:
+        return (LOCAL_BINARY, (BINARY_FUNCTIONS[following(1)[0]], operand)), 2
+    if opcode == LOAD_CONST:
+        return (LOAD_CONST, constants[operand]), 1
+    return (opcode, operand), 1
+
+
+def quicken(routine):
+    if routine.quickened is None:
+        routine.quickened = quickened_code(routine)
+    return routine.quickened
+
+
+def quickened_code(routine):
+    code = routine.code
+    instructions = [(code[offset], code[offset + 1]) for offset in range(0, len(code), 2)]
+    targets = {operand // 2 for opcode, operand in instructions if opcode in JUMP_OPCODES}
+    quickened = []
+    position = {}  # Instruction index -> index of the quickened instruction
+    index = 0
+    while index < len(instructions):
+        position[index] = len(quickened)
+        instruction, length = fuse(instructions, index, targets, routine.constants)
+        quickened.append(instruction)
+        index += length
+    for index, (opcode, operand) in enumerate(quickened):
+        if opcode in JUMP_OPCODES:
+            quickened[index] = (opcode, position[operand // 2])
+        elif opcode in FUSED_JUMPS:
+            quickened[index] = (opcode, operand[:-1] + (position[operand[-1] // 2],))
+    return quickened
+
+
+class VirtualMachine:
+    def __init__(self, stream=None):
+        self.stream = stream  # Where print writes; None means sys.stdout at the time of the call
+
+    def run(self, program):
+        functions = [quicken(function) for function in program.functions]
+        parameter_counts = [len(function.parameters) for function in program.functions]
+        padding = [[None] * (len(function.slots) - len(function.parameters)) for function in program.functions]
+        globals_ = [None] * len(program.main.slots)
+        stream = self.stream
+
+        frames = []
+        code = quicken(program.main)
+        slots = globals_
+        base = 0
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        while True:
+            opcode, operand = code[pc]
+            pc += 1
+            if opcode == LOAD_LOCAL:
+                push(slots[operand])
+            elif opcode == LOCAL_CONST_STORE:
+                function, slot, value, destination = operand
+                slots[destination] = function(slots[slot], value)
+            elif opcode == LOCAL_CONST_JUMP_IF_TRUE:
+                function, slot, value, target = operand
+                if function(slots[slot], value):
+                    pc = target
+            elif opcode == LOCAL_CONST_JUMP_IF_FALSE:
+                function, slot, value, target = operand
+                if not function(slots[slot], value):
+                    pc = target
+            elif opcode == STORE_LOCAL:
+                slots[operand] = pop()
+            elif opcode == LOAD_CONST:
+                push(operand)
+            elif opcode == LOCAL_CONST:
+                function, slot, value = operand
+                push(function(slots[slot], value))
+            elif opcode == CONST_BINARY:
+                stack[-1] = operand[0](stack[-1], operand[1])
+            elif opcode == LOCAL_BINARY:
+                stack[-1] = operand[0](stack[-1], slots[operand[1]])
+            elif opcode == JUMP:
+                pc = operand
+            elif opcode == FOR_ITER:
+                # A for statement takes one item from the iterator without a call to next()
+                for value in stack[-1]:
+                    push(value)
+                    break
+                else:
+                    pop()
+                    pc = operand
+            elif opcode == CONST_JUMP_IF_TRUE:
+                function, value, target = operand
+                if function(pop(), value):
+                    pc = target
+            elif opcode == CONST_JUMP_IF_FALSE:
+                function, value, target = operand
+                if not function(pop(), value):
+                    pc = target
+            elif opcode == LOAD_GLOBAL:
+                push(globals_[operand])
+            elif opcode == JUMP_IF_TRUE:
+                if pop():
+                    pc = operand
+            elif opcode == JUMP_IF_FALSE:
+                if not pop():
+                    pc = operand
+            elif opcode == ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif opcode == SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif opcode == MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif opcode == CALL:
+                if len(frames) >= MAX_CALL_DEPTH:
+                    raise RecursionError("maximum call depth exceeded in the VM")
+                count = parameter_counts[operand]
+                if count:
+                    arguments = stack[-count:]
+                    del stack[-count:]
+                else:
+                    arguments = []
+                arguments.extend(padding[operand])
+                frames.append((code, pc, slots, base))
+                code = functions[operand]
+                slots = arguments
+                base = len(stack)
+                pc = 0
+            elif opcode == RETURN:
+                if not frames:
+                    return
+                if len(stack) > base + 1:
+                    # Returning from inside a for loop leaves its iterator below the result
+                    result = pop()
+                    del stack[base:]
+                    push(result)
+                code, pc, slots, base = frames.pop()
+            elif opcode in BINARY_FUNCTIONS:
+                right = pop()
+                stack[-1] = BINARY_FUNCTIONS[opcode](stack[-1], right)
+            elif opcode == NEG:
+                stack[-1] = -stack[-1]
+            elif opcode == PRINT:
+                if operand == 1:
+                    print(pop(), file=stream)
+                else:
+                    values = stack[len(stack) - operand:]
+                    del stack[len(stack) - operand:]
+                    print(*values, file=stream)
+            elif opcode == GET_ITER:
+                stack[-1] = iter(stack[-1])
+            elif opcode == RANGE:
+                arguments = stack[len(stack) - operand:]
+                del stack[len(stack) - operand:]
+                push(range(*arguments))
+            elif opcode == BUILD_LIST:
+                values = stack[len(stack) - operand:]
+                del stack[len(stack) - operand:]
+                push(values)
+            else:
+                raise ValueError(f"Unknown opcode {opcode} at {pc - 1}")
+
+
+def load_program(ast):
+    # Compile and quicken every routine, so run() starts executing at once
+    program = compile_program(ast)
+    for routine in program.functions + [program.main]:
+        quicken(routine)
+    return program
@@ -0,0 +1,147 @@
+import random
+
+# Seeded generator of valid source programs for benchmarking the compiler.
+#
+# Every shape stresses a different part of the front end and backend: deep
+# nesting, long expressions, many small functions, or a long flat script.
+# size is the number of statements to generate; the same shape, size and seed
+# always give the same program. Programs only use what Parser accepts, read
+# variables after assigning them and keep loops short and values small, so
+# they also run quickly under exec.
+
+# Variables every program starts by assigning
+VARIABLES = tuple(f"v{index}" for index in range(8))
+# Levels of nesting in one chain of the nested shape
+NEST_DEPTH = 16
+# Operands in each expression of the expressions shape
+EXPRESSION_TERMS = 64
+# Statements in the body of each function of the functions shape
+FUNCTION_BODY = 6
+OPERATORS = ('+', '-', '*')
+COMPARISONS = ('<', '>', '<=', '>=', '==', '!=')
+
+
+class ProgramBuilder:
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.lines = []
+        self.counter = 0
+
+    def line(self, indent, text):
+        self.lines.append('    ' * indent + text)
+
+    def fresh(self, prefix):
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def operand(self, names):
+        if self.random.random() < 0.6:
+            return self.random.choice(names)
+        return str(self.random.randint(0, 99))
+
+    def expression(self, names, terms):
+        parts = [self.operand(names)]
+        for _ in range(terms - 1):
+            operand = self.operand(names)
+            if self.random.random() < 0.15:
+                operand = f"({operand} % {self.random.randint(2, 9)})"
+            parts.append(f"{self.random.choice(OPERATORS)} {operand}")
+        return ' '.join(parts)
+
+    def condition(self, names):
+        return f"{self.expression(names, 2)} {self.random.choice(COMPARISONS)} {self.operand(names)}"
+
+    def simple_statement(self, indent, names):
+        choice = self.random.random()
+        target = self.random.choice(VARIABLES)
+        if choice < 0.6:
+            self.line(indent, f"{target} = ({self.expression(names, self.random.randint(1, 4))}) % 1000")
+        elif choice < 0.8:
+            self.line(indent, f"{target} {self.random.choice(('+=', '-='))} {self.operand(names)}")
+        else:
+            self.line(indent, f"print({self.expression(names, 2)})")
+
+    def source(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def initialize(builder):
+    for name in VARIABLES:
+        builder.line(0, f"{name} = {builder.random.randint(0, 9)}")
+
+
+def nested_program(builder, size):
+    # Chains of if, while and for statements inside each other, each level
+    # holding one simple statement
+    count = 0
+    while count < size:
+        depth = 0
+        while depth < NEST_DEPTH and count < size:
+            kind = builder.random.random()
+            if kind < 0.5:
+                builder.line(depth, f"if {builder.condition(VARIABLES)}:")
+            elif kind < 0.75:
+                counter = builder.fresh('w')
+                builder.line(depth, f"{counter} = 0")
+                builder.line(depth, f"while {counter} < 1:")
+                builder.line(depth + 1, f"{counter} += 1")
+            else:
+                builder.line(depth, f"for {builder.fresh('i')} in range(1):")
+            depth += 1
+            builder.simple_statement(depth, VARIABLES)
+            count += 2
+
+
+def expressions_program(builder, size):
+    for _ in range(size):
+        builder.line(0, f"{builder.random.choice(VARIABLES)} = ({builder.expression(VARIABLES, EXPRESSION_TERMS)}) % 1000")
+
+
+def functions_program(builder, size):
+    # Small functions that call the ones defined before them, then top-level
+    # code calling each of them
+    functions = []
+    for _ in range(max(1, size // FUNCTION_BODY)):
+        name = builder.fresh('f')
+        parameters = [f"p{index}" for index in range(builder.random.randint(1, 3))]
+        builder.line(0, f"def {name}({', '.join(parameters)}):")
+        names = list(parameters)
+        for _ in range(FUNCTION_BODY - 1):
+            local = builder.fresh('t')
+            value = builder.expression(names, builder.random.randint(1, 4))
+            if functions and builder.random.random() < 0.3:
+                callee, arity = builder.random.choice(functions)
+                arguments = ', '.join(builder.operand(names) for _ in range(arity))
+                value = f"{callee}({arguments}) + {value}"
+            builder.line(1, f"{local} = ({value}) % 1000")
+            names.append(local)
+        builder.line(1, f"return ({builder.expression(names, 3)}) % 1000")
+        builder.line(0, '')
+        functions.append((name, len(parameters)))
+    initialize(builder)
+    for name, arity in functions:
+        arguments = ', '.join(builder.operand(VARIABLES) for _ in range(arity))
+        builder.line(0, f"{builder.random.choice(VARIABLES)} = {name}({arguments})")
+
+
+def flat_program(builder, size):
+    for _ in range(size):
+        builder.simple_statement(0, VARIABLES)
+
+
+SHAPES = {
+    'nested': nested_program,
+    'expressions': expressions_program,
+    'functions': functions_program,
+    'flat': flat_program,
+}
+
+
+def generate_program(shape, size, seed=0):
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown program shape: {shape!r} (expected one of {', '.join(SHAPES)})")
+    builder = ProgramBuilder(seed)
+    if shape != 'functions':
+        initialize(builder)
+    SHAPES[shape](builder, size)
+    return builder.source()